@@ -1,26 +1,280 @@
 
+import sys
 import argparse
 
-from src.main        import run
+from src.main                import run, train, detect, stream, serve, score, calibrate, update
+from src.engine              import BACKENDS
+from src.ids                 import IDS
+from src.datasets.quantiles  import QUANTILES
+from src.scores              import CALIBRATIONS
+from src.instrument          import INSTRUMENTS, set_progress
 from pathlib         import Path
 
+ALGOS    = [ 'Smith-Waterman', 'Gotoh' ]
+COMMANDS = [ 'analyze', 'train', 'detect', 'stream', 'serve', 'score', 'calibrate', 'update' ]
+
+def add_scoring_args(parser, default='pairwise'):
+    parser.add_argument('--scoring',    '-s',   choices=IDS.SCORINGS, default=default,
+                        help="Align each packet separately, score whole shards with a batched aligner " +
+                             "or, with 'bounded', stop aligning a packet once its verdict is certain.")
+    parser.add_argument('--band',               type=int,   required=False, default=None,
+                        help="Diagonal band width of the 'bounded' scoring. (Unbanded by default)")
+
+def add_encoding_args(parser):
+    parser.add_argument('--dna_cache',          type=Path,  required=False, default=None,
+                        help="Directory of the encoded DNA cache. Records encoded before are not encoded again.")
+    parser.add_argument('--encoding',           choices=IDS.ENCODINGS, default='letters',
+                        help="Encode records of batched scoring into DNA letters or into integer codes of letters " +
+                             "(numbers are formatted without strings).")
+    parser.add_argument('--csv_cache',          type=Path,  required=False, default=None,
+                        help="Directory of the parsed CSV cache. Datasets parsed before are loaded from binary columns.")
+
+def add_signature_args(parser):
+    parser.add_argument('--signatures',         type=int,   default=1,
+                        help="Cluster train records into this many signatures, each with its own ideal sequence & threshold.")
+    parser.add_argument('--candidates',         type=int,   default=2,
+                        help="Align a packet only with this many signatures which are the closest to it by k-mers.")
+
+def add_fieldwise_args(parser):
+    parser.add_argument('--fieldwise',          action='store_true',
+                        help="Align each field of a packet with the same field of the ideal record and combine weighted scores.")
+    parser.add_argument('--field_weights',      type=str,   nargs='+', default=[], metavar='FIELD=WEIGHT',
+                        help="Weights of field scores of --fieldwise. (1 for fields which are not listed)")
+    parser.add_argument('--field_votes',        type=int,   default=0,
+                        help="A packet of --fieldwise is an attack if at least this many weighted fields score less than " +
+                             "their thresholds. (0 - compare the combined score with the combined threshold)")
+
+def field_weights(args) -> dict:
+    """Weights of --field_weights or None if alignment is not field-wise."""
+    if not args.fieldwise:
+        return None
+    weights = {}
+    for item in args.field_weights:
+        field, _, weight = item.rpartition('=')
+        if not field:
+            raise Exception(f"Field weight must be FIELD=WEIGHT: {item}")
+        weights[field] = float(weight)
+    return weights
+
+def add_prefilter_args(parser, audit=True):
+    parser.add_argument('--prefilter',          type=float, nargs='?', const=0.01, default=None,
+                        help="Decide packets which are clearly normal or clearly anomalous by k-mers without alignment. " +
+                             "The value is the share of wrong verdicts allowed on train records. (0.01 by default) " +
+                             "It limits disagreement with exact verdicts on train records only, not the accuracy loss on test packets.")
+    parser.add_argument('--prefilter_margin',   type=float, default=0.05,
+                        help="Similarity each bound of the prefilter band is moved outwards after calibration on train records.")
+    if audit:
+        parser.add_argument('--prefilter_audit',    action='store_true',
+                            help="Also align packets decided by the prefilter to report the accuracy change.")
+
+def add_score_cache_args(parser):
+    parser.add_argument('--score_cache',        type=int,   nargs='?', const=100000, default=None,
+                        help="Keep alignment scores of this many distinct packets, repeated packets are not aligned again. " +
+                             "(100000 by default)")
+
+def add_instrument_args(parser):
+    parser.add_argument('--instrument',         type=Path,  nargs='?', const=Path('instrumentation.json'), default=None,
+                        help="Time stages & count records, write results as JSON. (instrumentation.json by default)")
+    parser.add_argument('--cprofile',           action='store_true', help="Add cProfile statistics to the instrumentation.")
+    parser.add_argument('--tracemalloc',        action='store_true', help="Add tracemalloc statistics to the instrumentation.")
+    parser.add_argument('--no_progress',        action='store_true', help="Do not show progress bars.")
+
+def add_stream_args(parser):
+    parser.add_argument('--input',              type=str,   default='-',
+                        help="Path to *.csv stream with a header line or '-' for stdin.")
+    parser.add_argument('--follow',     '-f',   action='store_true',
+                        help="Wait for new packets at the end of the input file. (Like 'tail -f')")
+    parser.add_argument('--chunk_size',         type=int,   default=1000,
+                        help="Number of packets which are encoded and classified at once.")
+    parser.add_argument('--output',     '-o',   type=Path,  default=None,
+                        help="Path to *.csv file with per-packet verdicts. (stdout by default)")
+    parser.add_argument('--report_every',       type=int,   default=10000,
+                        help="Print throughput & rolling metrics to stderr every N packets.")
+
 def main():
 
     parser = argparse.ArgumentParser(description="DNA Intrusion Detection System")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help="Train & test IDS on datasets. (Default command)")
+    analyze.add_argument('--train_dataset',      type=Path,  required=True, help="Path to test dataset. [*.csv]",  default=None)
+    analyze.add_argument('--test_dataset',       type=Path,  required=False, help="Path to train dataset. [*.csv]", default=None)
+    analyze.add_argument('--codetable',  '-c',   type=Path,  required=True,
+                         help="Path to codetable. (Using for encoding dataset records in DNA sequences. [*.json])")
+    analyze.add_argument('--backend',    '-b',   choices=BACKENDS, default='thread',
+                         help="Execution backend of training and testing.")
+    add_scoring_args(analyze)
+    add_instrument_args(analyze)
+    add_encoding_args(analyze)
+    add_signature_args(analyze)
+    add_prefilter_args(analyze)
+    add_score_cache_args(analyze)
+    add_fieldwise_args(analyze)
+    analyze.add_argument('--curves',             type=Path,  required=False, default=None,
+                         help="Also save metrics of every threshold (ROC & PR curves) of IDS trained on the whole train dataset. [*.csv]")
+
+    training = commands.add_parser('train', help="Train IDS on a dataset and save the model.")
+    training.add_argument('--train_dataset',    type=Path,  required=True, help="Path to train dataset. [*.csv]")
+    training.add_argument('--codetable',  '-c', type=Path,  required=True,
+                          help="Path to codetable. (Using for encoding dataset records in DNA sequences. [*.json])")
+    training.add_argument('--out',              type=Path,  required=True, help="Directory of the model.")
+    training.add_argument('--algo',             choices=ALGOS, default='Smith-Waterman', help="Alignment algorithm.")
+    training.add_argument('--backend',    '-b', choices=BACKENDS, default='thread',
+                          help="Execution backend of training.")
+    add_scoring_args(training)
+    add_instrument_args(training)
+    add_encoding_args(training)
+    add_signature_args(training)
+    add_prefilter_args(training, audit=False)
+    add_fieldwise_args(training)
+    training.add_argument('--chunk_size',       type=int,   default=None,
+                          help="Read the train dataset by chunks of this many records, it is never loaded at once. " +
+                               "(Whole dataset by default)")
+    training.add_argument('--median',           choices=QUANTILES, default='exact',
+                          help="Medians of chunked training: exact ones (memory grows with distinct values) " +
+                               "or t-digest estimates in bounded memory.")
+    training.add_argument('--compression',      type=int,   default=100,
+                          help="Compression of t-digest: about this many centroids are kept for each field.")
+    training.add_argument('--save_scores',      action='store_true',
+                          help="Also save alignment scores of train records with the model, see 'calibrate'.")
+
+    detection = commands.add_parser('detect', help="Classify packets of a CSV stream with a saved model.")
+    detection.add_argument('--model',     '-m', type=Path,  required=True, help="Directory of the model. (See 'train')")
+    detection.add_argument('--codetable', '-c', type=Path,  required=True,
+                           help="Path to codetable. (Must be the one the model was trained with. [*.json])")
+    add_stream_args(detection)
+    add_scoring_args(detection, default=None)
+    add_score_cache_args(detection)
+    add_instrument_args(detection)
+
+    online = commands.add_parser('stream', help="Classify packets of a CSV stream with a trained ideal sequence.")
+    online.add_argument('--ideal_sequence', '-i', type=Path, required=True,
+                        help="Directory with trained ideal sequence. (See IdealSequence.dump())")
+    online.add_argument('--codetable',  '-c',   type=Path,  required=True,
+                        help="Path to codetable. (Must be the one the ideal sequence was trained with. [*.json])")
+    online.add_argument('--algo',               choices=ALGOS, default='Smith-Waterman',
+                        help="Alignment algorithm the ideal sequence was trained with.")
+    add_stream_args(online)
+    add_scoring_args(online)
+    add_score_cache_args(online)
+    add_instrument_args(online)
+
+    service = commands.add_parser('serve', help="Classify packets received over a local socket, send verdicts back.")
+    trained = service.add_mutually_exclusive_group(required=True)
+    trained.add_argument('--model',       '-m', type=Path,  help="Directory of the model. (See 'train')")
+    trained.add_argument('--ideal_sequence', '-i', type=Path, help="Directory with trained ideal sequence. (See IdealSequence.dump())")
+    service.add_argument('--codetable',   '-c', type=Path,  required=True,
+                         help="Path to codetable. (Must be the one the model was trained with. [*.json])")
+    service.add_argument('--algo',              choices=ALGOS, default='Smith-Waterman',
+                         help="Alignment algorithm the ideal sequence was trained with. (Not used with --model)")
+    service.add_argument('--host',              type=str,   default='127.0.0.1', help="Host of the TCP socket.")
+    service.add_argument('--port',        '-p', type=int,   default=9999,        help="Port of the TCP socket.")
+    service.add_argument('--unix',              type=Path,  default=None,        help="Listen on this Unix socket instead of TCP.")
+    service.add_argument('--batch_size',        type=int,   default=256,
+                         help="The largest micro-batch of records which are classified at once.")
+    service.add_argument('--max_delay',         type=float, default=0.005,
+                         help="Seconds the first record of a micro-batch waits for other ones.")
+    service.add_argument('--queue_size',        type=int,   default=4096,
+                         help="Records waiting for classification (and verdicts of a connection) before reading stops.")
+    service.add_argument('--workers',           type=int,   default=2,     help="Threads which classify micro-batches.")
+    service.add_argument('--report_every',      type=float, default=10.,
+                         help="Print throughput, p50/p99 latency & metrics to stderr every N seconds.")
+    add_scoring_args(service, default=None)
+    add_score_cache_args(service)
+    add_instrument_args(service)
+
+    vectors = commands.add_parser('score', help="Save alignment scores of dataset records with a saved model.")
+    vectors.add_argument('--model',       '-m', type=Path,  required=True, help="Directory of the model. (See 'train')")
+    vectors.add_argument('--codetable',   '-c', type=Path,  required=True,
+                         help="Path to codetable. (Must be the one the model was trained with. [*.json])")
+    vectors.add_argument('--dataset',           type=Path,  required=True, help="Path to dataset. [*.csv]")
+    vectors.add_argument('--out',               type=Path,  required=True, help="Path to scores of records. [*.npy]")
+    vectors.add_argument('--label',             choices=[ 'attack', 'normal' ], default=None,
+                         help="Label of all records of the dataset. (The label column of the dataset by default)")
+    vectors.add_argument('--backend',     '-b', choices=BACKENDS, default='thread', help="Execution backend of alignment.")
+    vectors.add_argument('--csv_cache',         type=Path,  required=False, default=None,
+                         help="Directory of the parsed CSV cache. Datasets parsed before are loaded from binary columns.")
+    add_instrument_args(vectors)
+
+    calibration = commands.add_parser('calibrate', help="Choose the threshold of a model from saved scores of train records.")
+    calibration.add_argument('--model',   '-m', type=Path,  required=True,
+                             help="Directory of the model trained with --save_scores. (See 'train')")
+    calibration.add_argument('--method',        choices=CALIBRATIONS, default='mean',
+                             help="Mean score of train records, a percentile of their scores " +
+                                  "or the threshold of a target false positive rate on them.")
+    calibration.add_argument('--value',         type=float, default=None,
+                             help="Percentile (0 - 100) or false positive rate (0 - 1) of the method.")
+    calibration.add_argument('--test_scores',   type=Path,  default=None,
+                             help="Show metrics of the threshold on scores of labeled records. (See 'score' [*.npy])")
+    calibration.add_argument('--write',         action='store_true', help="Save the threshold into the model.")
+    add_instrument_args(calibration)
+
+    updating = commands.add_parser('update', help="Continue training of a saved model with new records of normal activity.")
+    updating.add_argument('--model',      '-m', type=Path,  required=True, help="Directory of the model. (See 'train')")
+    updating.add_argument('--codetable',  '-c', type=Path,  required=True,
+                          help="Path to codetable. (Must be the one the model was trained with. [*.json])")
+    updating.add_argument('--dataset',          type=Path,  required=True, help="Path to new train records. [*.csv]")
+    updating.add_argument('--history',          type=Path,  default=None,
+                          help="Path to all train records, the new ones included. It is read by chunks only if new records " +
+                               "change the ideal sequence and all records must be aligned again. [*.csv]")
+    updating.add_argument('--chunk_size',       type=int,   default=10000, help="Number of records in a chunk of --history.")
+    updating.add_argument('--median_tolerance', type=float, default=0.,
+                          help="Keep the ideal sequence while each new median differs from the one it was made of by at most " +
+                               "this share of it, so --history is not aligned again. (0 - follow the medians exactly)")
+    updating.add_argument('--backend',    '-b', choices=BACKENDS, default='thread', help="Execution backend of alignment.")
+    updating.add_argument('--csv_cache',        type=Path,  required=False, default=None,
+                          help="Directory of the parsed CSV cache. Datasets parsed before are loaded from binary columns.")
+    add_instrument_args(updating)
+
+    # Keep the old invocation without command working: run.py --train_dataset ...
+    argv = sys.argv[1:]
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = [ 'analyze' ] + argv
+
+    args = parser.parse_args(argv)
+
+    set_progress(not args.no_progress)
+    if args.instrument or args.cprofile or args.tracemalloc:
+        INSTRUMENTS.enable(cprofile=args.cprofile, tracemalloc=args.tracemalloc)
 
-    parser.add_argument('--train_dataset',      type=Path,  required=True, help="Path to test dataset. [*.csv]",  default=None)
-    parser.add_argument('--test_dataset',       type=Path,  required=False, help="Path to train dataset. [*.csv]", default=None)     
-    parser.add_argument('--codetable',  '-c',   type=Path,  required=True,
-                        help="Path to codetable. (Using for encoding dataset records in DNA sequences. [*.json])")
+    with INSTRUMENTS.session():
+        execute(args)
 
-    args = parser.parse_args()
+    if INSTRUMENTS.enabled:
+        INSTRUMENTS.dump(args.instrument or Path('instrumentation.json'))
 
-    TRAIN_DS   = args.train_dataset
-    TEST_DS    = args.test_dataset
-    CODETABLE  = args.codetable
+def execute(args):
+    if args.command == 'analyze':
+        TRAIN_DS   = args.train_dataset
+        TEST_DS    = args.test_dataset
+        CODETABLE  = args.codetable
 
-    # Execute the main IDS function
-    run(TRAIN_DS, TEST_DS, CODETABLE)
+        # Execute the main IDS function
+        run(TRAIN_DS, TEST_DS, CODETABLE, args.backend, args.scoring, args.band, args.dna_cache, args.encoding,
+            args.csv_cache, args.signatures, args.candidates, args.prefilter, args.prefilter_audit, args.score_cache,
+            field_weights(args), args.curves, args.field_votes, args.prefilter_margin)
+    elif args.command == 'train':
+        train(args.train_dataset, args.codetable, args.out, args.algo, args.backend, args.scoring, args.band,
+              args.dna_cache, args.encoding, args.csv_cache, args.signatures, args.candidates, args.prefilter,
+              field_weights(args), args.chunk_size, args.median, args.compression, args.save_scores, args.field_votes,
+              args.prefilter_margin)
+    elif args.command == 'detect':
+        detect(args.model, args.codetable, args.input, args.output, args.chunk_size, args.follow,
+               args.scoring, args.band, args.report_every, args.score_cache)
+    elif args.command == 'stream':
+        stream(args.ideal_sequence, args.codetable, args.input, args.output, args.chunk_size, args.follow,
+               args.algo, args.scoring, args.band, args.report_every, args.score_cache)
+    elif args.command == 'serve':
+        serve(args.model, args.codetable, args.host, args.port, args.unix, args.batch_size, args.max_delay,
+              args.queue_size, args.workers, args.report_every, args.score_cache, args.ideal_sequence, args.algo,
+              args.scoring, args.band)
+    elif args.command == 'score':
+        score(args.model, args.codetable, args.dataset, args.out, args.label, args.backend, args.csv_cache)
+    elif args.command == 'calibrate':
+        calibrate(args.model, args.method, args.value, args.test_scores, args.write)
+    elif args.command == 'update':
+        update(args.model, args.codetable, args.dataset, args.history, args.chunk_size, args.backend, args.csv_cache,
+               args.median_tolerance)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
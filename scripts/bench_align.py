@@ -0,0 +1,67 @@
+"""
+    This script is using to compare per-packet PairwiseAligner scoring with the batched
+    one-vs-many scorer for each alignment algorithm of IDS.Aligner.
+
+    Parameters:
+        @dataset:   path to *.csv dataset
+        @codetable: path to codetable used for encoding
+        @rows:      number of rows taken from the head of the dataset (all by default)
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of batched alignment scoring.")
+parser.add_argument("--dataset",   "-d", type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--rows",      "-r", type=int,  default=None)
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.batch_align            import BatchScorer
+from src.ids                    import IDS
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    DATASET   = CSV_Dataset.from_file(args.dataset)
+    DATASET   = CSV_Dataset(DATASET.head(args.rows)) if args.rows else DATASET
+    CODETABLE = JSON_Codetable(args.codetable)
+
+    query     = str(DATASET.get_median().encode_into_DNA(CODETABLE).seq)
+    sequences = DATASET.as_DNA_strings(CODETABLE).tolist()
+
+    for algo in [ 'Smith-Waterman', 'Gotoh' ]:
+        aligner = IDS.Aligner(algo)
+
+        start    = perf_counter()
+        pairwise = [ aligner.score(query, seq) for seq in sequences ]
+        pairwise_time = perf_counter() - start
+
+        start    = perf_counter()
+        batched  = BatchScorer(aligner, query).score(sequences)
+        batch_time = perf_counter() - start
+
+        if list(batched) != pairwise:
+            mismatches = sum(1 for a, b in zip(batched, pairwise) if a != b)
+            raise Exception(f"{algo}: batched scores differ from PairwiseAligner in {mismatches} records")
+
+        print(f"{algo}: {len(sequences)} packets, pairwise {pairwise_time:.3f} s, "
+              f"batched {batch_time:.3f} s, speedup {pairwise_time / batch_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+    This script is using to measure how IDS training & testing scale with the number of cores
+    on each execution backend.
+
+    Parameters:
+        @train:     path to train *.csv dataset
+        @test:      path to test *.csv dataset (only attack records)
+        @codetable: path to codetable used for encoding
+        @backends:  execution backends to measure
+        @cores:     maximal number of cores, each of 1..N is measured
+        @rows:      number of rows taken from the head of each dataset
+
+    Artifacts:
+        This script prints a table with train/test wall time and speedup for each (backend, cores).
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import multiprocessing as mp
+import pandas as pd
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.engine                 import BACKENDS
+from src.ids                    import IDS
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Scaling benchmark of IDS execution backends.")
+parser.add_argument("--train",     type=Path, required=True)
+parser.add_argument("--test",      type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--backends",  "-b", nargs="+", choices=BACKENDS, default=BACKENDS)
+parser.add_argument("--cores",     "-n", type=int, default=mp.cpu_count())
+parser.add_argument("--rows",      "-r", type=int, default=2000)
+
+def timed(func, *func_args, **func_kwargs) -> tuple:
+    start  = perf_counter()
+    result = func(*func_args, **func_kwargs)
+    return perf_counter() - start, result
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+
+    ids, report, reference = IDS(CODETABLE, IDS.Aligner()), [], {}
+
+    for backend in args.backends:
+        # Serial backend always uses a single core
+        for cores in ([1] if backend == 'serial' else range(1, args.cores + 1)):
+            train_time, ideal_seq = timed(ids.train, TRAIN_DS, proc_num=cores, backend=backend)
+            test_time,  metrics   = timed(ids.test,  TEST_DS,  proc_num=cores, backend=backend)
+
+            result = (ideal_seq.threshold, metrics.true_pos, metrics.true_negative, metrics.false_pos, metrics.false_negative)
+            # Results depend on partitioning, so they are compared for the same number of cores only
+            if reference.setdefault(cores, result) != result:
+                raise Exception(f"Backend '{backend}' with {cores} cores gave different result: {result} != {reference[cores]}")
+
+            report.append({ "Backend" : backend, "Cores" : cores,
+                            "Train time, s" : train_time, "Test time, s" : test_time })
+
+    report = pd.DataFrame(report)
+    base   = report.groupby("Backend")[["Train time, s", "Test time, s"]].transform("first")
+    report["Train speedup"] = base["Train time, s"] / report["Train time, s"]
+    report["Test speedup"]  = base["Test time, s"]  / report["Test time, s"]
+    print(report.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
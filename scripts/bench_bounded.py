@@ -0,0 +1,82 @@
+"""
+    This script is using to compare exact threshold classification with the bounded one
+    (early termination, optionally restricted to a diagonal band) for each alignment algorithm.
+
+    The ideal sequence is the median of the first @train rows and the threshold is the mean
+    alignment score of these rows, as IDS.train() does. Then all rows are classified.
+
+    Parameters:
+        @dataset:   path to *.csv dataset
+        @codetable: path to codetable used for encoding
+        @train:     number of rows used to obtain the ideal sequence & threshold
+        @bands:     band widths to measure ('none' - unbanded early termination)
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy as np
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of bounded (early termination & banded) classification.")
+parser.add_argument("--dataset",   "-d", type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--train",     "-t", type=int,  default=2000)
+parser.add_argument("--bands",     "-b", nargs="+", default=["none", "16", "8", "4", "2"])
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.batch_align            import BatchScorer
+from src.ids                    import IDS
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    DATASET   = CSV_Dataset.from_file(args.dataset)
+    # Last column is the label, it is not encoded
+    DATASET['label'] = 'normal'
+    CODETABLE = JSON_Codetable(args.codetable)
+
+    train_ds  = CSV_Dataset(DATASET.head(args.train))
+    query     = str(train_ds.get_median().encode_into_DNA(CODETABLE).seq)
+    sequences = DATASET.as_DNA_strings(CODETABLE).tolist()
+
+    for algo in [ 'Smith-Waterman', 'Gotoh' ]:
+        aligner   = IDS.Aligner(algo)
+        scorer    = BatchScorer(aligner, query)
+        threshold = float(scorer.score(sequences[: args.train]).mean())
+
+        start = perf_counter()
+        exact = np.array([ aligner.score(query, seq) for seq in sequences ]) < threshold
+        exact_time = perf_counter() - start
+
+        start = perf_counter()
+        scorer.score(sequences)
+        batch_time = perf_counter() - start
+
+        print(f"{algo}: {len(sequences)} packets, threshold {threshold:.3f}, {exact.mean():.2%} below threshold")
+        print(f"    exact: PairwiseAligner {exact_time:.3f} s, BatchScorer {batch_time:.3f} s")
+
+        for band in args.bands:
+            band  = None if band == "none" else int(band)
+            start = perf_counter()
+            bounded = scorer.classify(sequences, threshold, band)
+            bounded_time = perf_counter() - start
+
+            print(f"    band {str(band):>4}: {bounded_time:.3f} s, speedup {exact_time / bounded_time:.1f}x, "
+                  f"agreement {(bounded == exact).mean():.4%}")
+
+if __name__ == "__main__":
+    main()
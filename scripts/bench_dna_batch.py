@@ -0,0 +1,96 @@
+"""
+    This script is using to compare a pd.Series of SeqRecords (as_DNA_records) with DNABatch (as_DNA_batch):
+    memory held by the encoded dataset, time to encode it, to cut it into worker shards
+    and to score it with BatchScorer.
+
+    Parameters:
+        @dataset:   path to *.csv dataset
+        @codetable: path to codetable used for encoding
+        @shards:    number of worker shards
+        @copies:    the dataset is concatenated this many times, to see how memory grows
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import gc
+import argparse
+import tracemalloc
+import pandas as pd
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+from math    import floor
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Memory benchmark of encoded DNA containers.")
+parser.add_argument("--dataset",   "-d", type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--shards",    "-s", type=int,  default=8)
+parser.add_argument("--copies",          type=int,  default=1)
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.batch_align            import BatchScorer
+from src.ids                    import IDS
+
+def measure(func, *func_args) -> tuple:
+    """Returns (result, seconds, bytes held by the result, peak bytes while it was built)."""
+    gc.collect()
+    tracemalloc.start()
+    start  = perf_counter()
+    result = func(*func_args)
+    spent  = perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, spent, held, peak
+
+def shards(container, parts : int) -> tuple:
+    start = perf_counter()
+    size  = len(container) / parts
+    parts = [ container[floor(i * size) : floor((i + 1) * size)] for i in range(parts) ]
+    return parts, perf_counter() - start
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    DATASET   = CSV_Dataset.from_file(args.dataset)
+    DATASET   = CSV_Dataset(pd.concat([ DATASET ] * args.copies, ignore_index=True))
+    CODETABLE = JSON_Codetable(args.codetable)
+    SCORER    = BatchScorer(IDS.Aligner(), DATASET.as_DNA_strings(CODETABLE).iloc[0])
+
+    records, records_time, records_held, records_peak = measure(DATASET.as_DNA_records, CODETABLE, False)
+    batch,   batch_time,   batch_held,   batch_peak   = measure(DATASET.as_DNA_batch,   CODETABLE)
+
+    if [ str(record.seq) for record in records ] != list(batch):
+        raise Exception("DNABatch differs from DNA records")
+
+    _, records_shard_time = shards(records, args.shards)
+    _, batch_shard_time   = shards(batch,   args.shards)
+
+    start = perf_counter()
+    records_scores = SCORER.score([ str(record.seq) for record in records ])
+    records_score_time = perf_counter() - start
+    start = perf_counter()
+    batch_scores = SCORER.score(batch)
+    batch_score_time = perf_counter() - start
+
+    if (records_scores != batch_scores).any():
+        raise Exception("Scores of DNABatch differ from scores of DNA records")
+
+    report = pd.DataFrame({ "Series of SeqRecord" : [ records_held / 2**20, records_peak / 2**20, records_time, records_shard_time, records_score_time ],
+                            "DNABatch"            : [ batch_held / 2**20,   batch_peak / 2**20,   batch_time,   batch_shard_time,   batch_score_time ] },
+                          index=[ "Held, MiB", "Peak, MiB", "Encoding, s", f"{args.shards} shards, s", "BatchScorer, s" ])
+    print(f"Records: {len(DATASET)}")
+    print(report.to_string(float_format=lambda value: f"{value:.4f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+    This script is using to compare bulk encoding of a CSV dataset into DNA with the encoded DNA cache:
+    cold run (encode & store), warm run (whole dataset from the cache) and a random sample of it.
+
+    Parameters:
+        @dataset:   path to *.csv dataset
+        @codetable: path to codetable used for encoding
+        @cache:     cache directory, it is created in a temporary directory by default
+        @repeat:    number of runs of each warm lookup, the best time is reported
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+
+from pathlib  import Path
+from os       import path
+from sys      import path as syspath
+from time     import perf_counter
+from tempfile import TemporaryDirectory
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of the encoded DNA cache.")
+parser.add_argument("--dataset",   "-d", type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--cache",           type=Path, default=None)
+parser.add_argument("--repeat",    "-r", type=int,  default=3)
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.datasets.dna_cache     import DNACache
+
+def timed(func, *func_args, repeat = 1) -> tuple:
+    best, result = None, None
+    for _ in range(repeat):
+        start  = perf_counter()
+        result = func(*func_args)
+        spent  = perf_counter() - start
+        best   = spent if best is None else min(best, spent)
+    return best, result
+
+def bench(cache_dir : Path):
+    DATASET   = CSV_Dataset.from_file(args.dataset)
+    CODETABLE = JSON_Codetable(args.codetable)
+    SAMPLE    = DATASET.random_sample(len(DATASET) // 10)
+
+    encode = lambda dataset, cache: dataset.as_DNA_strings(CODETABLE, cache).tolist()
+
+    bulk_time,   bulk   = timed(encode, DATASET, None, repeat=args.repeat)
+    cold_time,   cold   = timed(encode, DATASET, DNACache(cache_dir))
+    warm_time,   warm   = timed(encode, DATASET, DNACache(cache_dir), repeat=args.repeat)
+    sample_time, sample = timed(encode, SAMPLE,  DNACache(cache_dir), repeat=args.repeat)
+
+    if not (bulk == cold == warm) or sample != encode(SAMPLE, None):
+        raise Exception("Cached DNA sequences differ from the encoded ones")
+
+    print(f"Records             : {len(DATASET)}")
+    print(f"Bulk encoding       : {bulk_time:.3f} s")
+    print(f"Cold cache          : {cold_time:.3f} s")
+    print(f"Warm cache          : {warm_time:.3f} s ({bulk_time / warm_time:.1f}x)")
+    print(f"Warm cache, sample  : {sample_time:.3f} s ({len(SAMPLE)} records)")
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    if args.cache is not None:
+        bench(args.cache)
+    else:
+        with TemporaryDirectory() as cache_dir:
+            bench(Path(cache_dir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+    This script is using to compare per-row (iterrows), bulk and integer-code encoding of a CSV dataset into DNA.
+    The per-row reference is a frozen copy of the first encoder, which appended codes of literals one by one.
+
+    Parameters:
+        @dataset:   path to *.csv dataset
+        @codetable: path to codetable used for encoding
+        @repeat:    number of runs of each encoder, the best time is reported
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy as np
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of DNA encoding of CSV datasets.")
+parser.add_argument("--dataset",   "-d", type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--repeat",    "-r", type=int,  default=3)
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+
+def literal_DNA_string(record : list, codetable : JSON_Codetable) -> str:
+    """
+        Frozen copy of the first CSV_DatasetRecord.encode_into_DNA: codes of literals are appended one by one.
+        The reference must not follow changes of the encoder it checks.
+    """
+    payload = ""
+    for field in record[:-1]:
+        field = str(round(field, 6)) if type(field) is np.float64 else str(field)
+        for literal in list(field):
+            payload += codetable[literal]
+    return payload
+
+def rowwise_DNA_strings(dataset : CSV_Dataset, codetable : JSON_Codetable) -> list:
+    """Reference encoder: one record per row (iterrows), as as_DNA_records used to do."""
+    return [ literal_DNA_string(row.astype(str).tolist(), codetable) for _, row in dataset.iterrows() ]
+
+def bulk_DNA_strings(dataset : CSV_Dataset, codetable : JSON_Codetable) -> list:
+    return dataset.as_DNA_strings(codetable).tolist()
+
+def codes_DNA_strings(dataset : CSV_Dataset, codetable : JSON_Codetable):
+    return dataset.as_DNA_codes(codetable)
+
+def best_time(func, *func_args) -> tuple:
+    best, result = None, None
+    for _ in range(args.repeat):
+        start  = perf_counter()
+        result = func(*func_args)
+        spent  = perf_counter() - start
+        best   = spent if best is None else min(best, spent)
+    return best, result
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    # The last column is the label, a dataset without it would lose its last field
+    DATASET   = CSV_Dataset.from_file(args.dataset).labeled('normal')
+    CODETABLE = JSON_Codetable(args.codetable)
+
+    rowwise_time, rowwise = best_time(rowwise_DNA_strings, DATASET, CODETABLE)
+    bulk_time,    bulk    = best_time(bulk_DNA_strings,    DATASET, CODETABLE)
+    codes_time,   codes   = best_time(codes_DNA_strings,   DATASET, CODETABLE)
+
+    if rowwise != bulk:
+        mismatches = sum(1 for a, b in zip(rowwise, bulk) if a != b)
+        raise Exception(f"Bulk encoder differs from the per-row one in {mismatches} records")
+    if list(codes) != bulk:
+        mismatches = sum(1 for a, b in zip(codes, bulk) if a != b)
+        raise Exception(f"Integer-code encoder differs from the bulk one in {mismatches} records")
+
+    print(f"Records          : {len(DATASET)}")
+    print(f"Per-row encoding : {rowwise_time:.3f} s")
+    print(f"Bulk encoding    : {bulk_time:.3f} s")
+    print(f"Integer codes    : {codes_time:.3f} s")
+    print(f"Speedup          : {rowwise_time / bulk_time:.1f}x (bulk), {rowwise_time / codes_time:.1f}x (codes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+    This script is using to compare IDS which aligns one sequence of all fields with FieldwiseIDS which aligns
+    each field separately: metrics, test time, DP cells per packet and the hit rate of the field cache.
+    DP cells of a whole-sequence alignment are len(ideal sequence) * len(packet sequence), field-wise cells are
+    counted only for field values which were not in the field cache.
+    Field-wise rules: the combined score with the mean threshold, the combined score with the threshold calibrated
+    for a false positive rate on train records and votes of K anomalous fields (see FieldwiseIDS).
+
+    Parameters:
+        @train:     path to train *.csv dataset
+        @test:      path to test *.csv dataset (only attack records)
+        @codetable: path to codetable used for encoding
+        @scoring:   scoring of packets (see IDS.SCORINGS)
+        @weights:   weights of field scores, FIELD=WEIGHT (1 for fields which are not listed)
+        @fpr:       false positive rate on train records of the calibrated combined threshold
+        @votes:     numbers of anomalous fields which make a packet an attack
+        @rows:      number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS, FieldwiseIDS, IdealSequence
+from src.instrument             import INSTRUMENTS, set_progress
+from src.scores                 import calibrate
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of field-wise alignment.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='pairwise')
+parser.add_argument("--weights",    "-w", type=str, nargs="*", default=[], metavar="FIELD=WEIGHT")
+parser.add_argument("--rows",       "-r", type=int, default=10000)
+parser.add_argument("--fpr",              type=float, default=0.01)
+parser.add_argument("--votes",            type=int, nargs="*", default=[ 1, 2, 3 ])
+
+def measure(name : str, ids : IDS, train_ds : CSV_Dataset, test_ds : CSV_Dataset, fpr = None) -> dict:
+    # Training prints thresholds, keep the report readable
+    with redirect_stdout(None):
+        ids.train(train_ds)
+    if fpr is not None:
+        ids.ideal_sequence = IdealSequence(ids.ideal_sequence, calibrate(ids.train_scores, 'fpr', fpr))
+
+    INSTRUMENTS.reset()
+    start   = perf_counter()
+    metrics = ids.test(test_ds)
+    spent   = perf_counter() - start
+
+    if isinstance(ids, FieldwiseIDS):
+        cells = INSTRUMENTS.as_dict()["counters"].get("align.cells", 0)
+    else:
+        cells = len(ids.ideal_sequence.seq) * int(test_ds.as_DNA_strings(ids.codetable).str.len().sum())
+
+    return { "IDS"              : name,
+             "Accuracy"         : metrics.accuracy,
+             "Recall"           : metrics.recall,
+             "Specificity"      : metrics.specificity,
+             "Test time, s"     : spent,
+             "DP cells/packet"  : cells / len(test_ds),
+             "Cache hit rate"   : metrics.cache_hit_rate }
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+    INSTRUMENTS.enable()
+
+    weights = { field : float(weight) for field, _, weight in (item.rpartition('=') for item in args.weights) }
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+    ALIGNER   = IDS.Aligner()
+
+    report = [ measure("whole sequence", IDS(CODETABLE, ALIGNER, args.scoring), TRAIN_DS, TEST_DS),
+               measure("field-wise, sum", FieldwiseIDS(CODETABLE, ALIGNER, args.scoring, weights=weights), TRAIN_DS, TEST_DS),
+               measure(f"field-wise, sum at fpr {args.fpr}", FieldwiseIDS(CODETABLE, ALIGNER, args.scoring, weights=weights),
+                       TRAIN_DS, TEST_DS, args.fpr) ]
+    for votes in args.votes:
+        report.append(measure(f"field-wise, {votes} votes", FieldwiseIDS(CODETABLE, ALIGNER, args.scoring, weights=weights, votes=votes),
+                              TRAIN_DS, TEST_DS))
+
+    print(pd.DataFrame(report).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
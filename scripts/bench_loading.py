@@ -0,0 +1,91 @@
+"""
+    This script is using to compare ways of loading a CSV dataset: the former loader (inferred dtypes and
+    row-wise hex decoding), typed parsing, chunked parsing, a projection of columns and the columnar cache.
+    All of them must give the same dataset as the former loader.
+
+    Parameters:
+        @dataset:    path to *.csv dataset
+        @columns:    columns of the projection
+        @chunk_size: lines of a chunk of chunked parsing
+        @repeat:     number of runs of each loader, the best time is reported
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+
+from pathlib import Path
+from os      import path
+from sys     import path as syspath
+from time    import perf_counter
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of CSV dataset loading.")
+parser.add_argument("--dataset",    "-d", type=Path, required=True)
+parser.add_argument("--columns",          type=str,  nargs="+", default=['tcp.len', 'tcp.flags', 'tcp.options'])
+parser.add_argument("--chunk_size",       type=int,  default=10000)
+parser.add_argument("--repeat",     "-r", type=int,  default=3)
+args = parser.parse_args()
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.csv_ds        import CSV_Dataset
+from src.datasets.csv_cache     import CSVCache
+
+def former_loader(dataset : Path) -> pd.DataFrame:
+    """Reference loader: CSV_Dataset.from_file as it was before typed parsing."""
+    df = pd.read_csv(dataset, low_memory=False)
+    df = df.fillna(0).astype(CSV_Dataset.FIELD_TYPES)
+    df['tcp.flags']   = df['tcp.flags'].apply(lambda x : int(x, 16))
+    df['tcp.options'] = df['tcp.options'].apply(lambda x : int(x, 16) if x != '<MISSING>' else 0)
+    return df
+
+def best_time(func, *func_args, **func_kwargs) -> tuple:
+    best, result = None, None
+    for _ in range(args.repeat):
+        start  = perf_counter()
+        result = func(*func_args, **func_kwargs)
+        spent  = perf_counter() - start
+        best   = spent if best is None else min(best, spent)
+    return best, result
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    cache_dir = Path(tempfile.mkdtemp(prefix="csv_cache_"))
+    try:
+        former_time, former = best_time(former_loader, args.dataset)
+
+        start = perf_counter()
+        CSV_Dataset.from_file(args.dataset, cache=CSVCache(cache_dir))
+        cold_time = perf_counter() - start
+
+        loaders = { "Typed parsing"  : dict(),
+                    "Chunked"        : dict(chunk_size=args.chunk_size),
+                    "Projection"     : dict(columns=args.columns),
+                    "Cache (warm)"   : dict(cache=CSVCache(cache_dir)),
+                    "Cache, projection" : dict(cache=CSVCache(cache_dir), columns=args.columns) }
+
+        report = [ ("Former loader", former_time), ("Cache (cold)", cold_time) ]
+        for name, kwargs in loaders.items():
+            spent, dataset = best_time(CSV_Dataset.from_file, args.dataset, **kwargs)
+            expected = former if "columns" not in kwargs else former[[ column for column in former if column in args.columns ]]
+            pd.testing.assert_frame_equal(pd.DataFrame(dataset), expected)
+            report.append((name, spent))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"Records : {len(former)}")
+    print(pd.DataFrame({ "Time, s" : [ spent for _, spent in report ],
+                         "Speedup" : [ former_time / spent for _, spent in report ] },
+                       index=[ name for name, _ in report ]).to_string(float_format=lambda value: f"{value:.3f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+    This script is using to compare medians of a dataset read by chunks (see CSV_Dataset.median_of_chunks())
+    with the exact ones of the whole loaded dataset (CSV_Dataset.get_median()): time, peak memory (tracemalloc),
+    memory of kept statistics and accuracy of medians. Peak memory of the whole dataset includes parsing of it,
+    peak memory of chunked medians includes parsing of one chunk.
+    Accuracy of each field is the relative error of its median, the ideal sequence made of medians is
+    also aligned with the exact one (Score, the exact ideal sequence gets Max score with itself).
+
+    Parameters:
+        @dataset:      path to *.csv dataset
+        @codetable:    path to codetable used for encoding
+        @chunk_size:   number of records in a chunk
+        @compressions: compressions of t-digests (see TDigestQuantiles)
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import tracemalloc
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.datasets.quantiles     import ExactQuantiles, TDigestQuantiles
+from src.ids                    import IDS
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of chunked medians.")
+parser.add_argument("--dataset",        type=Path, required=True)
+parser.add_argument("--codetable", "-c", type=Path, required=True)
+parser.add_argument("--chunk_size",     type=int, default=5000)
+parser.add_argument("--compressions",   type=int, nargs="+", default=[25, 100, 400])
+
+def measured(func) -> tuple:
+    """Returns (result, seconds, peak MB) of func()."""
+    tracemalloc.start()
+    start  = perf_counter()
+    result = func()
+    spent  = perf_counter() - start
+    peak   = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, spent, peak
+
+def whole_median(dataset : Path):
+    dataset = CSV_Dataset.from_file(dataset)
+    return dataset.get_median(), None
+
+def chunked_median(dataset : Path, chunk_size : int, quantiles):
+    return CSV_Dataset.median_of_chunks(CSV_Dataset.read_chunks(dataset, chunk_size), quantiles), quantiles
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+
+    with redirect_stdout(None):
+        CODETABLE = JSON_Codetable(args.codetable)
+        ALIGNER   = IDS.Aligner()
+
+    cases = [ ("whole dataset", lambda: whole_median(args.dataset)),
+              ("chunked exact", lambda: chunked_median(args.dataset, args.chunk_size, ExactQuantiles())) ]
+    cases += [ (f"t-digest {compression}", lambda compression=compression:
+                    chunked_median(args.dataset, args.chunk_size, TDigestQuantiles(compression)))
+               for compression in args.compressions ]
+
+    report, exact, exact_seq = [], None, None
+    for name, case in cases:
+        (record, quantiles), spent, peak = measured(case)
+        values = np.array(record.record[:-1], dtype=np.float64)
+        seq    = str(record.encode_into_DNA(CODETABLE).seq)
+        if exact is None:
+            exact, exact_seq = values, seq
+        errors = np.abs(values - exact) / np.maximum(np.abs(exact), 1)
+        report.append({ "Medians"          : name,
+                        "Time, s"          : spent,
+                        "Peak, MB"         : peak,
+                        "Statistics, KB"   : quantiles.nbytes / 2**10 if quantiles is not None else None,
+                        "Inexact fields"   : int((values != exact).sum()),
+                        "Max rel. error"   : errors.max(),
+                        "Score"            : ALIGNER.score(exact_seq, seq) })
+
+    print(f"Max score: {ALIGNER.score(exact_seq, exact_seq)}")
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda value: f"{value:.4g}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+    This script is using to measure metrics of large test runs:
+        update     - per-packet Metrics.update() against one Metrics.update_batch() of verdict arrays
+        thresholds - metrics of many thresholds: a test() per threshold (records are aligned for each one)
+                     against IDS.sweep() (records are aligned once, see Metrics.sweep())
+    Counts of both ways must be the same. The script also prints the areas under ROC & PR curves.
+
+    Parameters:
+        @train:      path to train *.csv dataset
+        @test:       path to test *.csv dataset (only attack records)
+        @codetable:  path to codetable used for encoding
+        @scoring:    scoring of packets (see IDS.SCORINGS)
+        @thresholds: number of thresholds around the trained one
+        @packets:    number of random verdicts of the update case
+        @rows:       number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS, IdealSequence, Metrics
+from src.instrument             import set_progress
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of batch metrics & threshold sweeps.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='batch')
+parser.add_argument("--thresholds", "-t", type=int, default=20)
+parser.add_argument("--packets",          type=int, default=1000000)
+parser.add_argument("--rows",       "-r", type=int, default=10000)
+
+def counts(metrics) -> tuple:
+    return (metrics.true_pos, metrics.false_pos, metrics.true_negative, metrics.false_negative)
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+    report = []
+
+    # Per-packet & batch updates
+    rng = np.random.default_rng(0)
+    verdicts, conditions = rng.random(args.packets) < .5, rng.random(args.packets) < .3
+    start, single = perf_counter(), Metrics()
+    for verdict, condition in zip(verdicts.tolist(), conditions.tolist()):
+        single.update(verdict, condition)
+    single_time = perf_counter() - start
+    start = perf_counter()
+    batch = Metrics.from_arrays(verdicts, conditions)
+    batch_time = perf_counter() - start
+    if counts(single) != counts(batch):
+        raise Exception(f"Batch counts differ: {counts(single)}, {counts(batch)}")
+    report.append({ "Case" : f"update, {args.packets} packets", "Time, s" : single_time, "Batch time, s" : batch_time })
+
+    # Thresholds around the trained one
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+
+    ids = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    with redirect_stdout(None):
+        ideal = ids.train(TRAIN_DS)
+    TEST_DNA   = ids.encode(TEST_DS)
+    THRESHOLDS = ideal.threshold * np.linspace(.5, 1.5, args.thresholds)
+
+    start, tested = perf_counter(), []
+    for threshold in THRESHOLDS:
+        ids.ideal_sequence = IdealSequence(ideal, threshold)
+        tested.append(counts(ids.test(TEST_DNA)))
+    test_time = perf_counter() - start
+    ids.ideal_sequence = ideal
+
+    start = perf_counter()
+    curve = ids.sweep(TEST_DNA, THRESHOLDS)
+    sweep_time = perf_counter() - start
+    swept = [ tuple(row) for row in curve[[ "True Positive", "False Positive", "True Negative", "False Negative" ]].to_numpy() ]
+    if swept != tested:
+        raise Exception("Counts of the sweep differ from the ones of test()")
+    report.append({ "Case" : f"{args.thresholds} thresholds, {len(TEST_DNA)} packets", "Time, s" : test_time, "Batch time, s" : sweep_time })
+
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+    print(Metrics.areas(ids.sweep(TEST_DNA)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+    This script is using to measure the k-mer prefilter of IDS: for each tolerance it reports the share of packets
+    decided without alignment, the accuracy change against exact mode and the test time against exact mode.
+    The accuracy change is measured with an audited prefilter (decided packets are aligned too), the test time
+    with a prefilter which is not audited.
+
+    Parameters:
+        @train:      path to train *.csv dataset
+        @test:       path to test *.csv dataset (only attack records)
+        @codetable:  path to codetable used for encoding
+        @tolerances: shares of wrong verdicts on train records allowed beyond the bounds of the band
+        @margin:     similarity each bound is moved outwards after calibration (see KmerPrefilter)
+        @scoring:    scoring of packets (see IDS.SCORINGS)
+        @rows:       number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS
+from src.kmers                  import KmerPrefilter
+from src.instrument             import set_progress
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of the k-mer prefilter of IDS.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--tolerances", "-t", type=float, nargs="+", default=[0.0, 0.005, 0.01, 0.02, 0.05])
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='pairwise')
+parser.add_argument("--rows",       "-r", type=int, default=2000)
+parser.add_argument("--margin",           type=float, default=0.05)
+
+def timed_test(ids : IDS, test_ds : CSV_Dataset) -> tuple:
+    start   = perf_counter()
+    metrics = ids.test(test_ds)
+    return metrics, perf_counter() - start
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+
+    ids = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    with redirect_stdout(None):
+        ids.train(TRAIN_DS)
+    exact, exact_time = timed_test(ids, TEST_DS)
+
+    report = [ { "Tolerance"       : None,
+                 "Band"            : None,
+                 "Short-circuited" : 0.0,
+                 "Accuracy"        : exact.accuracy,
+                 "Accuracy change" : 0.0,
+                 "Test time, s"    : exact_time,
+                 "Speedup"         : 1.0 } ]
+
+    for tolerance in args.tolerances:
+        # The threshold is the same, only the band of the prefilter is calibrated
+        ids.prefilter = KmerPrefilter(tolerance=tolerance, audit=True, margin=args.margin)
+        with redirect_stdout(None):
+            ids.train(TRAIN_DS)
+        audited, _ = timed_test(ids, TEST_DS)
+
+        ids.prefilter = KmerPrefilter(tolerance=tolerance, low=ids.prefilter.low, high=ids.prefilter.high, margin=args.margin)
+        metrics, spent = timed_test(ids, TEST_DS)
+
+        report.append({ "Tolerance"       : tolerance,
+                        "Band"            : f"({ids.prefilter.low:.3f}, {ids.prefilter.high:.3f})",
+                        "Short-circuited" : metrics.short_circuit_fraction,
+                        "Accuracy"        : metrics.accuracy,
+                        "Accuracy change" : audited.accuracy_change,
+                        "Test time, s"    : spent,
+                        "Speedup"         : exact_time / spent })
+        ids.prefilter = None
+
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+
+if __name__ == "__main__":
+    main()
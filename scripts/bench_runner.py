@@ -0,0 +1,170 @@
+"""
+    This script is using to benchmark this IDS on many datasets at once.
+    Each (dataset directory, train size) pair is an independent job, jobs are run on a process pool.
+    Every finished job is checkpointed, so an interrupted run continues from where it stopped
+    when it is started again with the same --out directory.
+    Note: For now, only *.csv format of datasets are supported.
+
+    Parameters:
+        @dir:       directory in which train & test dataset files will be searched
+        @out:       directory of checkpoints & the report
+        @sizes:     train sizes as parts of train dataset (e.g. 10 means 1/10 of it)
+        @workers:   number of jobs which are run in parallel
+        @algo:      alignment algorithm
+        @scoring:   scoring of packets (see IDS.SCORINGS)
+        @seed:      seed of train samples, the same job always gets the same sample
+        @dna_cache: directory of the encoded DNA cache, it is shared by all jobs
+        @fresh:     drop checkpoints of the previous run
+
+    Artifacts:
+        out/jobs/*.json - result of each finished job
+        out/report.csv  - metrics, wall/load/encode/align time and packets/s of each job
+        metrics.csv     - metrics of each dataset directory, as scripts/ids_test.py writes
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import os
+import json
+import argparse
+import multiprocessing as mp
+import pandas as pd
+
+from pathlib import Path
+from os      import walk, path
+from sys     import path as syspath
+from time    import perf_counter
+from hashlib import sha1
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.datasets.dna_cache     import DNACache
+from src.engine                 import ExecutionEngine
+from src.ids                    import IDS, IdealSequence, Metrics
+from src.utils                  import create_shuffled_test_df
+
+# Hardcoded dataset filenames
+TEST_DS_NAME  = "test.csv"
+TRAIN_DS_NAME = "train.csv"
+CODETABLE     = "codetable.json"
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Resumable benchmark of this IDS on many datasets.")
+parser.add_argument("--dir",       "-d", type=Path, required=True)
+parser.add_argument("--out",       "-o", type=Path, default=Path("bench_results"))
+parser.add_argument("--sizes",     "-s", type=int,  nargs="+", default=[100, 80, 60, 40, 20, 10])
+parser.add_argument("--workers",   "-w", type=int,  default=mp.cpu_count())
+parser.add_argument("--algo",            choices=['Smith-Waterman', 'Gotoh'], default='Gotoh')
+parser.add_argument("--scoring",         choices=IDS.SCORINGS, default='batch')
+parser.add_argument("--seed",            type=int,  default=0)
+parser.add_argument("--dna_cache",       type=Path, default=None)
+parser.add_argument("--fresh",           action='store_true')
+
+def checkpoint_path(out : Path, job : tuple) -> Path:
+    directory, size = job
+    return out / "jobs" / f"{sha1(f'{directory}|{size}'.encode()).hexdigest()[:16]}.json"
+
+def find_test_dirs(root : Path) -> list:
+    test_dirs = []
+    for dirpath, dirnames, filenames in walk(root):
+        if all(name in filenames for name in (TEST_DS_NAME, TRAIN_DS_NAME, CODETABLE)):
+            test_dirs.append(Path(dirpath))
+    return sorted(test_dirs)
+
+def run_job(state : dict, job : tuple) -> dict:
+    """Trains IDS on a sample of train dataset, tests it and checkpoints the result."""
+    directory, size = job
+    timings, start  = {}, perf_counter()
+
+    def stage(name, func, *func_args, **func_kwargs):
+        stage_start = perf_counter()
+        result      = func(*func_args, **func_kwargs)
+        timings[name] = timings.get(name, 0.) + perf_counter() - stage_start
+        return result
+
+    # Jobs are already run in parallel, so each job is run serially
+    ids       = IDS(JSON_Codetable(Path(directory) / CODETABLE), IDS.Aligner(state["algo"]), state["scoring"])
+    dna_cache = DNACache(state["dna_cache"]) if state["dna_cache"] else None
+
+    # As run.py does: train records are normal, test records are attacks mixed with the train ones
+    train_ds  = stage("load", CSV_Dataset.from_file, Path(directory) / TRAIN_DS_NAME)
+    test_ds   = stage("load", CSV_Dataset.from_file, Path(directory) / TEST_DS_NAME)
+    test_ds   = CSV_Dataset(create_shuffled_test_df(test_ds, train_ds))
+    train_ds  = train_ds.random_sample(int(len(train_ds) / size), seed=state["seed"])
+
+    ideal_dna = stage("encode", lambda: train_ds.get_median().encode_into_DNA(ids.codetable, id=''))
+    train_dna = stage("encode", train_ds.as_DNA_records, ids.codetable, progress=False, cache=dna_cache)
+    test_dna  = stage("encode", test_ds.as_DNA_records,  ids.codetable, progress=False, cache=dna_cache)
+
+    scores = stage("align", ids.get_align_scores, ideal_dna.seq, [ str(dna_seq.seq) for dna_seq in train_dna ], 1, 'serial')
+    ids.ideal_sequence = IdealSequence(ideal_dna, float(scores.mean()))
+
+    verdicts = stage("align", lambda: ids.classify_batch(test_dna) if ids.scoring != 'pairwise' else \
+                                        [ ids.classify(dna_seq) for dna_seq in test_dna ])
+    metrics  = Metrics.from_arrays(verdicts, [ dna_seq.name == "attack" for dna_seq in test_dna ])
+
+    wall   = perf_counter() - start
+    result = { "Directory" : str(directory), "Size" : size, "Threshold" : ids.ideal_sequence.threshold }
+    result.update(metrics.as_dataframe(len(train_ds), len(test_ds)).to_dict("records")[0])
+    result.update({ "Wall time, s"   : wall,
+                    "Load time, s"   : timings["load"],
+                    "Encode time, s" : timings["encode"],
+                    "Align time, s"  : timings["align"],
+                    "Packets/s"      : (len(train_ds) + len(test_ds)) / wall })
+
+    # Written aside and renamed, so a checkpoint is never half-written
+    checkpoint = checkpoint_path(Path(state["out"]), job)
+    tmp = checkpoint.with_suffix(f".{os.getpid()}.tmp")
+    with tmp.open("w") as tmp_file:
+        json.dump(result, tmp_file, indent=4, default=float)
+    os.replace(tmp, checkpoint)
+
+    print(f"Finished: {directory}, size 1/{size}, {wall:.2f} s")
+    return result
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+
+    TEST_DIRS = find_test_dirs(args.dir)
+    if not TEST_DIRS:
+        raise Exception("No test directories was found")
+
+    (args.out / "jobs").mkdir(parents=True, exist_ok=True)
+    if args.fresh:
+        for checkpoint in (args.out / "jobs").glob("*.json"):
+            checkpoint.unlink()
+
+    JOBS    = [ (str(test_dir), size) for test_dir in TEST_DIRS for size in args.sizes ]
+    PENDING = [ job for job in JOBS if not checkpoint_path(args.out, job).is_file() ]
+    print(f"Jobs: {len(JOBS)}, finished before: {len(JOBS) - len(PENDING)}")
+
+    state = { "out" : str(args.out), "algo" : args.algo, "scoring" : args.scoring, "seed" : args.seed,
+              "dna_cache" : str(args.dna_cache) if args.dna_cache else None }
+    if PENDING:
+        with ExecutionEngine('process', min(args.workers, len(PENDING)), state) as engine:
+            # Each job checkpoints itself, so jobs finished before an interruption are kept
+            engine.map(run_job, PENDING)
+
+    results = []
+    for job in JOBS:
+        with checkpoint_path(args.out, job).open("r") as checkpoint:
+            results.append(json.load(checkpoint))
+
+    report = pd.DataFrame(results)
+    report.to_csv(args.out / "report.csv", index=False)
+    for directory, metrics in report.groupby("Directory", sort=False):
+        metrics.drop(columns=["Directory", "Size"]).to_csv(Path(directory) / Path("metrics.csv"), index=False)
+
+    print(report[["Directory", "Train subset size", "Accuracy", "Wall time, s",
+                  "Encode time, s", "Align time, s", "Packets/s"]].to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+    This script is using to compare schedules of train & test work over workers (see Scheduler):
+    static ranges of equal numbers of packets, one per worker, and dynamic chunks of equal estimated cost.
+    For each schedule it reports wall time of train() and test() and utilization of workers
+    (busy time of a worker divided by wall time of the stage): the least busy worker and the mean one.
+    Estimated imbalance is the wall time of the schedule by estimated costs of packets (a free worker takes
+    the next task) divided by the ideal one (equal shares of workers), it does not depend on the cores of the machine.
+    Threshold & metrics must be the same with both schedules.
+
+    Parameters:
+        @train:     path to train *.csv dataset
+        @test:      path to test *.csv dataset (only attack records)
+        @codetable: path to codetable used for encoding
+        @scoring:   scoring of packets (see IDS.SCORINGS)
+        @backend:   execution backend (see BACKENDS)
+        @workers:   number of workers
+        @rows:      number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.engine                 import BACKENDS
+from src.ids                    import IDS
+from src.scheduler              import Scheduler, SCHEDULES
+from src.instrument             import set_progress
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of schedules of train & test work.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='pairwise')
+parser.add_argument("--backend",    "-b", choices=BACKENDS, default='process')
+parser.add_argument("--workers",    "-w", type=int, default=4)
+parser.add_argument("--rows",       "-r", type=int, default=5000)
+
+def imbalance(scheduler : Scheduler, workers : int, costs : np.ndarray) -> float:
+    loads = np.zeros(workers)
+    for start, finish in scheduler.plan(workers, costs):
+        loads[loads.argmin()] += costs[start : finish].sum()
+    return loads.max() / (costs.sum() / workers)
+
+def measure(ids : IDS, stage : str, func, *func_args) -> tuple:
+    """Returns (result, report of the stage)."""
+    # Training prints its progress, keep the report readable
+    with redirect_stdout(None):
+        start  = perf_counter()
+        result = func(*func_args)
+        spent  = perf_counter() - start
+    utilization = ids.utilization["align" if stage == "train" else "classify"]
+    return result, { "Schedule"          : ids.scheduler.schedule,
+                     "Stage"             : stage,
+                     "Wall, s"           : spent,
+                     "Least busy worker" : min(utilization),
+                     "Mean utilization"  : float(np.mean(utilization)) }
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+
+    ids = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    TRAIN_DNA, TEST_DNA = ids.encode(TRAIN_DS), ids.encode(TEST_DS)
+    lengths = np.diff(TEST_DNA.offsets)
+    print(f"Packet sequences: {lengths.min()} - {lengths.max()} letters, mean {lengths.mean():.1f}")
+
+    report, results = [], {}
+    for schedule in SCHEDULES:
+        ids.scheduler = Scheduler(schedule)
+        ideal, train_report = measure(ids, "train", ids.train, TRAIN_DS, args.workers, args.backend, TRAIN_DNA)
+        metrics, test_report = measure(ids, "test", ids.test, TEST_DNA, args.workers, args.backend)
+        train_report["Est. imbalance"] = imbalance(ids.scheduler, args.workers, Scheduler.costs(TRAIN_DNA))
+        test_report["Est. imbalance"]  = imbalance(ids.scheduler, args.workers, Scheduler.costs(TEST_DNA))
+        report += [ train_report, test_report ]
+        results[schedule] = (ideal.threshold, metrics.true_pos, metrics.false_pos, metrics.true_negative, metrics.false_negative)
+
+    if len(set(results.values())) != 1:
+        raise Exception(f"Schedules give different results: {results}")
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+if __name__ == "__main__":
+    main()
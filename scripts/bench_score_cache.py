@@ -0,0 +1,105 @@
+"""
+    This script is using to measure the score cache of IDS (see ScoreCache): test time with and without
+    the cache and its hit rate in three cases:
+        single pass - packets repeated inside the test dataset
+        replay      - the same test dataset is classified again (a replayed capture)
+        analyze     - IDS.analyze() over several train sizes, test records are aligned again with each
+                      ideal sequence and samples of a flood often give the same one
+    Test records are encoded once beforehand, so only alignment is timed. Metrics must be the same with and
+    without the cache.
+
+    Parameters:
+        @train:      path to train *.csv dataset
+        @test:       path to test *.csv dataset (only attack records)
+        @codetable:  path to codetable used for encoding
+        @scoring:    scoring of packets (see IDS.SCORINGS)
+        @capacity:   number of scores the cache holds
+        @sizes:      train sizes of the analyze case (see IDS.analyze())
+        @rows:       number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS
+from src.score_cache            import ScoreCache
+from src.instrument             import set_progress
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of the score cache of IDS.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='pairwise')
+parser.add_argument("--capacity",         type=int, default=100000)
+parser.add_argument("--sizes",            type=int, nargs="+", default=[10, 8, 6, 4, 2, 1])
+parser.add_argument("--rows",       "-r", type=int, default=10000)
+
+def timed(func, *func_args, **func_kwargs) -> tuple:
+    # IDS prints its progress, keep the report readable
+    with redirect_stdout(None):
+        start  = perf_counter()
+        result = func(*func_args, **func_kwargs)
+    return result, perf_counter() - start
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+
+    ids = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    timed(ids.train, TRAIN_DS)
+    TEST_DNA  = ids.encode(TEST_DS)
+    exact, exact_time = timed(ids.test, TEST_DNA)
+
+    ids.score_cache = ScoreCache(args.capacity)
+    single, single_time = timed(ids.test, TEST_DNA)
+    replay, replay_time = timed(ids.test, TEST_DNA)
+    for metrics in (single, replay):
+        if (metrics.true_pos, metrics.false_pos) != (exact.true_pos, exact.false_pos):
+            raise Exception("Verdicts with the score cache differ from the exact ones")
+
+    # Samples of analyze() are drawn from the global random state, both runs get the same ones
+    ids.score_cache = None
+    np.random.seed(0)
+    analyzed, analyze_time = timed(ids.analyze, TRAIN_DS, TEST_DNA, sizes=args.sizes)
+    ids.score_cache = ScoreCache(args.capacity)
+    np.random.seed(0)
+    cached, cached_time = timed(ids.analyze, TRAIN_DS, TEST_DNA, sizes=args.sizes)
+    pd.testing.assert_series_equal(analyzed["Accuracy"], cached["Accuracy"])
+
+    print(f"Test records: {len(TEST_DNA)}, distinct packets: {len(set(TEST_DNA))}")
+    print(pd.DataFrame([ { "Case" : "single pass", "Time, s" : exact_time,   "Cached time, s" : single_time,
+                           "Hit rate" : single.cache_hit_rate, "Speedup" : exact_time / single_time },
+                         { "Case" : "replay",      "Time, s" : exact_time,   "Cached time, s" : replay_time,
+                           "Hit rate" : replay.cache_hit_rate, "Speedup" : exact_time / replay_time },
+                         { "Case" : "analyze",     "Time, s" : analyze_time, "Cached time, s" : cached_time,
+                           "Hit rate" : cached["Cache hit rate"].mean(), "Speedup" : analyze_time / cached_time } ])
+            .to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+    This script is using to compare alignment of a large train dataset on the thread pool with the shared memory
+    process pool (see src.shared): encoded sequences are put in shared memory once and workers pull ranges of
+    packets from the task queue. For each backend & number of workers it reports wall time of the threshold
+    (the mean alignment score of train records), speedup against the thread pool with the same number of workers
+    and against one worker of the backend. Sent per worker is the pickled state a worker gets with the 'spawn'
+    start method: all sequences for the process pool, descriptors of shared blocks for the shared one.
+    Thresholds must be the same on all backends.
+
+    Parameters:
+        @dataset:   path to train *.csv dataset
+        @codetable: path to codetable used for encoding
+        @scoring:   scoring of packets (see IDS.SCORINGS)
+        @backends:  execution backends to compare
+        @workers:   numbers of workers
+        @rows:      number of rows taken from the head of the dataset
+        @repeat:    the rows are repeated this many times (millions of records from a small dataset)
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import pickle
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.engine                 import BACKENDS
+from src.ids                    import IDS
+from src.instrument             import set_progress
+from src.shared                 import share, release
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of the shared memory backend against the thread pool.")
+parser.add_argument("--dataset",          type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='batch')
+parser.add_argument("--backends",   "-b", nargs="+", choices=BACKENDS, default=[ 'thread', 'shared' ])
+parser.add_argument("--workers",    "-w", type=int, nargs="+", default=[ 1, 2, 4 ])
+parser.add_argument("--rows",       "-r", type=int, default=100000)
+parser.add_argument("--repeat",           type=int, default=1)
+
+def sent_per_worker(backend : str, state : dict) -> float:
+    """KB of pickled state a spawned worker of the backend gets."""
+    if backend == 'thread' or backend == 'serial':
+        return 0.
+    if backend == 'process':
+        return len(pickle.dumps(state)) / 2**10
+    shared_state, blocks = share(state)
+    try:
+        return len(pickle.dumps(shared_state)) / 2**10
+    finally:
+        release(blocks, unlink=True)
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+
+    with redirect_stdout(None):
+        CODETABLE = JSON_Codetable(args.codetable)
+    DATASET = CSV_Dataset(CSV_Dataset.from_file(args.dataset).head(args.rows))
+    if args.repeat > 1:
+        DATASET = CSV_Dataset(pd.concat([ DATASET ] * args.repeat, ignore_index=True))
+
+    ids = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    with redirect_stdout(None):
+        IDEAL = ids.train(CSV_Dataset(DATASET.head(args.rows)), backend='serial').seq
+    TRAIN_DNA = ids.encode(DATASET)
+    print(f"Records: {len(TRAIN_DNA)}, DNA: {TRAIN_DNA.buffer.nbytes / 2**20:.1f} MB")
+
+    report, thresholds = [], {}
+    for backend in args.backends:
+        sent = sent_per_worker(backend, { "dna_sequences" : TRAIN_DNA })
+        for workers in ([ 1 ] if backend == 'serial' else args.workers):
+            start = perf_counter()
+            threshold = float(ids.get_align_scores(IDEAL, TRAIN_DNA, workers, backend).mean())
+            spent = perf_counter() - start
+            thresholds[(backend, workers)] = threshold
+            report.append({ "Backend"               : backend,
+                            "Workers"               : workers,
+                            "Wall, s"               : spent,
+                            "Sent per worker, KB"   : sent,
+                            "Least busy worker"     : min(ids.utilization["align"]) })
+
+    if not np.allclose(list(thresholds.values()), next(iter(thresholds.values()))):
+        raise Exception(f"Backends give different thresholds: {thresholds}")
+
+    report = pd.DataFrame(report)
+    thread = report[report["Backend"] == 'thread'].set_index("Workers")["Wall, s"]
+    report["Speedup vs thread"] = [ thread.get(workers, np.nan) / wall for workers, wall in zip(report["Workers"], report["Wall, s"]) ]
+    report["Scaling"] = report.groupby("Backend")["Wall, s"].transform("first") / report["Wall, s"]
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+    This script is using to compare IDS with one ideal sequence and MultiSignatureIDS with K signatures:
+    metrics, test time and alignments per packet. Each K is tested with the k-mer lookup of @candidates
+    closest signatures and with all K signatures aligned (candidates = K), to show what the lookup saves.
+
+    Parameters:
+        @train:      path to train *.csv dataset
+        @test:       path to test *.csv dataset (only attack records)
+        @codetable:  path to codetable used for encoding
+        @clusters:   numbers of signatures K to measure
+        @candidates: number of the closest signatures a packet is aligned with
+        @scoring:    scoring of packets (see IDS.SCORINGS)
+        @rows:       number of rows taken from the head of each dataset
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS, MultiSignatureIDS
+from src.instrument             import INSTRUMENTS, set_progress
+from src.utils                  import create_shuffled_test_df
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of multi-signature IDS.")
+parser.add_argument("--train",      type=Path, required=True)
+parser.add_argument("--test",       type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--clusters",   "-k", type=int, nargs="+", default=[2, 4, 8, 16])
+parser.add_argument("--candidates",       type=int, default=2)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='batch')
+parser.add_argument("--rows",       "-r", type=int, default=2000)
+
+def measure(ids : IDS, train_ds : CSV_Dataset, test_ds : CSV_Dataset) -> dict:
+    # Training prints each signature, keep the report readable
+    with redirect_stdout(None):
+        ids.train(train_ds)
+
+    INSTRUMENTS.reset()
+    start   = perf_counter()
+    metrics = ids.test(test_ds)
+    spent   = perf_counter() - start
+    # Single ideal sequence: one alignment per packet
+    alignments = INSTRUMENTS.as_dict()["counters"].get("classify.alignments", len(test_ds))
+
+    return { "Signatures"           : len(ids.signatures) if isinstance(ids, MultiSignatureIDS) else 1,
+             "Candidates"           : ids.candidates if isinstance(ids, MultiSignatureIDS) else 1,
+             "Accuracy"             : metrics.accuracy,
+             "Recall"               : metrics.recall,
+             "Specificity"          : metrics.specificity,
+             "Test time, s"         : spent,
+             "Alignments/packet"    : alignments / len(test_ds) }
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+    INSTRUMENTS.enable()
+
+    CODETABLE = JSON_Codetable(args.codetable)
+    TRAIN_DS  = CSV_Dataset(CSV_Dataset.from_file(args.train).head(args.rows))
+    ATTACK_DS = CSV_Dataset.from_file(args.test).head(args.rows)
+    TEST_DS   = CSV_Dataset(create_shuffled_test_df(ATTACK_DS, TRAIN_DS.copy()))
+    ALIGNER   = IDS.Aligner()
+
+    report = [ measure(IDS(CODETABLE, ALIGNER, args.scoring), TRAIN_DS, TEST_DS) ]
+    for clusters in args.clusters:
+        for candidates in sorted({ min(args.candidates, clusters), clusters }):
+            ids = MultiSignatureIDS(CODETABLE, ALIGNER, args.scoring, clusters=clusters, candidates=candidates)
+            report.append(measure(ids, TRAIN_DS, TEST_DS))
+
+    print(pd.DataFrame(report).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
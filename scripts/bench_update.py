@@ -0,0 +1,96 @@
+"""
+    This script is using to compare updates of a model with new records of normal activity (see IDS.update())
+    with training on all records again. The train dataset is split into an initial part and batches of new records,
+    after each batch the model is updated and a model of all records seen so far is trained again.
+    For each batch it reports time of both ways, whether the ideal sequence was changed by the batch
+    (then all records are aligned again by the update too) and thresholds of both models, which must be the same
+    unless the ideal sequence is kept within a median tolerance (see IDS.update()).
+
+    Parameters:
+        @dataset:   path to train *.csv dataset
+        @codetable: path to codetable used for encoding
+        @scoring:   scoring of packets (see IDS.SCORINGS)
+        @initial:   number of records of the initial model
+        @batch:     number of new records of each update
+        @rows:      number of rows taken from the head of the dataset
+        @tolerance: median tolerance of updates
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import argparse
+import numpy  as np
+import pandas as pd
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.interfaces    import JSON_Codetable
+from src.datasets.csv_ds        import CSV_Dataset
+from src.ids                    import IDS
+from src.instrument             import set_progress
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Benchmark of model updates against training again.")
+parser.add_argument("--dataset",         type=Path, required=True)
+parser.add_argument("--codetable",  "-c", type=Path, required=True)
+parser.add_argument("--scoring",          choices=IDS.SCORINGS, default='batch')
+parser.add_argument("--initial",          type=int, default=5000)
+parser.add_argument("--batch",            type=int, default=1000)
+parser.add_argument("--rows",       "-r", type=int, default=10000)
+parser.add_argument("--tolerance",  "-t", type=float, default=0.)
+
+def chunks_of(dataset : CSV_Dataset, size : int, chunk_size : int):
+    """Returns read_chunks of IDS.update(): chunks of the first @size records of the dataset."""
+    return lambda: (CSV_Dataset(dataset.iloc[start : min(start + chunk_size, size)]) for start in range(0, size, chunk_size))
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    args = parser.parse_args()
+    set_progress(False)
+
+    with redirect_stdout(None):
+        CODETABLE = JSON_Codetable(args.codetable)
+    DATASET = CSV_Dataset(CSV_Dataset.from_file(args.dataset).head(args.rows))
+
+    updated = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+    with redirect_stdout(None):
+        updated.train(CSV_Dataset(DATASET.iloc[:args.initial]))
+
+    report = []
+    for start in range(args.initial, len(DATASET), args.batch):
+        finish   = min(start + args.batch, len(DATASET))
+        previous = str(updated.ideal_sequence.seq)
+        with redirect_stdout(None):
+            spent = perf_counter()
+            updated.update(CSV_Dataset(DATASET.iloc[start : finish]), chunks_of(DATASET, finish, args.batch), tolerance=args.tolerance)
+            update_time, spent = perf_counter() - spent, perf_counter()
+            retrained = IDS(CODETABLE, IDS.Aligner(), args.scoring)
+            retrained.train(CSV_Dataset(DATASET.iloc[:finish]))
+            train_time = perf_counter() - spent
+
+        same = str(updated.ideal_sequence.seq) == str(retrained.ideal_sequence.seq) and \
+               np.isclose(updated.ideal_sequence.threshold, retrained.ideal_sequence.threshold)
+        if not same and not args.tolerance:
+            raise Exception(f"Updated model differs from the trained one after {finish} records")
+        report.append({ "Records"             : finish,
+                        "Ideal changed"       : str(updated.ideal_sequence.seq) != previous,
+                        "Update, s"           : update_time,
+                        "Train again, s"      : train_time,
+                        "Threshold"           : updated.ideal_sequence.threshold,
+                        "Trained threshold"   : retrained.ideal_sequence.threshold })
+
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@
     
     Parameters:
         @dir: directory in which train & test dataset files will be searched
+        @dna_cache: directory of the encoded DNA cache, datasets are encoded once across runs
+        @nested: take train samples as nested prefixes of one permutation and reuse alignment scores
     
     Artifacts:
         This script generate metrics.csv file.
@@ -22,6 +24,8 @@ from Bio     import Align
 #------------------
 parser = argparse.ArgumentParser(description="This script is using to train & test this IDS on different datasets.")
 parser.add_argument("--dir",     "-d", type=Path, required=True)
+parser.add_argument("--dna_cache",     type=Path, required=False, default=None)
+parser.add_argument("--nested",        action='store_true')
 args = parser.parse_args()
 
 DIR         = args.dir
@@ -39,6 +43,7 @@ TRAIN_SIZES = [100, 80, 60, 40, 20, 10]
 syspath.append(path.join(SCRIPT_DIR, ".."))
 from src.datasets.interfaces    import JSON_Codetable
 from src.datasets.csv_ds        import CSV_Dataset  
+from src.datasets.dna_cache     import DNACache
 from src.ids                    import Metrics, IDS
 
 def run_test(TEST_DIR : Path) -> Metrics:
@@ -59,7 +64,9 @@ def run_test(TEST_DIR : Path) -> Metrics:
     ALIGNER.extend_gap_score = -0.5
 
     # Create IDS instance with Codetable & Aligner and calculate testing & training metrics
-    return IDS(JSON_CODES, ALIGNER).analyze(TRAIN_DS, TEST_DS, sizes=TRAIN_SIZES)
+    ids = IDS(JSON_CODES, ALIGNER)
+    ids.dna_cache = DNACache(args.dna_cache) if args.dna_cache else None
+    return ids.analyze(TRAIN_DS, TEST_DS, sizes=TRAIN_SIZES, nested=args.nested)
     
 #-----------------
 # Entry point
@@ -0,0 +1,136 @@
+"""
+    This script is using to load the detection service (run.py serve) without live traffic: it replays records
+    of *.csv datasets over several connections and measures throughput and latency of verdicts.
+    Latency of a record is the time from sending it to receiving its verdict (verdicts come in order of records).
+
+    Parameters:
+        @tcp:         HOST:PORT of the service
+        @unix:        path to Unix socket of the service (instead of --tcp)
+        @files:       *.csv datasets to replay (all datasets in datasets/CSV/IEEE-IoT by default)
+        @connections: number of concurrent connections
+        @records:     number of records sent by each connection (datasets are replayed in a loop)
+        @format:      send records as CSV lines (with a header) or as JSON objects
+        @rate:        records per second of all connections together (0 - as fast as the service accepts them)
+
+    Warning: This script must be located in scripts folder to correct import of IDS modules.
+"""
+import csv
+import json
+import asyncio
+import argparse
+import itertools
+
+from pathlib    import Path
+from os         import path
+from sys        import path as syspath
+from time       import perf_counter
+
+SCRIPT_DIR = Path(path.dirname(path.abspath(__file__)))
+
+# Import IDS modules
+syspath.append(path.join(SCRIPT_DIR, ".."))
+from src.datasets.csv_ds        import CSV_Dataset
+from src.service                import LatencyHistogram
+
+#------------------
+# Argument parsing
+#------------------
+parser = argparse.ArgumentParser(description="Load generator of the detection service.")
+address = parser.add_mutually_exclusive_group(required=True)
+address.add_argument("--tcp",               type=str)
+address.add_argument("--unix",              type=Path)
+parser.add_argument("--files",       "-f",  type=Path, nargs="+",
+                    default=sorted((SCRIPT_DIR / ".." / "datasets" / "CSV" / "IEEE-IoT").rglob("*.csv")))
+parser.add_argument("--connections", "-n",  type=int, default=4)
+parser.add_argument("--records",     "-r",  type=int, default=20000)
+parser.add_argument("--format",             choices=[ 'csv', 'json' ], default='csv')
+parser.add_argument("--rate",               type=float, default=0.)
+
+def read_records(files : list) -> tuple:
+    """Returns (header, rows) of datasets which have the header of the first one."""
+    header, rows = None, []
+    for file in files:
+        with open(file, newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            file_header = next(reader, None)
+            if header is None:
+                header = file_header
+            if file_header == header:
+                rows.extend(row for row in reader if row)
+    if not rows:
+        raise Exception(f"No records in {[ str(file) for file in files ]}")
+    return header, rows
+
+def as_json(header : list, row : list) -> str:
+    """Numbers are sent as JSON numbers, hex fields & text as strings, empty values are left out."""
+    record = {}
+    for field, value in zip(header, row):
+        if value == '':
+            continue
+        try:
+            record[field] = value if field in CSV_Dataset.HEX_FIELDS else json.loads(value)
+        except ValueError:
+            record[field] = value
+    return json.dumps(record)
+
+async def connection(args, header : list, rows : list, offset : int, latency : LatencyHistogram, stats : dict) -> None:
+    if args.unix is not None:
+        reader, writer = await asyncio.open_unix_connection(str(args.unix))
+    else:
+        host, port = args.tcp.rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+
+    sent  = []
+    lines = itertools.islice(itertools.cycle(rows), offset, offset + args.records)
+
+    async def send():
+        if args.format == 'csv':
+            writer.write((','.join(header) + '\n').encode())
+        interval = args.connections / args.rate if args.rate else 0.
+        start    = perf_counter()
+        for n, row in enumerate(lines):
+            line = as_json(header, row) if args.format == 'json' else ','.join(row)
+            writer.write((line + '\n').encode())
+            sent.append(perf_counter())
+            # The service stops reading when it is overloaded, drain() waits for it
+            await writer.drain()
+            if interval:
+                await asyncio.sleep(max(0., start + (n + 1) * interval - perf_counter()))
+        writer.write_eof()
+
+    async def receive():
+        received = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            latency.add(perf_counter() - sent[received])
+            received += 1
+            verdict = json.loads(line)["verdict"] if args.format == 'json' else line.decode().strip().split(',')[1]
+            stats[verdict] = stats.get(verdict, 0) + 1
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+
+async def run(args) -> None:
+    header, rows = read_records(args.files)
+    latency, stats = LatencyHistogram(), {}
+
+    start = perf_counter()
+    await asyncio.gather(*[ connection(args, header, rows, n * len(rows) // args.connections, latency, stats)
+                            for n in range(args.connections) ])
+    spent = perf_counter() - start
+
+    print(f"Records        : {args.connections} x {args.records} ({args.format}) from {len(rows)} replayed rows")
+    print(f"Verdicts       : {stats}")
+    print(f"Throughput     : {latency.count / spent:.0f} records/s ({spent:.2f} s)")
+    print(f"Latency        : p50 {latency.percentile(50) * 1e3:.2f} ms, p99 {latency.percentile(99) * 1e3:.2f} ms")
+
+#-----------------
+# Entry point
+#-----------------
+def main():
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
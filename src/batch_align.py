@@ -0,0 +1,393 @@
+"""
+    Batched one-vs-many alignment scoring.
+
+    The ideal sequence (query) is fixed for the whole run, so its profile is computed once
+    and whole arrays of encoded packets are scored at once. The dynamic programming is the
+    Gotoh algorithm (affine gaps) evaluated row by row over the query: each row is a few NumPy
+    operations over (sequence position x batch). The gap state along a row is a running maximum,
+    so it is computed with shifted maximums instead of a per-cell loop.
+
+    When gaps are free and mismatches are not rewarded (the 'Smith-Waterman' configuration of
+    IDS.Aligner), the score is match * LCS(query, sequence). In this case the bit-parallel LCS
+    algorithm (Hyyro, 2004) is used: the query profile is a bit mask of query positions for each
+    symbol, and each sequence symbol updates the whole DP column with a few word operations.
+
+    Scores are the same as PairwiseAligner.score() gives for the supported configurations:
+    match/mismatch scores, the same gap scores for all gap kinds, 'local' or 'global' mode.
+
+    Classification against a threshold does not need the exact score. BatchScorer.classify()
+    drops a sequence from the batch as soon as bounds of its final score show on which side of
+    the threshold it is, and optionally restricts the DP to a diagonal band.
+"""
+
+import numpy as np
+
+from Bio                     import Align
+from .datasets.dna_batch     import DNABatch
+
+class BatchScorer:
+    """
+        Scores many sequences against one query sequence in a single call:
+
+            scorer  = BatchScorer(aligner, ideal_seq.seq)
+            scores  = scorer.score(["ABC...", "ABD...", ...])
+            attacks = scorer.classify(["ABC...", "ABD...", ...], ideal_seq.threshold, band=8)
+
+        Sequences are a list of str or a DNABatch (of letters or of integer codes).
+    """
+    # Gap attributes of PairwiseAligner which must be equal to open/extend gap scores
+    OPEN_GAP_ATTRS   = [ f"{seq}_{pos}_open_gap_score"   for seq in ("target", "query") for pos in ("internal", "left", "right") ]
+    EXTEND_GAP_ATTRS = [ f"{seq}_{pos}_extend_gap_score" for seq in ("target", "query") for pos in ("internal", "left", "right") ]
+
+    # Number of sequences aligned in one NumPy pass. Bounds memory usage of the DP.
+    CHUNK_SIZE = 1024
+
+    # Early termination: bounds are checked every CHECK_INTERVAL DP rows (columns for LCS),
+    # decided sequences are removed once they are at least DROP_FRACTION of the batch.
+    CHECK_INTERVAL = 8
+    DROP_FRACTION  = 0.25
+
+    _query    = None
+    _tables   = None
+
+    query = property()
+
+    def __init__(self, aligner : Align.PairwiseAligner, query):
+        if not BatchScorer.supports(aligner):
+            raise Exception(f"Aligner configuration is not supported by BatchScorer:\n{aligner}")
+
+        self.local      = aligner.mode == 'local'
+        self.match      = float(aligner.match_score)
+        self.mismatch   = float(aligner.mismatch_score)
+        self.open_gap   = float(aligner.open_gap_score)
+        self.extend_gap = float(aligner.extend_gap_score)
+
+        self._query  = str(query)
+        self._tables = {}
+
+    @query.getter
+    def query(self):
+        return self._query
+
+    def _query_tables(self, sequences) -> tuple:
+        """
+            Returns (query codes, profile, bitmasks) in the code space of sequences: byte values of letters
+            for str sequences, integer codes of the alphabet for a DNABatch of codes. Tables are built once per alphabet.
+        """
+        alphabet = sequences.alphabet if isinstance(sequences, DNABatch) else None
+        if alphabet not in self._tables:
+            if alphabet is None:
+                query_codes = self._query.encode('ascii')
+            else:
+                # A query letter out of the alphabet matches nothing, 255 is never a code of the alphabet
+                letters     = { letter : code + 1 for code, letter in enumerate(alphabet) }
+                query_codes = bytes(letters.get(letter, 255) for letter in self._query)
+            codes = np.frombuffer(query_codes, dtype=np.uint8)
+
+            # Query profile: score of each query position against each code.
+            # Row i + 1 corresponds to query[i], row 0 is unused (DP boundary).
+            profile = np.full((len(self._query) + 1, 256), self.mismatch)
+            profile[np.arange(1, len(self._query) + 1), codes] = self.match
+
+            # Bit-parallel profile: bit (i % 64) of word (i // 64) of mask[c] is set if query[i] == c
+            bitmasks = None
+            if self.is_lcs:
+                words    = max(1, (len(self._query) + 63) // 64)
+                bitmasks = np.zeros((words, 256), dtype=np.uint64)
+                for i, code in enumerate(codes):
+                    bitmasks[i // 64, code] |= np.uint64(1) << np.uint64(i % 64)
+
+            self._tables[alphabet] = (query_codes, profile, bitmasks)
+        return self._tables[alphabet]
+
+    @property
+    def is_lcs(self) -> bool:
+        """Score reduces to match * LCS: gaps are free and mismatches are not better than gaps."""
+        return self.open_gap == 0 and self.extend_gap == 0 and self.mismatch <= 0 < self.match
+
+    @property
+    def is_bounded(self) -> bool:
+        """Score bounds used by early termination are valid only if gaps never add to the score."""
+        return self.open_gap <= 0 and self.extend_gap <= 0
+
+    @staticmethod
+    def supports(aligner : Align.PairwiseAligner) -> bool:
+        """Checks if scores of the aligner can be reproduced by BatchScorer."""
+        try:
+            if aligner.substitution_matrix is not None or aligner.wildcard is not None:
+                return False
+            open_gaps   = { getattr(aligner, attr) for attr in BatchScorer.OPEN_GAP_ATTRS }
+            extend_gaps = { getattr(aligner, attr) for attr in BatchScorer.EXTEND_GAP_ATTRS }
+        except (AttributeError, ValueError):
+            return False
+        return len(open_gaps) == 1 and len(extend_gaps) == 1 and aligner.mode in ('local', 'global')
+
+    def score(self, sequences) -> np.ndarray:
+        """Returns array of alignment scores of the query with each of sequences."""
+        return self._by_chunks(sequences, np.float64,
+                               lambda chunk: self._lcs_chunk(chunk) if self.is_lcs else self._dp_chunk(chunk))
+
+    def classify(self, sequences, threshold : float, band : int = None) -> np.ndarray:
+        """
+            Returns boolean array: True if alignment score of the sequence is below threshold.
+            Alignment of a sequence stops as soon as the outcome is certain.
+                @band - if set, only cells with |i - j| <= band are aligned. In 'global' mode
+                        the band is widened to |len(seq) - len(query)| to reach the last cell.
+                        Such banded score can be lower than the exact one.
+        """
+        if self.is_lcs and band is None:
+            return self._by_chunks(sequences, bool, lambda chunk: self._lcs_chunk(chunk, threshold))
+        return self._by_chunks(sequences, bool, lambda chunk: self._dp_chunk(chunk, threshold, band))
+
+    def _by_chunks(self, sequences, dtype, func) -> np.ndarray:
+        """
+            Applies func to chunks of sequences and returns results in the input order.
+            Sequences are chunked in order of their length, so chunks need little padding
+            and bands of a chunk are about the same width.
+        """
+        if isinstance(sequences, DNABatch):
+            # Chunks are gathered from the buffer, sequences never become strings
+            lengths, take = sequences.lengths, sequences.take
+        else:
+            sequences = [ str(seq) for seq in sequences ]
+            lengths   = [ len(seq) for seq in sequences ]
+            take      = lambda indices: [ sequences[i] for i in indices ]
+        order     = np.argsort(lengths, kind='stable')
+        result    = np.empty(len(sequences), dtype=dtype)
+        for start in range(0, len(sequences), self.CHUNK_SIZE):
+            chunk_order = order[start : start + self.CHUNK_SIZE]
+            result[chunk_order] = func(take(chunk_order))
+        return result
+
+    @staticmethod
+    def _as_codes(sequences : list) -> tuple:
+        """Returns (codes, lengths): sequences as rows of byte codes padded with zeros to the longest one."""
+        if isinstance(sequences, DNABatch):
+            return sequences.codes()
+        lengths = np.array([ len(seq) for seq in sequences ], dtype=np.int64)
+        codes   = np.zeros((len(sequences), int(lengths.max()) if len(sequences) else 0), dtype=np.uint8)
+        for row, seq in enumerate(sequences):
+            codes[row, : len(seq)] = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+        return codes, lengths
+
+    @staticmethod
+    def _popcount(words : np.ndarray) -> np.ndarray:
+        return np.unpackbits(np.ascontiguousarray(words).view(np.uint8).reshape(words.shape[0], 8), axis=1).sum(axis=1).astype(np.int64)
+
+    def _lcs(self, V : np.ndarray) -> np.ndarray:
+        """LCS is the number of zero bits among the first len(query) bits of the column."""
+        m, ONE = len(self._query), np.uint64(1)
+        zeros  = np.zeros(V.shape[1], dtype=np.int64)
+        for w in range(V.shape[0]):
+            bits = min(64, m - 64 * w)
+            if bits <= 0:
+                break
+            word   = V[w] if bits == 64 else V[w] & ((ONE << np.uint64(bits)) - ONE)
+            zeros += bits - self._popcount(word)
+        return zeros
+
+    def _lcs_chunk(self, sequences : list, threshold : float = None) -> np.ndarray:
+        """Scores (or classifies, if threshold is set) a chunk with the bit-parallel LCS."""
+        codes, lengths = self._as_codes(sequences)
+        bitmasks       = self._query_tables(sequences)[2]
+        words, batch   = bitmasks.shape[0], len(sequences)
+
+        # Zero bytes of padding have an empty mask, so they leave the column unchanged
+        ONE, ALL = np.uint64(1), np.uint64(0xFFFFFFFFFFFFFFFF)
+        V = np.full((words, batch), ALL)
+
+        # Sequences of the batch which are still aligned and their verdicts
+        active, below = np.arange(batch), np.zeros(batch, dtype=bool)
+
+        for j in range(codes.shape[1]):
+            U     = V & bitmasks[:, codes[:, j]]
+            carry = np.zeros(V.shape[1], dtype=np.uint64)
+            for w in range(words):
+                total    = V[w] + U[w] + carry
+                carry    = ((total < V[w]) | ((carry == ONE) & (total == V[w]))).astype(np.uint64)
+                V[w]     = total | (V[w] & ~U[w])
+
+            if threshold is not None and (j + 1) % self.CHECK_INTERVAL == 0:
+                # Each of the remaining symbols adds at most one to the LCS
+                lcs     = self._lcs(V)
+                reached = lcs * self.match >= threshold
+                hopeless = (lcs + np.maximum(lengths - (j + 1), 0)) * self.match < threshold
+                decided = reached | hopeless
+                if decided.sum() >= self.DROP_FRACTION * len(active):
+                    below[active[hopeless]] = True
+                    keep = ~decided
+                    active, codes, lengths, V = active[keep], codes[keep], lengths[keep], V[:, keep]
+                    if not len(active):
+                        return below
+
+        if threshold is None:
+            return self.match * self._lcs(V)
+        below[active] = self.match * self._lcs(V) < threshold
+        return below
+
+    def _dp_chunk(self, sequences : list, threshold : float = None, band : int = None) -> np.ndarray:
+        """Scores (or classifies, if threshold is set) a chunk with the Gotoh DP."""
+        m, batch = len(self._query), len(sequences)
+        # DP rows are stored transposed: (sequence position j, batch), so every
+        # operation along a row runs over contiguous memory of the whole batch.
+        # Padding never influences cells inside a sequence, DP only looks back.
+        codes, lengths = self._as_codes(sequences)
+        codes, n = codes.T, codes.shape[1]
+
+        NEG, OPEN, EXTEND = -np.inf, self.open_gap, self.extend_gap
+        dtype   = self._dp_dtype(m + n)
+        columns = np.arange(n + 1, dtype=dtype)[:, None]
+
+        # Iy (gap in query) is opened from M or Ix of the same row, so it is a running maximum:
+        #   Iy[j] = max over k < j of (max(M, Ix)[k] + OPEN + (j - 1 - k) * EXTEND)
+        to_prefix   = OPEN - columns[:-1] * EXTEND
+        from_prefix = (columns[1:] - 1) * EXTEND
+
+        # Band of a global alignment always contains the last cell (m, len(seq)).
+        # The DP of a row only visits the window of columns covering the widest band.
+        if band is None:
+            widths, W = None, max(m, n)
+        else:
+            widths = np.full(batch, band) if self.local else np.maximum(band, np.abs(lengths - m))
+            W      = int(widths.max()) if batch else 0
+            # Cells outside of the window are never computed, so only narrower bands need masks
+            if not batch or widths.min() == W:
+                widths = None
+
+        # Substitution scores of the chunk for each distinct symbol of the query
+        query_codes, profile, _ = self._query_tables(sequences)
+        positions    = { code : i for i, code in enumerate(query_codes) }
+        substitution = { code : profile[i + 1].astype(dtype)[codes] for code, i in positions.items() }
+
+        # M - ends with (mis)match, Ix - ends with gap in sequence, Iy - ends with gap in query.
+        # Each array holds one DP row (query position i) for all sequences of the batch.
+        # Rows are updated in place, H = max(M, Ix, Iy) is the best score of each cell.
+        M, Ix, Iy, H, tmp = (np.full((n + 1, batch), NEG, dtype=dtype) for _ in range(5))
+        best = np.zeros(batch, dtype=dtype) if self.local else None
+        if not self.local:
+            M[0] = 0.
+            Iy[1 : W + 1] = OPEN + from_prefix[: W]
+            if widths is not None:
+                first_row = Iy[: min(W, n) + 1]
+                np.putmask(first_row, np.arange(first_row.shape[0])[:, None] > widths[None, :], NEG)
+        np.maximum(M, Iy, out=H)
+
+        # Cells in padding can only outscore real ones if something scores above zero
+        masked = self.local and max(self.mismatch, OPEN, EXTEND) > 0
+
+        # Sequences of the batch which are still aligned and their verdicts
+        active, below = np.arange(batch), np.zeros(batch, dtype=bool)
+        early_stop    = threshold is not None and self.is_bounded
+
+        for i in range(1, m + 1):
+            lo, hi = max(0, i - W), min(n, i + W)
+            rows   = slice(lo, hi + 1)
+
+            # Ix[i] = max(M[i-1] + OPEN, Iy[i-1] + OPEN, Ix[i-1] + EXTEND)
+            np.maximum(M[rows], Iy[rows], out=tmp[rows])
+            tmp[rows] += OPEN
+            Ix[rows]  += EXTEND
+            np.maximum(Ix[rows], tmp[rows], out=Ix[rows])
+            M[0] = NEG
+
+            # M[i][j] = H[i-1][j-1] + substitution score
+            first = max(lo, 1)
+            if first <= hi:
+                diag = H[first - 1 : hi]
+                if self.local:
+                    np.maximum(diag, 0., out=diag)
+                np.add(diag, substitution[query_codes[i - 1]][first - 1 : hi], out=M[first : hi + 1])
+
+            if widths is not None:
+                outside = np.abs(np.arange(lo, hi + 1)[:, None] - i) > widths[None, :]
+                np.putmask(M[rows], outside, NEG)
+                np.putmask(Ix[rows], outside, NEG)
+
+            # Iy[i][j] = running maximum over the row
+            np.maximum(M[rows], Ix[rows], out=H[rows])
+            if hi > lo:
+                np.add(H[lo : hi], to_prefix[lo : hi], out=tmp[lo + 1 : hi + 1])
+                self._prefix_max(tmp[lo + 1 : hi + 1])
+                np.add(tmp[lo + 1 : hi + 1], from_prefix[lo : hi], out=Iy[lo + 1 : hi + 1])
+            Iy[lo] = NEG
+            if widths is not None:
+                np.putmask(Iy[rows], outside, NEG)
+
+            np.maximum(H[rows], Iy[rows], out=H[rows])
+            if self.local:
+                if masked:
+                    np.putmask(H[rows], np.arange(lo, hi + 1)[:, None] > lengths[None, :], NEG)
+                np.maximum(best, H[rows].max(axis=0), out=best)
+
+            if early_stop and i < m and i % self.CHECK_INTERVAL == 0:
+                lower, upper = self._bounds(H[rows], best, lo, i, lengths)
+                reached, hopeless = lower >= threshold, upper < threshold
+                decided = reached | hopeless
+                if decided.sum() >= self.DROP_FRACTION * len(active):
+                    below[active[hopeless]] = True
+                    keep   = ~decided
+                    active, lengths = active[keep], lengths[keep]
+                    M, Ix, Iy, H, tmp = M[:, keep], Ix[:, keep], Iy[:, keep], H[:, keep], tmp[:, keep]
+                    substitution = { code : scores[:, keep] for code, scores in substitution.items() }
+                    best   = best[keep]   if best   is not None else None
+                    widths = widths[keep] if widths is not None else None
+                    if not len(active):
+                        return below
+
+        if self.local:
+            scores = best.astype(np.float64)
+        else:
+            # Global score is the last cell (m, len(seq)) of each sequence
+            scores = H[lengths, np.arange(len(active))].astype(np.float64)
+
+        if threshold is None:
+            return scores
+        below[active] = scores < threshold
+        return below
+
+    def _bounds(self, H : np.ndarray, best : np.ndarray, lo : int, i : int, lengths : np.ndarray) -> tuple:
+        """
+            Returns (lower, upper) bounds of the final scores after DP row i.
+            H holds the row for the window of columns starting at lo.
+            Every alignment passes row i at some cell (i, j), the rest of it is at most
+            min(rows, columns left) (mis)matches plus the gaps needed to reach the last cell.
+        """
+        j         = np.arange(lo, lo + H.shape[0])[:, None]
+        rows_left = len(self._query) - i
+        cols_left = lengths[None, :] - j
+        diagonal  = np.minimum(rows_left, cols_left)
+        gaps      = np.abs(rows_left - cols_left)
+        valid     = cols_left >= 0
+
+        if self.local:
+            # A local alignment may end anywhere, so the best score so far is a lower bound
+            gain  = np.maximum(H, 0.) + np.maximum(diagonal, 0) * max(self.match, 0.)
+            upper = np.maximum(best, np.where(valid, gain, -np.inf).max(axis=0))
+            return best, upper
+
+        gain  = H + diagonal * max(self.match, self.mismatch, 0.) + gaps * max(self.open_gap, self.extend_gap)
+        upper = np.where(valid, gain, -np.inf).max(axis=0)
+        # One concrete alignment: diagonal to the end, then one gap run to the last cell
+        run   = np.where(gaps > 0, min(self.open_gap, self.extend_gap) + (gaps - 1) * self.extend_gap, 0.)
+        path  = H + diagonal * min(self.match, self.mismatch) + run
+        lower = np.where(valid, path, -np.inf).max(axis=0)
+        return lower, upper
+
+    def _dp_dtype(self, cells : int):
+        """
+            float32 halves memory traffic of the DP, but it is used only when it is exact:
+            all scores are multiples of 1/16 and no path can grow beyond 2^19 in magnitude.
+        """
+        scores = [ self.match, self.mismatch, self.open_gap, self.extend_gap ]
+        if all((score * 16).is_integer() for score in scores) and \
+                cells * max(abs(score) for score in scores) < 2 ** 19:
+            return np.float32
+        return np.float64
+
+    @staticmethod
+    def _prefix_max(rows : np.ndarray) -> None:
+        """In-place running maximum along the first axis with log2(len) shifted maximums."""
+        shift = 1
+        while shift < rows.shape[0]:
+            np.maximum(rows[shift:], rows[:-shift], out=rows[shift:])
+            shift *= 2
@@ -0,0 +1,128 @@
+"""
+    Persistent columnar cache of parsed CSV datasets.
+
+    Parsing a CSV file (text parsing, filling of missed values, hex decoding) takes much longer than
+    reading the same columns in binary form. The cache keeps parsed datasets as one *.npy file per column,
+    so the next load is a few np.load() calls. An entry belongs to a source file and is valid while size
+    and modification time of the file are the same, an edited file simply misses the cache.
+
+    Files of an entry:
+        meta.json          - source size & mtime, number of rows, name, dtype & storage of each column
+        <n>.npy            - numeric column n (in order of columns)
+        <n>.codes.npy      - other columns are factorized: codes of values of each row
+        <n>.values.npy       and distinct values (pickled objects)
+
+    meta.json is written last, so a partially written entry is never used.
+"""
+
+import os
+import json
+import numpy  as np
+import pandas as pd
+
+from hashlib         import sha256
+from pathlib         import Path
+
+class CSVCache:
+    # Version of parsing, entries written by another version are parsed again
+    VERSION = 1
+
+    _dir = None
+
+    directory = property()
+    hits      = property()
+    misses    = property()
+
+    def __init__(self, directory : Path):
+        self._dir = Path(directory)
+        self._hits, self._misses = 0, 0
+
+    @directory.getter
+    def directory(self):
+        return self._dir
+    @hits.getter
+    def hits(self):
+        return self._hits
+    @misses.getter
+    def misses(self):
+        return self._misses
+
+    def load(self, path : Path, columns : list = None) -> pd.DataFrame:
+        """
+            Returns the parsed dataset of the file or None if it is not cached.
+                @columns - load only these columns (in order of the file)
+        """
+        entry, source = self._entry(path), self._source(path)
+        try:
+            with (entry / "meta.json").open("r") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            meta = None
+
+        if meta is None or meta["version"] != CSVCache.VERSION or meta["source"] != source:
+            self._misses += 1
+            return None
+
+        names = [ name for name, _, _ in meta["columns"] ]
+        if columns is not None:
+            unknown = set(columns) - set(names)
+            if unknown:
+                raise Exception(f"Columns are not in the dataset: {sorted(unknown)}")
+        try:
+            frame = { name : self._load_column(entry, n, dtype, factorized)
+                        for n, (name, dtype, factorized) in enumerate(meta["columns"]) if columns is None or name in columns }
+        except (OSError, ValueError):
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        return pd.DataFrame(frame, index=pd.RangeIndex(meta["rows"]))
+
+    def store(self, path : Path, df : pd.DataFrame) -> None:
+        """Puts the parsed dataset of the file into the cache. Each file is written aside and then atomically replaced."""
+        entry = self._entry(path)
+        entry.mkdir(parents=True, exist_ok=True)
+
+        columns = []
+        for n, name in enumerate(df.columns):
+            column     = df[name]
+            factorized = not (isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iufb')
+            if not factorized:
+                self._save(entry / f"{n}.npy", column.to_numpy())
+            else:
+                codes, values = pd.factorize(column, use_na_sentinel=False)
+                self._save(entry / f"{n}.codes.npy",  codes.astype(np.int32 if len(values) < 2 ** 31 else np.int64))
+                self._save(entry / f"{n}.values.npy", np.asarray(values, dtype=object))
+            columns.append([ str(name), str(column.dtype), factorized ])
+
+        meta = { "version" : CSVCache.VERSION,
+                 "source"  : self._source(path),
+                 "rows"    : len(df),
+                 "columns" : columns }
+        tmp = entry / f"meta.json.{os.getpid()}.tmp"
+        with tmp.open("w") as meta_file:
+            json.dump(meta, meta_file, indent=4)
+        os.replace(tmp, entry / "meta.json")
+
+    def _entry(self, path : Path) -> Path:
+        return self._dir / sha256(str(Path(path).resolve()).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _source(path : Path) -> list:
+        stat = Path(path).stat()
+        return [ stat.st_size, stat.st_mtime_ns ]
+
+    @staticmethod
+    def _load_column(entry : Path, n : int, dtype : str, factorized : bool) -> pd.Series:
+        if not factorized:
+            return pd.Series(np.load(entry / f"{n}.npy"))
+        codes  = np.load(entry / f"{n}.codes.npy")
+        values = np.load(entry / f"{n}.values.npy", allow_pickle=True)
+        return pd.Series(values.take(codes), dtype=dtype)
+
+    @staticmethod
+    def _save(path : Path, array : np.ndarray) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as tmp_file:
+            np.save(tmp_file, array, allow_pickle=(array.dtype == object))
+        os.replace(tmp, path)
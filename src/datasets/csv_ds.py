@@ -5,9 +5,12 @@
 import pandas as pd
 import numpy  as np
 
-from tqdm import tqdm
-
 from .interfaces     import JSON_Codetable, Dataset, DatasetRecord
+from .dna_cache      import DNACache
+from .csv_cache      import CSVCache
+from .dna_batch      import DNABatch
+from .quantiles      import ExactQuantiles
+from ..instrument    import INSTRUMENTS, progress as progress_bar
 from ..utils         import normalize_df
 from pathlib         import Path
 from numpy           import array as numpy_array
@@ -18,64 +21,405 @@ from Bio.SeqRecord   import SeqRecord
 class CSV_Dataset(Dataset):
     FLOAT_FIELDS = [ 'tcp.time_delta' ]
 
+    # str() of a float switches to the exponent notation from this magnitude (e.g. '1e+16')
+    FLOAT_DIGITS_LIMIT = 1e16
+
+    # Types of fields at parse time. Integer fields are left to the C parser: they may have empty cells,
+    # int64 can not hold NaN and the nullable Int64 parser is several times slower
+    READ_TYPES = { 'tcp.time_delta' : 'float64',
+                   'tcp.flags'      : str,
+                   'tcp.options'    : str }
+
+    # Types of parsed fields, hex fields are decoded into integers after that
+    FIELD_TYPES = { 'tcp.len'               : int,
+                    'tcp.time_delta'        : 'float64',
+                    'tcp.seq_raw'           : 'int64',
+                    'tcp.ack_raw'           : 'int64',
+                    'tcp.hdr_len'           : 'int64',
+                    'tcp.flags'             : str,
+                    'tcp.window_size_value' : int,
+                    'tcp.checksum.status'   : int,
+                    'tcp.urgent_pointer'    : int,
+                    'tcp.options'           : str }
+
+    # Hex fields and the value which stands for a missed one
+    HEX_FIELDS = { 'tcp.flags' : None, 'tcp.options' : '<MISSING>' }
+
+    # Hex numbers up to this many digits are decoded with NumPy, longer ones with int()
+    HEX_DIGITS = 15
+
     @staticmethod
-    def from_file(path : Path):
-        df = pd.read_csv(path, low_memory=False).fillna(0).astype({'tcp.len' : int, 
-                                                'tcp.time_delta' : 'float64',
-                                                'tcp.seq_raw' : 'int64',
-                                                'tcp.ack_raw' : 'int64',
-                                                'tcp.hdr_len' : 'int64',
-                                                'tcp.flags'   : str,
-                                                'tcp.window_size_value' : int,
-                                                'tcp.checksum.status' : int,
-                                                'tcp.urgent_pointer' : int,
-                                                'tcp.options' : str})
-        
-        df['tcp.flags']   = df['tcp.flags'].apply(lambda x : int(x, 16))
-        df['tcp.options'] = df['tcp.options'].apply(lambda x : int(x, 16) if x != '<MISSING>' else 0)
-                
+    def from_file(path : Path, columns : list = None, chunk_size : int = None, cache : CSVCache = None):
+        """
+            @columns    - load only these columns (they are kept in order of the file)
+            @chunk_size - parse the file by chunks of this many lines, so text of the whole file is never parsed at once
+            @cache      - columnar cache of parsed files, a cached file is loaded without parsing
+        """
+        if cache is not None:
+            with INSTRUMENTS.stage("load.cache"):
+                df = cache.load(path, columns)
+            if df is not None:
+                INSTRUMENTS.count("load.rows", len(df))
+                return CSV_Dataset(df)
+
+            # The whole file is cached, so any projection of it can be loaded later
+            dataset = CSV_Dataset.from_file(path, chunk_size=chunk_size)
+            with INSTRUMENTS.stage("load.cache"):
+                cache.store(path, dataset)
+            return dataset if columns is None else CSV_Dataset(dataset[[ column for column in dataset if column in columns ]])
+
+        if chunk_size is not None:
+            chunks = list(CSV_Dataset.read_chunks(path, chunk_size, columns))
+            if not chunks:
+                return CSV_Dataset.from_file(path, columns)
+            df = pd.concat(chunks)
+            # A hex field is an object column in chunks with big numbers, int64 in other ones
+            hex_fields = [ field for field in CSV_Dataset.HEX_FIELDS if field in df ]
+            df[hex_fields] = df[hex_fields].infer_objects()
+            return CSV_Dataset(df)
+
+        with INSTRUMENTS.stage("load.read_csv"):
+            df = pd.read_csv(path, dtype=CSV_Dataset.READ_TYPES, usecols=columns, low_memory=False)
+        return CSV_Dataset.from_frame(df)
+
+    @staticmethod
+    def read_chunks(path : Path, chunk_size : int, columns : list = None):
+        """Yields parsed datasets of chunk_size lines of the file, indexed like from_file() indexes them."""
+        with INSTRUMENTS.stage("load.read_csv"):
+            reader = pd.read_csv(path, dtype=CSV_Dataset.READ_TYPES, usecols=columns, chunksize=chunk_size)
+        with reader:
+            while True:
+                with INSTRUMENTS.stage("load.read_csv"):
+                    df = next(reader, None)
+                if df is None:
+                    return
+                yield CSV_Dataset.from_frame(df)
+
+    @staticmethod
+    def from_frame(df : pd.DataFrame):
+        """
+            Parses raw CSV records (e.g. a chunk of a stream) the same way as from_file() does.
+            Fields which are not in the frame are skipped.
+        """
+        with INSTRUMENTS.stage("load.parse_fields"):
+            df = df.fillna(0).astype({ field : dtype for field, dtype in CSV_Dataset.FIELD_TYPES.items() if field in df })
+
+        with INSTRUMENTS.stage("load.parse_hex"):
+            for field, missing in CSV_Dataset.HEX_FIELDS.items():
+                if field in df:
+                    df[field] = CSV_Dataset._parse_hex(df[field], missing)
+
+        INSTRUMENTS.count("load.rows", len(df))
         return CSV_Dataset(df)
 
+    @staticmethod
+    def _parse_hex(field : pd.Series, missing : str = None) -> pd.Series:
+        """
+            Decodes hex strings of the field into integers, the same ones int(x, 16) gives.
+            Captures repeat a few distinct values, so each distinct value is decoded once and the results
+            are taken back by codes. Values of up to HEX_DIGITS digits are decoded with NumPy, other ones with int().
+                @missing - value which stands for a missed number, it is decoded as 0
+        """
+        codes, uniques = pd.factorize(field)
+        uniques = pd.Series(uniques, dtype=object).astype(str)
+        simple  = uniques.str.fullmatch(f"(0[xX])?[0-9a-fA-F]{{1,{CSV_Dataset.HEX_DIGITS}}}").to_numpy(dtype=bool)
+        values  = CSV_Dataset._hex_values(uniques[simple].str.replace("^0[xX]", "", regex=True).tolist())
+
+        if simple.all():
+            decoded = values
+        else:
+            decoded = np.empty(len(uniques), dtype=object)
+            decoded[simple]  = values.tolist()
+            decoded[~simple] = [ 0 if unique == missing else int(unique, 16) for unique in uniques[~simple] ]
+            # int64 if all numbers fit into it, Python integers otherwise
+            decoded = pd.Series(decoded.tolist()).to_numpy()
+        return pd.Series(decoded[codes], index=field.index, name=field.name)
+
+    @staticmethod
+    def _hex_values(digits : list) -> np.ndarray:
+        """Decodes hex digit strings (without prefix, at most 15 digits) into int64 with a lookup table of literals."""
+        if not digits:
+            return np.zeros(0, dtype=np.int64)
+        table = np.zeros(256, dtype=np.int64)
+        for value, literal in enumerate("0123456789abcdef"):
+            table[ord(literal)] = table[ord(literal.upper())] = value
+
+        matrix  = np.array(digits, dtype=bytes)
+        matrix  = matrix.view(np.uint8).reshape(len(digits), matrix.dtype.itemsize)
+        lengths = (matrix != 0).sum(axis=1)
+        values  = np.zeros(len(digits), dtype=np.int64)
+        for column in range(matrix.shape[1]):
+            values = np.where(column < lengths, values * 16 + table[matrix[:, column]], values)
+        return values
+
+    def labeled(self, label : str):
+        """
+            Returns the dataset with the label column: encoders take the last column as the label, so a dataset
+            without one (e.g. a raw capture) gets @label for all records instead of losing its last field.
+        """
+        if "label" in self.columns:
+            return self
+        dataset = CSV_Dataset(self.copy())
+        dataset["label"] = label
+        return dataset
+
     def raw_index(self, index):
         relative_indexes = self.index
         absolute_index   = relative_indexes[index]
         return CSV_DatasetRecord(numpy_array(self.loc[absolute_index, :].tolist()))
         
     def get_median(self):
+        columns = [ column for column in self if column != "label" ]
+        return CSV_Dataset.median_record({ column : self[column].median() for column in columns })
+
+    @staticmethod
+    def median_of_chunks(chunks, quantiles = None):
+        """
+            Returns the median record of a dataset read by chunks (see read_chunks()) in one pass,
+            only @quantiles are kept in memory, not the chunks.
+                @quantiles - ExactQuantiles (by default) or TDigestQuantiles for bounded memory
+        """
+        quantiles = quantiles if quantiles is not None else ExactQuantiles()
+        with INSTRUMENTS.stage("train.median"):
+            for chunk in chunks:
+                quantiles.update(chunk)
+                INSTRUMENTS.count("train.median.rows", len(chunk))
+            return CSV_Dataset.median_record(quantiles.median())
+
+    @staticmethod
+    def median_record(medians : dict):
+        """Formats column -> median of each field (except the label) into a record, as get_median() does it."""
         def value_to_str(value, column):
             if column in CSV_Dataset.FLOAT_FIELDS:
                 return str(round(value, 6))
             else:
                 return str(int(value))
-            
-        columns    = [ column for column in self if column != "label" ]
-        median_row = [ value_to_str(self[column].median(), column) for column in columns ]
+
+        median_row = [ value_to_str(value, column) for column, value in medians.items() if column != "label" ]
         median_row += [ 'median' ]
         return CSV_DatasetRecord(median_row)
 
-    def as_DNA_records(self, codetable : JSON_Codetable) -> pd.Series:
-        result = []
-        for id, row in tqdm(self.iterrows(), total=self.shape[0], desc='Encoding Dataset into DNA records'):
-            seq        = CSV_DatasetRecord(row.astype(str).tolist())
-            dna_seq    = seq.encode_into_DNA(codetable, str(id))
-            dna_seq.id = id
-            result.append(dna_seq)
+    def _fields_as_str(self, columns : list) -> list:
+        """
+            Returns specified columns of the dataset formatted as strings, the same way
+            row.astype(str) formats them for each row of iterrows().
+        """
+        common = self._common_dtype()
+        if common is not None:
+            return [ self[column].astype(common).astype(str) for column in columns ]
+        else:
+            return [ self[column].astype(str) for column in columns ]
+
+    def _common_dtype(self):
+        """
+            iterrows() upcasts each row to the common dtype of the frame, so in a purely numeric
+            frame integer columns are formatted as floats too. Returns this dtype or None if there is a non-numeric column.
+        """
+        dtypes = self.dtypes.unique()
+        if len(dtypes) and all(dtype.kind in 'iuf' for dtype in dtypes):
+            return np.result_type(*dtypes)
+        return None
+
+    def as_DNA_strings(self, codetable : JSON_Codetable, cache : DNACache = None) -> pd.Series:
+        """
+            Encodes the whole dataset into DNA strings in one pass.
+            Each column is formatted and translated separately with a table that is built once
+            from the codetable, then the columns are concatenated. The last column is the label
+            and is not encoded. Result is indexed like the dataset.
+                @cache - take rows which were encoded before from the cache
+                         (time of the 'encode.cache' stage includes encoding of missed rows)
+        """
+        if cache is not None:
+            with INSTRUMENTS.stage("encode.cache"):
+                return cache.encode(self, codetable)
+
+        with INSTRUMENTS.stage("encode"):
+            encoded = self._encode_fields(codetable)
+
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.count("encode.rows", len(encoded))
+            INSTRUMENTS.count("encode.dna_bytes", int(encoded.str.len().sum()))
+        return encoded
+
+    def _encode_fields(self, codetable : JSON_Codetable) -> pd.Series:
+        encoded = self._encoded_columns(codetable)
+        if not encoded:
+            return pd.Series('', index=self.index, dtype=object)
+        return encoded[0].str.cat([ field.values for field in encoded[1:] ]) if len(encoded) > 1 else encoded[0]
+
+    def _encoded_columns(self, codetable : JSON_Codetable) -> list:
+        """Returns DNA strings of each field (except the label), their concatenation is the sequence of a record."""
+        if not codetable.data:
+            raise Exception("Codetable is empty")
+
+        fields = self._fields_as_str(self.columns[:-1])
+        table  = codetable.translation_table()
+
+        # Coverage of the codetable is checked against the alphabet of the dataset
+        codetable.check_coverage(set().union(*(''.join(field.unique()) for field in fields)))
+
+        return [ field.str.translate(table) for field in fields ]
+
+    def as_DNA_fields(self, codetable : JSON_Codetable) -> dict:
+        """
+            Encodes each field (except the label) into its own DNABatch: field -> batch of the field's DNA of each record.
+            Concatenated fields of a record are the sequence as_DNA_batch() gives. Labels & ids are the same in all batches.
+        """
+        labels = self._fields_as_str(self.columns[-1:])[0].to_numpy(dtype=str)
+        with INSTRUMENTS.stage("encode"):
+            encoded = self._encoded_columns(codetable)
+            fields  = { column : DNABatch.from_strings(field.tolist(), labels, self.index.to_numpy())
+                            for column, field in zip(self.columns[:-1], encoded) }
+
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.count("encode.rows", len(self))
+            INSTRUMENTS.count("encode.dna_bytes", sum(len(batch.buffer) for batch in fields.values()))
+        return fields
+
+    def as_DNA_records(self, codetable : JSON_Codetable, progress = True, cache : DNACache = None) -> pd.Series:
+        payloads = self.as_DNA_strings(codetable, cache)
+        labels   = self._fields_as_str(self.columns[-1:])[0]
+        result   = []
+        records  = zip(self.index, payloads, labels)
+        if progress:
+            records = progress_bar(records, total=self.shape[0], desc='Encoding Dataset into DNA records')
+        with INSTRUMENTS.stage("encode.records"):
+            for id, payload, label in records:
+                dna_seq = SeqRecord(Seq(payload), id=str(id), name=label, description=CSV_DatasetRecord.DESCRIPTION)
+                dna_seq.id = id
+                result.append(dna_seq)
         return pd.Series(result)
+
+    def as_DNA_batch(self, codetable : JSON_Codetable, cache : DNACache = None) -> DNABatch:
+        """
+            Encodes the whole dataset into a DNABatch: one buffer with all sequences instead of
+            a SeqRecord per record. Labels are the last column, ids are the index of the dataset.
+        """
+        labels = self._fields_as_str(self.columns[-1:])[0].to_numpy(dtype=str)
+        if cache is not None:
+            with INSTRUMENTS.stage("encode.cache"):
+                buffer, offsets = cache.encode_codes(self, codetable)
+            return DNABatch(buffer, offsets, labels, self.index.to_numpy())
+        return DNABatch.from_strings(self.as_DNA_strings(codetable).tolist(), labels, self.index.to_numpy())
     
-    def random_sample(self, size : int):
-        return CSV_Dataset(self.sample(size))
+    def as_DNA_codes(self, codetable : JSON_Codetable, cache : DNACache = None) -> DNABatch:
+        """
+            Encodes the whole dataset into a DNABatch of integer codes of letters (see JSON_Codetable.alphabet()).
+            Integral numbers are formatted into digits arithmetically and looked up in a table of literal codes,
+            only other values (fractions, text) are formatted as strings. Sequences are the same as as_DNA_strings() gives.
+                @cache - take rows which were encoded before from the cache (it keeps letters, they are recoded)
+        """
+        alphabet = codetable.alphabet()
+        if cache is not None:
+            return self.as_DNA_batch(codetable, cache).as_codes(alphabet)
+
+        labels = self._fields_as_str(self.columns[-1:])[0].to_numpy(dtype=str)
+        with INSTRUMENTS.stage("encode.codes"):
+            buffer, offsets = self._encode_codes(codetable)
+
+        INSTRUMENTS.count("encode.rows", len(self))
+        INSTRUMENTS.count("encode.dna_bytes", len(buffer))
+        return DNABatch(buffer, offsets, labels, self.index.to_numpy(), alphabet)
+
+    def _encode_codes(self, codetable : JSON_Codetable) -> tuple:
+        if not codetable.data:
+            raise Exception("Codetable is empty")
+
+        table  = codetable.literal_codes()
+        common = self._common_dtype()
+        fields = [ self._field_literals(self[column], common) for column in self.columns[:-1] ]
+        if not fields:
+            return np.zeros(0, dtype=np.uint8), np.zeros(len(self) + 1, dtype=np.int64)
+
+        # Row-major boolean indexing keeps rows in order and fields of a row in order
+        literals = np.concatenate([ literals for literals, _ in fields ], axis=1)
+        present  = np.concatenate([ np.arange(literals.shape[1])[None, :] < lengths[:, None]
+                                        for literals, lengths in fields ], axis=1)
+        literals = literals[present]
+        codes    = table[literals]
+
+        # Like the string path, an unknown literal is an error
+        if not codes.all():
+            raise KeyError(chr(literals[codes == 0][0]))
+
+        lengths = sum(lengths for _, lengths in fields)
+        return codes, np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64)
+
+    @staticmethod
+    def _field_literals(field : pd.Series, common) -> tuple:
+        """
+            Returns (literals, lengths): ASCII literals of each value of the field formatted as _fields_as_str() does it,
+            left-aligned in rows of a uint8 matrix.
+                @common - dtype the field is formatted with, None - its own dtype
+        """
+        dtype   = field.dtype if common is None else common
+        size    = len(field)
+        textual = np.ones(size, dtype=bool)
+        literals, lengths = np.zeros((size, 0), dtype=np.uint8), np.zeros(size, dtype=np.int64)
+
+        if dtype.kind in 'iu':
+            values = field.to_numpy(dtype=dtype)
+            literals, lengths = CSV_Dataset._digit_literals(values, values < 0, 0)
+            textual[:] = False
+        elif dtype.kind == 'f':
+            values   = field.to_numpy(dtype=dtype)
+            integral = np.isfinite(values) & (np.trunc(values) == values) & (np.abs(values) < CSV_Dataset.FLOAT_DIGITS_LIMIT)
+            # Integral floats are formatted as 'digits.0', '-0.0' keeps its sign
+            literals, lengths = CSV_Dataset._digit_literals(np.where(integral, values, 0).astype(np.int64),
+                                                            integral & np.signbit(values), 2)
+            rows = np.flatnonzero(integral)
+            literals[rows, lengths[rows]]     = ord('.')
+            literals[rows, lengths[rows] + 1] = ord('0')
+            lengths  = np.where(integral, lengths + 2, 0)
+            textual  = ~integral
+
+        if textual.any():
+            strings  = field[textual].astype(dtype).astype(str) if common is not None else field[textual].astype(str)
+            strings  = np.array(strings.tolist(), dtype=bytes)
+            width    = max(literals.shape[1], strings.dtype.itemsize)
+            literals = np.pad(literals, ((0, 0), (0, width - literals.shape[1])))
+            literals[textual, : strings.dtype.itemsize] = strings.view(np.uint8).reshape(len(strings), -1)
+            lengths[textual] = np.char.str_len(strings)
+        return literals, lengths
+
+    @staticmethod
+    def _digit_literals(values : np.ndarray, negative : np.ndarray, spare : int) -> tuple:
+        """
+            Returns (literals, lengths): decimal ASCII digits of integer values with '-' for negative ones,
+            left-aligned in rows of a uint8 matrix with @spare free columns after the longest value.
+        """
+        DIGITS    = 20
+        # abs() of the smallest int64 wraps around, but its bits are the right uint64 magnitude
+        magnitude = np.abs(values).astype(np.uint64)
+        digits    = np.empty((len(values), DIGITS), dtype=np.uint8)
+        count     = np.ones(len(values), dtype=np.int64)
+        rest      = magnitude.copy()
+        for k in range(DIGITS):
+            digits[:, k] = rest % np.uint64(10)
+            rest //= np.uint64(10)
+            if k:
+                count += magnitude >= np.uint64(10 ** k)
+
+        sign     = negative.astype(np.int64)
+        position = np.arange(DIGITS + 1 + spare)[None, :] - sign[:, None]
+        index    = count[:, None] - 1 - position
+        literals = np.where((position >= 0) & (index >= 0),
+                            ord('0') + np.take_along_axis(digits, np.clip(index, 0, DIGITS - 1), axis=1), 0).astype(np.uint8)
+        literals[negative, 0] = ord('-')
+        return literals, sign + count
+
+    def random_sample(self, size : int, seed = None):
+        return CSV_Dataset(self.sample(size, random_state=seed))
         
 class CSV_DatasetRecord(DatasetRecord):
+    DESCRIPTION = "CSV dataset record encoded into DNA."
 
    # Encoding IEEE dataset record into DNA sequence
-    def encode_into_DNA(self, codetable : JSON_Codetable, id='', description=f"CSV dataset record encoded into DNA.") -> SeqRecord:
+    def encode_into_DNA(self, codetable : JSON_Codetable, id='', description=DESCRIPTION) -> SeqRecord:
         if not codetable.data:
             raise Exception("Codetable is empty")
         else:
-            raw_record  = self.record
-            payload     = ""
-            for field in raw_record:
-                field = str(round(field, 6)) if type(field) is np.float64 else str(field)
-                for literal in list(field):
-                    payload += codetable[literal]
+            fields  = ''.join(str(round(field, 6)) if type(field) is np.float64 else str(field) for field in self.record)
+            codetable.check_coverage(fields)
+            payload = fields.translate(codetable.translation_table())
         return SeqRecord(Seq(payload), id=id, name=self.label, description=description)
\ No newline at end of file
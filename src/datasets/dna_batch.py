@@ -0,0 +1,141 @@
+"""
+    Compact container of dataset records encoded into DNA.
+
+    A pd.Series of SeqRecord objects costs a few Python objects per record (SeqRecord, Seq, id, name,
+    description, annotations). DNABatch keeps all sequences in one contiguous uint8 buffer:
+
+        buffer  - all sequences concatenated (ASCII)
+        offsets - sequence i is buffer[offsets[i] : offsets[i + 1]]
+        labels  - label of each sequence
+        ids     - id of each sequence (index of the dataset record)
+
+    Slicing with a step of 1 returns a view which shares the buffer, so worker shards cost nothing.
+    Items and iteration give sequences as str, records() gives SeqRecords like as_DNA_records() does.
+
+    With an alphabet (see JSON_Codetable.alphabet()) the buffer holds integer codes of letters instead of ASCII:
+    code k is alphabet[k - 1]. Such batch comes from CSV_Dataset.as_DNA_codes(), its str items are decoded.
+"""
+
+import numpy as np
+
+from Bio.Seq         import Seq
+from Bio.SeqRecord   import SeqRecord
+
+class DNABatch:
+    _buffer  = None
+    _offsets = None
+    _labels  = None
+    _ids     = None
+    _alphabet = None
+
+    buffer  = property()
+    offsets = property()
+    labels  = property()
+    ids     = property()
+    lengths = property()
+    nbytes  = property()
+    alphabet = property()
+
+    def __init__(self, buffer : np.ndarray, offsets : np.ndarray, labels, ids = None, alphabet : str = None):
+        if len(offsets) != len(labels) + 1:
+            raise Exception(f"DNABatch needs len(labels) + 1 offsets: {len(offsets)} offsets, {len(labels)} labels")
+
+        self._buffer  = buffer
+        self._offsets = offsets
+        self._labels  = np.asarray(labels)
+        self._ids     = np.arange(len(labels)) if ids is None else np.asarray(ids)
+        self._alphabet = alphabet
+
+    @staticmethod
+    def from_strings(sequences : list, labels, ids = None):
+        data    = ''.join(sequences).encode('ascii')
+        lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+        offsets = np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64)
+        return DNABatch(np.frombuffer(data, dtype=np.uint8), offsets, labels, ids)
+
+    @buffer.getter
+    def buffer(self):
+        """Bytes of this batch's sequences only (a view)."""
+        return self._buffer[self._offsets[0] : self._offsets[-1]]
+    @offsets.getter
+    def offsets(self):
+        return self._offsets
+    @labels.getter
+    def labels(self):
+        return self._labels
+    @ids.getter
+    def ids(self):
+        return self._ids
+    @lengths.getter
+    def lengths(self):
+        return np.diff(self._offsets)
+    @nbytes.getter
+    def nbytes(self):
+        return self.buffer.nbytes + self._offsets.nbytes + self._labels.nbytes + self._ids.nbytes
+    @alphabet.getter
+    def alphabet(self):
+        """Letters of integer codes or None if the buffer holds ASCII."""
+        return self._alphabet
+
+    def _letters(self, codes : np.ndarray) -> bytes:
+        if self._alphabet is None:
+            return codes.tobytes()
+        return np.frombuffer(b'\0' + self._alphabet.encode('ascii'), dtype=np.uint8)[codes].tobytes()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            stop = max(start, stop)
+            return DNABatch(self._buffer, self._offsets[start : stop + 1], self._labels[start : stop], self._ids[start : stop],
+                            self._alphabet)
+        index = range(len(self))[key]
+        return self._letters(self._buffer[self._offsets[index] : self._offsets[index + 1]]).decode('ascii')
+
+    def __iter__(self):
+        data, offsets = self._letters(self.buffer), (self._offsets - self._offsets[0]).tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield data[start : end].decode('ascii')
+
+    def take(self, indices):
+        """Returns a new batch (a copy) with sequences at specified positions."""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, lengths = self._offsets[indices], self.lengths[indices]
+        offsets = np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64)
+        buffer  = self._buffer[np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])]
+        return DNABatch(buffer, offsets, self._labels[indices], self._ids[indices], self._alphabet)
+
+    def as_codes(self, alphabet : str):
+        """Returns a batch of integer codes of the alphabet (a copy). Letters which are not in it raise KeyError."""
+        if self._alphabet == alphabet:
+            return self
+        table = np.zeros(256, dtype=np.uint8)
+        table[np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)] = np.arange(1, len(alphabet) + 1)
+        letters = np.frombuffer(self._letters(self.buffer), dtype=np.uint8)
+        codes   = table[letters]
+        if not codes.all():
+            raise KeyError(chr(letters[codes == 0][0]))
+        return DNABatch(codes, self._offsets - self._offsets[0], self._labels, self._ids, alphabet)
+
+    def codes(self) -> tuple:
+        """
+            Returns (codes, lengths): sequences as rows of byte codes (integer codes if there is an alphabet)
+            padded with zeros to the longest one.
+        """
+        lengths = self.lengths
+        codes   = np.zeros((len(self), int(lengths.max()) if len(self) else 0), dtype=np.uint8)
+        rows    = np.repeat(np.arange(len(self)), lengths)
+        columns = np.arange(int(lengths.sum())) - np.repeat(self._offsets[:-1] - self._offsets[0], lengths)
+        codes[rows, columns] = self.buffer
+        return codes, lengths
+
+    def records(self, description = ''):
+        """Yields SeqRecords of the batch: name is the label, id is the id of dataset record."""
+        for id, seq, label in zip(self._ids.tolist(), self, self._labels.tolist()):
+            dna_seq = SeqRecord(Seq(seq), id=str(id), name=str(label), description=description)
+            dna_seq.id = id
+            yield dna_seq
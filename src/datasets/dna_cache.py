@@ -0,0 +1,224 @@
+"""
+    Persistent cache of dataset records encoded into DNA.
+
+    Encoding depends only on the encoded values, on the dtypes of the dataset (they define how values
+    are formatted) and on the codetable. So the cache has an entry directory per codetable hash and
+    dataset schema, and rows inside an entry are looked up by the hash of their contents. Any sample,
+    shard or concatenation of rows which were encoded before is served from the cache, while edited
+    rows or another codetable simply miss it.
+
+    Rows encoded by one run are appended as a new segment of the entry, the cached ones are never rewritten.
+    Files of an entry:
+        manifest.json           - segments of the entry with their numbers of rows & sizes of DNA
+        <segment>.hashes.npy    - 64-bit hashes of the encoded values of each row
+        <segment>.offsets.npy   - start of each row's sequence in <segment>.dna.bin, plus the end of the last one
+        <segment>.dna.bin       - all sequences of the segment concatenated (ASCII)
+
+    Segment files are written under a unique name before the manifest refers to them and never change, the manifest
+    is replaced last. So readers see only whole segments, whatever other processes are writing. Segments appended
+    by processes at the same time may be lost from the manifest, their rows just miss the cache again.
+    When an entry has more than MAX_SEGMENTS segments, they are merged into one.
+
+    All segment files are memory-mapped on load.
+"""
+
+import os
+import json
+import uuid
+import numpy  as np
+import pandas as pd
+
+from hashlib         import sha256
+from pathlib         import Path
+from .interfaces     import Codetable
+
+MANIFEST_FILE = "manifest.json"
+MAX_SEGMENTS  = 32
+
+class DNACache:
+    _dir = None
+
+    directory = property()
+    hits      = property()
+    misses    = property()
+
+    def __init__(self, directory : Path):
+        self._dir = Path(directory)
+        self._hits, self._misses = 0, 0
+
+    @directory.getter
+    def directory(self):
+        return self._dir
+    @hits.getter
+    def hits(self):
+        return self._hits
+    @misses.getter
+    def misses(self):
+        return self._misses
+
+    def encode(self, dataset, codetable : Codetable) -> pd.Series:
+        """
+            Returns the same strings as dataset.as_DNA_strings(codetable) does.
+            Only the rows which are not cached yet are encoded, they are added to the cache.
+        """
+        data, offsets = self.encode_codes(dataset, codetable)
+        data, offsets = data.tobytes(), offsets.tolist()
+        return pd.Series([ data[start : end].decode('ascii') for start, end in zip(offsets[:-1], offsets[1:]) ],
+                         index=dataset.index, dtype=object)
+
+    def encode_codes(self, dataset, codetable : Codetable) -> tuple:
+        """
+            Same as encode(), but returns (buffer, offsets) of the rows without making strings:
+            sequence of row i is buffer[offsets[i] : offsets[i + 1]] (see DNABatch).
+        """
+        entry  = self._entry(dataset, codetable)
+        hashes = pd.util.hash_pandas_object(dataset.iloc[:, :-1], index=False).to_numpy()
+
+        cached_hashes, parts = self._load(entry)
+        rows = self._lookup(cached_hashes, hashes)
+
+        missing = np.flatnonzero(rows < 0)
+        self._hits   += len(hashes) - len(missing)
+        self._misses += len(missing)
+
+        if len(missing):
+            # Duplicated rows are encoded and stored once
+            new_hashes, first = np.unique(hashes[missing], return_index=True)
+            new_rows = missing[first]
+            payloads = type(dataset)(dataset.iloc[new_rows]).as_DNA_strings(codetable).tolist()
+
+            new_part = self._store(entry, new_hashes, payloads)
+            cached_hashes, parts = np.concatenate([ cached_hashes, new_hashes ]), parts + [ new_part ]
+            rows = self._lookup(cached_hashes, hashes)
+
+        return self._gather(parts, rows)
+
+    def _entry(self, dataset, codetable : Codetable) -> Path:
+        schema = json.dumps([ [ str(column), str(dtype) ] for column, dtype in dataset.dtypes.items() ])
+        return self._dir / f"{codetable.digest()[:16]}-{sha256(schema.encode()).hexdigest()[:16]}"
+
+    @staticmethod
+    def _manifest(entry : Path) -> list:
+        """Returns segments of the entry: dicts of name, number of rows & size of DNA. A missing entry has none."""
+        try:
+            with (entry / MANIFEST_FILE).open("r") as manifest_file:
+                return json.load(manifest_file)["segments"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    @staticmethod
+    def _load_segment(entry : Path, segment : dict) -> tuple:
+        """Returns (hashes, offsets, buffer) of the segment or None if its files do not match the manifest."""
+        name = segment["name"]
+        try:
+            hashes  = np.load(entry / f"{name}.hashes.npy",  mmap_mode='r')
+            offsets = np.load(entry / f"{name}.offsets.npy", mmap_mode='r')
+            size    = (entry / f"{name}.dna.bin").stat().st_size
+            buffer  = np.memmap(entry / f"{name}.dna.bin", dtype=np.uint8, mode='r') if size else np.empty(0, dtype=np.uint8)
+        except (OSError, ValueError):
+            return None
+        if len(hashes) != segment["rows"] or len(offsets) != len(hashes) + 1 or offsets[-1] != size or size != segment["size"]:
+            return None
+        return hashes, offsets, buffer
+
+    @staticmethod
+    def _load(entry : Path) -> tuple:
+        """
+            Returns (hashes, parts) of the entry: hashes of all cached rows and (offsets, buffer)
+            of each segment in the same order. Segments which can not be read are left out.
+        """
+        hashes, parts = [ np.empty(0, dtype=np.uint64) ], []
+        for segment in DNACache._manifest(entry):
+            loaded = DNACache._load_segment(entry, segment)
+            if loaded is not None:
+                hashes.append(loaded[0])
+                parts.append(loaded[1:])
+        return np.concatenate(hashes), parts
+
+    @staticmethod
+    def _write_segment(entry : Path, hashes, offsets, buffer) -> dict:
+        """Writes files of a new segment, returns its record of the manifest."""
+        name = uuid.uuid4().hex
+        np.save(entry / f"{name}.hashes.npy",  hashes)
+        np.save(entry / f"{name}.offsets.npy", offsets)
+        with (entry / f"{name}.dna.bin").open("wb") as dna_file:
+            dna_file.write(buffer.tobytes())
+        return { "name" : name, "rows" : len(hashes), "size" : int(offsets[-1]) }
+
+    @staticmethod
+    def _store(entry : Path, new_hashes, payloads : list) -> tuple:
+        """Appends encoded rows to the entry as a new segment, returns its (offsets, buffer)."""
+        entry.mkdir(parents=True, exist_ok=True)
+
+        data    = ''.join(payloads).encode('ascii')
+        lengths = np.fromiter((len(payload) for payload in payloads), dtype=np.int64, count=len(payloads))
+        offsets = np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64)
+        buffer  = np.frombuffer(data, dtype=np.uint8)
+
+        # Segments appended by other processes since the entry was loaded are kept
+        segments = DNACache._manifest(entry) + [ DNACache._write_segment(entry, new_hashes, offsets, buffer) ]
+        merged   = []
+        if len(segments) > MAX_SEGMENTS:
+            merged, segments = segments, [ DNACache._merge(entry, segments) ]
+
+        # Threads of a process may write the manifest at the same time, so the name is unique per writer
+        tmp = entry / f"{MANIFEST_FILE}.{uuid.uuid4().hex}.tmp"
+        with tmp.open("w") as manifest_file:
+            json.dump({ "segments" : segments }, manifest_file)
+        os.replace(tmp, entry / MANIFEST_FILE)
+
+        for segment in merged:
+            DNACache._remove_segment(entry, segment)
+        return offsets, buffer
+
+    @staticmethod
+    def _merge(entry : Path, segments : list) -> dict:
+        """Writes rows of the segments as one new segment, returns its record of the manifest."""
+        loaded  = [ part for part in (DNACache._load_segment(entry, segment) for segment in segments) if part is not None ]
+        hashes  = np.concatenate([ hashes for hashes, _, _ in loaded ])
+        buffer  = np.concatenate([ buffer for _, _, buffer in loaded ])
+        ends    = np.cumsum([ 0 ] + [ offsets[-1] for _, offsets, _ in loaded ])
+        offsets = np.concatenate([ [ 0 ] ] + [ offsets[1:] + end for (_, offsets, _), end in zip(loaded, ends) ]).astype(np.int64)
+        return DNACache._write_segment(entry, hashes, offsets, buffer)
+
+    @staticmethod
+    def _remove_segment(entry : Path, segment : dict) -> None:
+        # Files mapped by another process may be impossible to remove, they are left behind then
+        for suffix in (".hashes.npy", ".offsets.npy", ".dna.bin"):
+            try:
+                (entry / f"{segment['name']}{suffix}").unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _lookup(cached_hashes, hashes) -> np.ndarray:
+        """Returns positions of hashes in cached_hashes, -1 for missing ones."""
+        if not len(cached_hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        order    = np.argsort(cached_hashes, kind='stable')
+        ordered  = cached_hashes[order]
+        position = np.minimum(np.searchsorted(ordered, hashes), len(ordered) - 1)
+        return np.where(ordered[position] == hashes, order[position], -1)
+
+    @staticmethod
+    def _gather(parts : list, rows) -> tuple:
+        """Gathers sequences of rows (positions among rows of all segments) into one compact buffer, returns it with new offsets."""
+        firsts  = np.cumsum([ 0 ] + [ len(offsets) - 1 for offsets, _ in parts ])
+        segment = np.searchsorted(firsts, rows, side='right') - 1
+        starts, lengths = np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+        for index, (offsets, _) in enumerate(parts):
+            chosen = segment == index
+            local  = rows[chosen] - firsts[index]
+            starts[chosen], lengths[chosen] = offsets[local], offsets[local + 1] - offsets[local]
+
+        bounds = np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64)
+        data   = np.empty(bounds[-1], dtype=np.uint8)
+        for index, (_, buffer) in enumerate(parts):
+            chosen = np.flatnonzero(segment == index)
+            if not len(chosen):
+                continue
+            # Position of each byte inside its sequence
+            size   = lengths[chosen]
+            inside = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+            data[np.repeat(bounds[chosen], size) + inside] = buffer[np.repeat(starts[chosen], size) + inside]
+        return data, bounds
@@ -2,7 +2,8 @@ import json
 import csv
 import pandas
 
-from numpy         import array as numpy_array
+from hashlib       import sha256
+from numpy         import array as numpy_array, zeros as numpy_zeros
 from pandas        import DataFrame
 from pathlib       import Path
 from abc           import ABC, abstractmethod
@@ -51,6 +52,13 @@ class Codetable(ABC):
     def data(self):
         return self._codetable
 
+    def digest(self) -> str:
+        """
+            Returns SHA-256 of the codetable contents. It does not depend on formatting
+            of the file or order of keys, so it identifies the encoding a model was trained with.
+        """
+        return sha256(json.dumps(self.data, sort_keys=True).encode()).hexdigest()
+
     @abstractmethod
     def parse_codetable_file(self, path : Path):
         pass
@@ -61,15 +69,106 @@ class Codetable(ABC):
 
 # Codetable loaded from *.json file. 
 class JSON_Codetable(Codetable):
+    """
+        The codetable is compiled once when it is loaded: the str.translate() table, the table of literal codes
+        and the alphabet are kept, so fields are encoded by one translate() each instead of a lookup per literal,
+        and workers get the compiled tables with the codetable. Loading also reports literals which share a code
+        (they can not be told apart in DNA) and multi-character keys (literals are single characters, so these never
+        match), with @strict they are errors.
+    """
+    _strict      = False
+    _translation = None
+    _literals    = None
+    _codes       = None
+    _alphabet    = None
+    _digest      = None
+
+    def __init__(self, path : Path, strict = False):
+        self._strict = strict
+        super().__init__(path)
+
     def parse_codetable_file(self, path : Path):
         retval = {}
         with open(path, 'r') as json_codetable:
             retval = json.load(json_codetable)
+        self._compile(retval)
         return retval
 
+    def _compile(self, codetable : dict) -> None:
+        single = { key : code for key, code in codetable.items() if len(key) == 1 }
+        self._translation = str.maketrans(single)
+        self._literals    = frozenset(single)
+        self._codes, self._alphabet, self._digest = None, None, None
+
+        problems  = [ f"literals {', '.join(repr(key) for key in keys)} share the code {code!r}" for code, keys in self.collisions(codetable).items() ]
+        multichar = [ key for key in codetable if len(key) != 1 ]
+        if multichar:
+            problems.append(f"multi-character keys {', '.join(repr(key) for key in multichar)} never match a literal")
+        if problems and self._strict:
+            raise Exception(f"Codetable is ambiguous: {'; '.join(problems)}")
+        for problem in problems:
+            print(f"Codetable warning: {problem}")
+
+    @staticmethod
+    def collisions(codetable : dict) -> dict:
+        """Returns code -> single-character keys of each code which is shared by several literals."""
+        keys = {}
+        for key, code in codetable.items():
+            if len(key) == 1:
+                keys.setdefault(code, []).append(key)
+        return { code : literals for code, literals in keys.items() if len(literals) > 1 }
+
+    def uncovered(self, literals) -> str:
+        """Returns sorted literals (e.g. the alphabet of a dataset) which are not in the codetable."""
+        return ''.join(sorted(set(literals) - self._literals))
+
+    def check_coverage(self, literals) -> None:
+        """str.translate() silently keeps unknown literals, so they are an error here, as the lookup of one is."""
+        missing = self.uncovered(literals)
+        if missing:
+            raise KeyError(missing[0])
+
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = super().digest()
+        return self._digest
+
     def __getitem__(self, value):
         return self._codetable[value]
 
+    def translation_table(self) -> dict:
+        """
+            Returns str.translate() table built from the single-character codes.
+            Multi-character keys (e.g. "true") can never match a single literal, so they are skipped.
+        """
+        return self._translation
+
+    def alphabet(self) -> str:
+        """
+            Returns sorted distinct DNA letters of the codetable. Letter alphabet[k] has the integer code k + 1,
+            code 0 is left for padding, so encoded sequences can index arrays of 256 entries directly.
+        """
+        if self._alphabet is None:
+            letters = sorted(set(self._codetable.values()))
+            if any(len(letter) != 1 for letter in letters) or len(letters) > 254:
+                raise Exception("Integer encoding needs at most 254 single-letter codes")
+            self._alphabet = ''.join(letters)
+        return self._alphabet
+
+    def literal_codes(self):
+        """
+            Returns uint8 lookup table: ASCII code of a literal -> integer code of its DNA letter (see alphabet()).
+            Literals which are not in the codetable map to 0. Multi-character keys are skipped as in translation_table().
+        """
+        if self._codes is None:
+            codes = { letter : code + 1 for code, letter in enumerate(self.alphabet()) }
+            table = numpy_zeros(256, dtype='uint8')
+            for key, letter in self._codetable.items():
+                if len(key) == 1 and ord(key) < 128:
+                    table[ord(key)] = codes[letter]
+            self._codes = table
+        return self._codes
+
 class DatasetRecord:
     """
         This class represents the 'Dataset' record. 
@@ -160,9 +259,10 @@ class Dataset(ABC, DataFrame):
         raise NotImplementedError
 
     @abstractmethod
-    def random_sample(self, size : int):
+    def random_sample(self, size : int, seed = None):
         """
             This method should return random sample of DatasetRecords
+            (the same sample for the same @seed)
 
             Note: Basically, DataFrame.sample(...) method is used and result
                   is wrapped into Dataset class
@@ -0,0 +1,208 @@
+"""
+    Column quantiles of a dataset which is read by chunks (see CSV_Dataset.read_chunks()).
+
+    ExactQuantiles keeps counts of each distinct value of each column, so quantiles are the ones
+    pandas gives for the whole dataset. Captures repeat values of most fields, but counters and sequence
+    numbers are nearly unique, so its memory still grows with the dataset.
+
+    TDigestQuantiles keeps a t-digest of each column: at most about @compression centroids (mean & weight
+    of close values), small ones at the tails and large ones in the middle. Memory does not depend on
+    the number of records. A centroid of equal values keeps the value exactly, so medians of fields
+    with a few distinct values (flags, lengths, options) are exact too, other ones are interpolated
+    between centroids.
+
+    Both keep their state as arrays (as_arrays(), from_arrays()), so training can be continued with new records
+    later (see IDS.update()).
+"""
+
+import numpy  as np
+import pandas as pd
+
+def fields(dataset : pd.DataFrame) -> list:
+    """Columns of the dataset which get medians (see CSV_Dataset.get_median())."""
+    return [ column for column in dataset if column != "label" ]
+
+class ExactQuantiles:
+    _columns = None
+    _counts  = None
+    _pending = None
+
+    count  = property()
+    nbytes = property()
+
+    def __init__(self):
+        # column -> Series of counts indexed by sorted distinct values
+        self._columns, self._counts, self._pending, self._count = [], {}, {}, 0
+
+    @count.getter
+    def count(self):
+        return self._count
+    @nbytes.getter
+    def nbytes(self):
+        self._merge()
+        return int(sum(counts.memory_usage(index=True, deep=True) for counts in self._counts.values()))
+
+    def update(self, dataset : pd.DataFrame):
+        """Adds records of the dataset (all columns except the label), returns self."""
+        for column in fields(dataset):
+            if column not in self._columns:
+                self._columns.append(column)
+            pending = self._pending.setdefault(column, [])
+            values = dataset[column]
+            # Hex fields may hold Python integers, pandas takes medians of them as floats
+            if values.dtype == object:
+                values = values.astype(np.float64)
+            pending.append(values.value_counts(sort=False))
+            # Counts are merged when pending ones outgrow them, so each value is merged O(log N) times
+            if sum(len(counts) for counts in pending) > 2 * len(self._counts.get(column, ())) + 1024:
+                self._merge(column)
+        self._count += len(dataset)
+        return self
+
+    def _merge(self, column = None) -> None:
+        for column in ([ column ] if column is not None else list(self._pending)):
+            parts = self._pending.pop(column, [])
+            if column in self._counts:
+                parts.append(self._counts[column])
+            if parts:
+                self._counts[column] = pd.concat(parts).groupby(level=0, sort=True).sum()
+
+    def quantile(self, q : float) -> dict:
+        """Returns column -> q-th quantile (linear interpolation, as DataFrame.quantile() does it)."""
+        if not self._count:
+            raise Exception("Quantiles of an empty dataset")
+        self._merge()
+        result = {}
+        for column in self._columns:
+            counts     = self._counts[column]
+            values     = counts.index
+            cumulative = counts.to_numpy().cumsum()
+            position   = (self._count - 1) * q
+            low, high  = int(np.floor(position)), int(np.ceil(position))
+            # Positions in the sorted column are found by cumulative counts of values
+            low, high  = values[np.searchsorted(cumulative, low, side='right')], values[np.searchsorted(cumulative, high, side='right')]
+            result[column] = low if low == high else (low + (high - low) * (position - np.floor(position)))
+        return result
+
+    def median(self) -> dict:
+        return self.quantile(0.5)
+
+    def as_arrays(self) -> dict:
+        """State as arrays of np.savez(): distinct values & their counts of each column."""
+        self._merge()
+        arrays = { "kind" : np.array('exact'), "count" : np.array(self._count), "columns" : np.array(self._columns, dtype=str) }
+        for i, column in enumerate(self._columns):
+            arrays[f"values_{i}"] = self._counts[column].index.to_numpy()
+            arrays[f"counts_{i}"] = self._counts[column].to_numpy()
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays : dict):
+        quantiles = ExactQuantiles()
+        quantiles._columns, quantiles._count = [ str(column) for column in arrays["columns"] ], int(arrays["count"])
+        quantiles._counts = { column : pd.Series(arrays[f"counts_{i}"], index=arrays[f"values_{i}"])
+                              for i, column in enumerate(quantiles._columns) }
+        return quantiles
+
+class TDigestQuantiles:
+    _compression = None
+    _digests     = None
+
+    compression = property()
+    count       = property()
+    nbytes      = property()
+
+    def __init__(self, compression : int = 100):
+        if compression < 10:
+            raise Exception(f"Compression of t-digest must be at least 10: {compression}")
+        self._compression = compression
+        # column -> (means, weights, lows, highs) of centroids sorted by means
+        self._digests, self._count = {}, 0
+
+    @compression.getter
+    def compression(self):
+        return self._compression
+    @count.getter
+    def count(self):
+        return self._count
+    @nbytes.getter
+    def nbytes(self):
+        return int(sum(array.nbytes for digest in self._digests.values() for array in digest))
+
+    def update(self, dataset : pd.DataFrame):
+        """Adds records of the dataset (all columns except the label), returns self."""
+        for column in fields(dataset):
+            # Hex fields may hold Python integers, the digest keeps floats
+            values = dataset[column].to_numpy(dtype=np.float64)
+            means, weights, lows, highs = self._digests.get(column, (np.empty(0),) * 4)
+            self._digests[column] = self._compress(np.concatenate([ means, values ]),
+                                                   np.concatenate([ weights, np.ones(len(values)) ]),
+                                                   np.concatenate([ lows, values ]),
+                                                   np.concatenate([ highs, values ]))
+        self._count += len(dataset)
+        return self
+
+    def _compress(self, means, weights, lows, highs) -> tuple:
+        """
+            Merges sorted centroids into clusters of the k1 scale function: a cluster covers at most one unit
+            of k(q) = compression * (asin(2q - 1) / pi + 1/2), so there are at most compression + 1 of them.
+        """
+        order = np.argsort(means, kind='stable')
+        means, weights, lows, highs = means[order], weights[order], lows[order], highs[order]
+
+        cumulative = np.cumsum(weights)
+        q       = (cumulative - weights / 2) / cumulative[-1]
+        cluster = np.floor(self._compression * (np.arcsin(2 * q - 1) / np.pi + .5))
+        starts  = np.flatnonzero(np.concatenate([ [ True ], cluster[1:] != cluster[:-1] ]))
+
+        merged = np.add.reduceat(weights, starts)
+        return (np.add.reduceat(means * weights, starts) / merged, merged,
+                np.minimum.reduceat(lows, starts), np.maximum.reduceat(highs, starts))
+
+    def quantile(self, q : float) -> dict:
+        """
+            Returns column -> estimate of the q-th quantile. Ranks are interpolated between centers of centroids,
+            a rank inside a centroid of equal values gives the value itself.
+        """
+        if not self._count:
+            raise Exception("Quantiles of an empty dataset")
+        result = {}
+        for column, (means, weights, lows, highs) in self._digests.items():
+            position   = (self._count - 1) * q
+            cumulative = np.cumsum(weights)
+            inside     = int(np.searchsorted(cumulative, position, side='right'))
+            if lows[inside] == highs[inside]:
+                result[column] = lows[inside]
+                continue
+            # Centers of centroids on the scale of ranks, the extreme values are exact
+            centers = cumulative - (weights + 1) / 2
+            result[column] = float(np.interp(position, np.concatenate([ [ 0 ], centers, [ self._count - 1 ] ]),
+                                             np.concatenate([ [ lows[0] ], means, [ highs[-1] ] ])))
+        return result
+
+    def median(self) -> dict:
+        return self.quantile(0.5)
+
+    def as_arrays(self) -> dict:
+        """State as arrays of np.savez(): means, weights, lows & highs of centroids of each column."""
+        arrays = { "kind" : np.array('tdigest'), "count" : np.array(self._count), "compression" : np.array(self._compression),
+                   "columns" : np.array(list(self._digests), dtype=str) }
+        for i, digest in enumerate(self._digests.values()):
+            arrays[f"digest_{i}"] = np.stack(digest)
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays : dict):
+        quantiles = TDigestQuantiles(int(arrays["compression"]))
+        quantiles._count   = int(arrays["count"])
+        quantiles._digests = { str(column) : tuple(arrays[f"digest_{i}"]) for i, column in enumerate(arrays["columns"]) }
+        return quantiles
+
+QUANTILES = { 'exact' : ExactQuantiles, 'tdigest' : TDigestQuantiles }
+
+def quantiles_from_arrays(arrays : dict):
+    """Restores ExactQuantiles or TDigestQuantiles from their as_arrays()."""
+    kind = str(arrays["kind"])
+    if kind not in QUANTILES:
+        raise Exception(f"Unknown quantiles: {kind}. Use one of {list(QUANTILES)}")
+    return QUANTILES[kind].from_arrays(arrays)
@@ -0,0 +1,144 @@
+"""
+    Execution backends which are used by IDS to run training and testing tasks in parallel.
+
+    Backends:
+        serial  - tasks are executed one by one in the calling process
+        thread  - tasks are executed in a thread pool (shares the GIL)
+        process - tasks are executed in a process pool
+        shared  - tasks are executed in a process pool, arrays of the state (encoded sequences) are put
+                  in shared memory once and workers map them instead of getting pickled copies (see src.shared)
+
+    Each task is a function with (state, task) signature. The state is a dict with everything
+    the tasks need (codetable, aligner, ideal sequence, rows). It is handed to every worker
+    once, through the pool initializer, so only the small task descriptions are sent per task.
+    Tasks are handed out one by one, a worker takes the next task when it finishes one (see Scheduler).
+    Results (partial sums, scores, metrics) are sent back from workers, counters of INSTRUMENTS
+    counted by tasks in worker processes are sent back with them.
+"""
+
+import os
+import threading
+
+from time                  import perf_counter
+from multiprocessing.dummy import Pool as ThreadPool
+from multiprocessing       import Pool as ProcessPool
+from .shared               import share, attach, release
+from .instrument           import INSTRUMENTS
+
+BACKENDS = [ 'thread', 'process', 'shared', 'serial' ]
+
+# State of the current worker process. Filled in by _init_worker() or _init_shared_worker().
+_worker_state  = None
+# Shared memory blocks the state of the worker process is mapped from
+_worker_blocks = None
+
+def _init_worker(state : dict) -> None:
+    global _worker_state
+    _worker_state = state
+
+def _init_shared_worker(state : dict) -> None:
+    global _worker_state, _worker_blocks
+    _worker_state, _worker_blocks = attach(state)
+
+def _timed_call(func, state : dict, task) -> tuple:
+    """Returns (result, worker, seconds): result of func(state, task), the process & thread which ran it and its time."""
+    start  = perf_counter()
+    result = func(state, task)
+    return result, (os.getpid(), threading.get_ident()), perf_counter() - start
+
+class _StatefulTask:
+    """
+        Picklable wrapper which calls func with the state of the worker process.
+        Returns counters of the task along with the result, they are lost in the worker otherwise.
+    """
+    def __init__(self, func):
+        # Workers count only if the calling process does (spawned workers do not inherit the flag)
+        self.func, self.counted = func, INSTRUMENTS.enabled
+
+    def __call__(self, task):
+        with INSTRUMENTS.collect(self.counted) as counts:
+            timed = _timed_call(self.func, _worker_state, task)
+        return timed, counts
+
+class ExecutionEngine:
+    """
+        Runs tasks on the chosen backend. Use it as a context manager:
+
+            with ExecutionEngine('process', 4, state) as engine:
+                results = engine.map(worker, tasks)
+    """
+    _backend = None
+    _workers = None
+    _state   = None
+    _pool    = None
+    _blocks  = None
+
+    backend     = property()
+    workers     = property()
+    utilization = property()
+
+    def __init__(self, backend : str, workers : int, state : dict):
+        if backend not in BACKENDS:
+            raise Exception(f"Unknown execution backend: {backend}. Use one of {BACKENDS}")
+
+        self._backend = backend
+        self._workers = max(1, workers)
+        self._state   = state
+        self._utilization = []
+
+    @backend.getter
+    def backend(self):
+        return self._backend
+    @workers.getter
+    def workers(self):
+        return self._workers
+    @utilization.getter
+    def utilization(self):
+        """Busy time of each worker during the last map() divided by its wall time, the busiest worker first."""
+        return self._utilization
+
+    def __enter__(self):
+        if self._backend == 'thread':
+            self._pool = ThreadPool(self._workers)
+        elif self._backend == 'process':
+            self._pool = ProcessPool(self._workers, initializer=_init_worker, initargs=(self._state,))
+        elif self._backend == 'shared':
+            shared_state, self._blocks = share(self._state)
+            try:
+                self._pool = ProcessPool(self._workers, initializer=_init_shared_worker, initargs=(shared_state,))
+            except BaseException:
+                release(self._blocks, unlink=True)
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is not None:
+            self._pool.close() if exc_type is None else self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._blocks is not None:
+            release(self._blocks, unlink=True)
+            self._blocks = None
+
+    def map(self, func, tasks : list) -> list:
+        """Returns list of func(state, task) results in order of tasks."""
+        start = perf_counter()
+        if self._backend in ('process', 'shared'):
+            timed = []
+            for result, counts in self._pool.imap(_StatefulTask(func), tasks, chunksize=1):
+                INSTRUMENTS.merge(counts)
+                timed.append(result)
+        elif self._backend == 'thread':
+            timed = list(self._pool.imap(lambda task: _timed_call(func, self._state, task), tasks, chunksize=1))
+        else:
+            timed = [ _timed_call(func, self._state, task) for task in tasks ]
+        wall = perf_counter() - start
+
+        busy = {}
+        for _, worker, seconds in timed:
+            busy[worker] = busy.get(worker, 0.) + seconds
+        # Workers which got no task were idle, the serial backend has one worker
+        workers = 1 if self._backend == 'serial' else self._workers
+        busy = sorted(busy.values(), reverse=True) + [ 0. ] * max(0, workers - len(busy))
+        self._utilization = [ seconds / wall if wall else 0. for seconds in busy ]
+        return [ result for result, _, _ in timed ]
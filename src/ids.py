@@ -1,28 +1,62 @@
 
 import json
+import shutil
 import multiprocessing as mp  
+import numpy  as np
 import pandas as pd
 
-from multiprocessing.dummy   import Pool as ThreadPool
-from math                    import floor
+from itertools               import chain
+from copy                    import deepcopy
 from numpy                   import array as numpy_array
-from tqdm                    import tqdm
 from pathlib                 import Path
 from .datasets.interfaces    import Codetable, Dataset
+from .datasets.dna_cache     import DNACache
+from .datasets.dna_batch     import DNABatch
+from .datasets.quantiles     import ExactQuantiles, quantiles_from_arrays
+from .engine                 import ExecutionEngine
+from .instrument             import INSTRUMENTS, progress
+from .batch_align            import BatchScorer
+from .kmers                  import KmerSketch, KmerPrefilter
+from .score_cache            import ScoreCache
+from .scheduler              import Scheduler
+from .scores                 import score_vector, save_scores, load_scores, calibrate as calibrate_scores
 from Bio                     import SeqIO, Align
 from Bio.Seq                 import Seq
 from Bio.SeqRecord           import SeqRecord
 from os                      import path
 
 class Metrics:
-    false_pos, false_negative = 0, 0
-    true_pos,  true_negative  = 0, 0
-    
+    # Counters of a verdict (True - attack) & a condition (True - attack record)
+    COUNTERS = [ 'true_pos', 'true_negative', 'false_pos', 'false_negative',
+                 'prefiltered', 'short_circuited', 'cache_lookups', 'cache_hits' ]
+
     accuracy    = property()
     precision   = property()
     recall      = property()
     specificity = property()
 
+    short_circuit_fraction = property()
+    accuracy_change        = property()
+    cache_hit_rate         = property()
+
+    def __init__(self):
+        self.false_pos, self.false_negative = 0, 0
+        self.true_pos,  self.true_negative  = 0, 0
+
+        # Packets checked by the prefilter & decided by it without alignment (see KmerPrefilter)
+        self.prefiltered, self.short_circuited = 0, 0
+        # Metrics of exact verdicts of the same packets, if the prefilter is audited
+        self.exact = None
+        # Packets looked up in the score cache & packets which were not aligned thanks to it (see ScoreCache)
+        self.cache_lookups, self.cache_hits = 0, 0
+
+    @staticmethod
+    def from_arrays(test_results, conditions):
+        """Returns Metrics of verdicts & conditions (boolean arrays, True - attack)."""
+        metrics = Metrics()
+        metrics.update_batch(test_results, conditions)
+        return metrics
+
     @accuracy.getter
     def accuracy(self):
         try:
@@ -55,13 +89,38 @@ class Metrics:
         except ZeroDivisionError:
             value = None
         return value
+
+    @short_circuit_fraction.getter
+    def short_circuit_fraction(self):
+        try:
+            value = self.short_circuited / self.prefiltered
+        except ZeroDivisionError:
+            value = None
+        return value
+
+    @accuracy_change.getter
+    def accuracy_change(self):
+        """Accuracy of verdicts minus accuracy of exact verdicts (None if the prefilter is not audited)."""
+        if self.exact is None or self.accuracy is None:
+            return None
+        return self.accuracy - self.exact.accuracy
+
+    @cache_hit_rate.getter
+    def cache_hit_rate(self):
+        try:
+            value = self.cache_hits / self.cache_lookups
+        except ZeroDivisionError:
+            value = None
+        return value
     
     def __add__(self, other):
-        result = self
-        result.true_pos         += other.true_pos
-        result.true_negative    += other.true_negative
-        result.false_pos        += other.false_pos
-        result.false_negative   += other.false_negative
+        """Returns new Metrics with counts of both, the operands are not changed."""
+        result = Metrics()
+        for counter in Metrics.COUNTERS:
+            setattr(result, counter, getattr(self, counter) + getattr(other, counter))
+        if self.exact is not None or other.exact is not None:
+            result.exact = (self.exact if self.exact is not None else Metrics()) + \
+                           (other.exact if other.exact is not None else Metrics())
         return result
         
     def update(self, test_result : bool, condition : bool) -> None:
@@ -75,6 +134,72 @@ class Metrics:
                 self.false_negative += 1
             else:
                 self.true_negative += 1
+
+    def update_batch(self, test_results, conditions) -> None:
+        """Vectorized update(): counts verdicts & conditions of many packets (boolean arrays, True - attack)."""
+        test_results, conditions = np.asarray(test_results, dtype=bool), np.asarray(conditions, dtype=bool)
+        if test_results.shape != conditions.shape:
+            raise Exception(f"Verdicts & conditions differ in shape: {test_results.shape}, {conditions.shape}")
+        true_pos  = int(np.count_nonzero(test_results & conditions))
+        false_pos = int(np.count_nonzero(test_results)) - true_pos
+        false_neg = int(np.count_nonzero(conditions)) - true_pos
+        self.true_pos       += true_pos
+        self.false_pos      += false_pos
+        self.false_negative += false_neg
+        self.true_negative  += test_results.size - true_pos - false_pos - false_neg
+
+    def confusion_matrix(self) -> pd.DataFrame:
+        """Counts of packets: rows - conditions, columns - verdicts."""
+        return pd.DataFrame([ [ self.true_negative,  self.false_pos ],
+                              [ self.false_negative, self.true_pos  ] ],
+                            index=[ "Normal", "Attack" ], columns=[ "Verdict: normal", "Verdict: attack" ])
+
+    @staticmethod
+    def sweep(scores, conditions, thresholds = None) -> pd.DataFrame:
+        """
+            Metrics of each threshold for packets with alignment @scores: a packet is an attack if its score is less
+            than the threshold. Scores are sorted once, counts of all thresholds are taken from cumulative sums.
+            Rows are ordered by thresholds, so they are points of the ROC curve (FPR, TPR) & PR curve (Recall, Precision).
+                @conditions - boolean array, True - attack record
+                @thresholds - thresholds to evaluate, all distinct scores & +inf by default (the full curves)
+        """
+        scores, conditions = np.asarray(scores, dtype=np.float64), np.asarray(conditions, dtype=bool)
+        order   = np.argsort(scores, kind='stable')
+        scores  = scores[order]
+        attacks = np.concatenate([ [ 0 ], np.cumsum(conditions[order]) ])
+        if thresholds is None:
+            thresholds = np.concatenate([ np.unique(scores), [ np.inf ] ])
+        thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+
+        # Packets with scores below each threshold are attacks
+        below     = np.searchsorted(scores, thresholds, side='left')
+        true_pos  = attacks[below]
+        false_pos = below - true_pos
+        positives = attacks[-1]
+        negatives = len(scores) - positives
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            curve = pd.DataFrame({ "Threshold"      : thresholds,
+                                   "True Positive"  : true_pos,
+                                   "False Positive" : false_pos,
+                                   "True Negative"  : negatives - false_pos,
+                                   "False Negative" : positives - true_pos,
+                                   "TPR"            : true_pos / positives if positives else np.nan,
+                                   "FPR"            : false_pos / negatives if negatives else np.nan,
+                                   "Precision"      : np.where(below > 0, true_pos / below, np.nan),
+                                   "Accuracy"       : (true_pos + negatives - false_pos) / len(scores) if len(scores) else np.nan })
+        curve["Recall"] = curve["TPR"]
+        return curve
+
+    @staticmethod
+    def areas(curve : pd.DataFrame) -> dict:
+        """Returns areas under the ROC curve (trapezoids) & the PR curve (average precision) of a sweep()."""
+        tpr, fpr = curve["TPR"].to_numpy(), curve["FPR"].to_numpy()
+        roc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if len(curve) > 1 else np.nan
+        # Each step of recall is weighted by precision of the threshold which reaches it
+        recall, precision = np.concatenate([ [ 0. ], tpr ]), curve["Precision"].fillna(0.).to_numpy()
+        pr = float(np.sum(np.diff(recall) * precision))
+        return { "ROC AUC" : roc, "PR AUC" : pr }
                 
     def as_dataframe(self, train_size, test_size) -> pd.DataFrame:
         return pd.DataFrame({
@@ -87,7 +212,10 @@ class Metrics:
                     "Recall"            : [self.recall],
                     "Specificity"       : [self.specificity],
                     "Test subset size"  : [test_size],
-                    "Train subset size" : [train_size]})
+                    "Train subset size" : [train_size],
+                    **({ "Short-circuited"  : [self.short_circuit_fraction],
+                         "Accuracy change"  : [self.accuracy_change] } if self.prefiltered else {}),
+                    **({ "Cache hit rate"   : [self.cache_hit_rate] } if self.cache_lookups else {})})
 
     def show(self):
         errors = pd.DataFrame({"True" : [self.true_pos, self.true_negative], \
@@ -97,6 +225,11 @@ class Metrics:
                             index=["Accuracy", "Precision", "Recall", "Specificity"])
         print(errors)
         print(metrics)
+        if self.prefiltered:
+            print(f"Short-circuited by the prefilter: {self.short_circuit_fraction:.4f}" +
+                  (f", accuracy change against exact mode: {self.accuracy_change:+.4f}" if self.accuracy_change is not None else ""))
+        if self.cache_lookups:
+            print(f"Score cache hit rate: {self.cache_hit_rate:.4f} ({self.cache_hits} of {self.cache_lookups} packets)")
 
 class IdealSequence(SeqRecord):
 
@@ -120,11 +253,22 @@ class IdealSequence(SeqRecord):
                 if aligner.score(self.seq, other_seqrec.seq) < self._threshold \
                     else False
 
+    def test_batch(self, scorer : BatchScorer, other_seqs : list, bounded = False, band = None) -> numpy_array:
+        """
+            Batched version of test(). Scorer must be built for this ideal sequence.
+            Returns boolean array: True - attack, False - normal activity.
+                @bounded - stop alignment of a sequence as soon as its verdict is certain
+                @band    - diagonal band width of bounded alignment (None - no band)
+        """
+        if bounded:
+            return scorer.classify(other_seqs, self._threshold, band)
+        return scorer.score(other_seqs) < self._threshold
+
     def dump(self, dest_dir : Path):
         """
             Puts ideal sequence in FASTA format in specified directory
         """
-        dest_dir.mkdir()
+        dest_dir.mkdir(parents=True, exist_ok=True)
         SeqIO.write(self, (dest_dir / "sequence.faa"), "fasta")
 
         with (dest_dir / Path("info.json")).open("w") as thold_file:
@@ -150,9 +294,17 @@ class IdealSequence(SeqRecord):
 
 class IDS:
     class Aligner(Align.PairwiseAligner):
-        def __init__(self, algo='Smith-Waterman') -> None:
+        PARAMS = [ 'mode', 'match_score', 'mismatch_score', 'open_gap_score', 'extend_gap_score' ]
+
+        def __init__(self, algo='Smith-Waterman', params=None) -> None:
+            """
+                @params - aligner parameters saved by IDS.Aligner.params(), they override @algo
+            """
             super().__init__()
-            if algo == 'Smith-Waterman':
+            if params is not None:
+                for name in IDS.Aligner.PARAMS:
+                    setattr(self, name, params[name])
+            elif algo == 'Smith-Waterman':
                 self.match            = 1.0
                 self.mismatch         = 0
                 self.open_gap_score   = 0
@@ -165,18 +317,71 @@ class IDS:
                 self.extend_gap_score = -0.5
                 self.mode             = 'global'
             print(f"Alignment algo: {self.algorithm}")
+
+        @staticmethod
+        def params(aligner : Align.PairwiseAligner) -> dict:
+            """Returns parameters which are needed to rebuild the aligner."""
+            return { name : getattr(aligner, name) for name in IDS.Aligner.PARAMS }
     
+    # Scoring of packets:
+    #   pairwise - one PairwiseAligner call per packet
+    #   batch    - BatchScorer scores a whole worker shard at once
+    #   bounded  - as batch, but testing stops aligning a packet once its verdict is certain
+    SCORINGS = [ 'pairwise', 'batch', 'bounded' ]
+
+    # Encoding of datasets which are aligned in batches:
+    #   letters - DNA letters, as CSV_Dataset.as_DNA_batch() gives
+    #   codes   - integer codes of letters, numbers are not formatted through str (see CSV_Dataset.as_DNA_codes())
+    ENCODINGS = [ 'letters', 'codes' ]
+
+    # Model bundle: ideal sequence (see IdealSequence.dump()), this file, optional scores of train records
+    # and the state of training which update() continues
+    MODEL_FILE  = "model.json"
+    SCORES_FILE = "scores.npy"
+    STATE_FILE  = "state.npz"
+
     _codetable  = None
     _aligner    = None
     _ideal_seq  = None
+    _scoring    = None
+    _scorer     = None
+    _band       = None
+    _dna_cache  = None
+    _encoding   = None
+    _prefilter  = None
+    _score_cache = None
+    _scheduler  = None
+    _train_scores = None
+    _quantiles    = None
+    _score_sum    = None
+    _calibration  = None
+    _medians      = None
 
     codetable       = property()
     aligner         = property()
     ideal_sequence  = property()
+    scoring         = property()
+    scorer          = property()
+    band            = property()
+    dna_cache       = property()
+    encoding        = property()
+    prefilter       = property()
+    score_cache     = property()
+    scheduler       = property()
+    utilization     = property()
+    train_scores    = property()
+    quantiles       = property()
+    calibration     = property()
 
-    def __init__(self, codetable : Codetable, aligner : Align.PairwiseAlignment):
+    def __init__(self, codetable : Codetable, aligner : Align.PairwiseAlignment, scoring = 'pairwise', band = None,
+                 encoding = 'letters'):
         self.codetable = codetable
         self.aligner   = aligner
+        self.scoring   = scoring
+        self.band      = band
+        self.encoding  = encoding
+        self.scheduler = Scheduler()
+        self._utilization = {}
 
     @codetable.setter
     def codetable(self, codetable : Codetable):
@@ -184,6 +389,40 @@ class IDS:
     @aligner.setter
     def aligner(self, aligner : Align.PairwiseAlignment):
         self._aligner = aligner
+        self._scorer  = None
+    @scoring.setter
+    def scoring(self, scoring : str):
+        if scoring not in IDS.SCORINGS:
+            raise Exception(f"Unknown scoring: {scoring}. Use one of {IDS.SCORINGS}")
+        self._scoring = scoring
+    @band.setter
+    def band(self, band : int):
+        if band is not None and band < 0:
+            raise Exception(f"Band width must be non-negative: {band}")
+        self._band = band
+    @dna_cache.setter
+    def dna_cache(self, dna_cache : DNACache):
+        self._dna_cache = dna_cache
+    @encoding.setter
+    def encoding(self, encoding : str):
+        if encoding not in IDS.ENCODINGS:
+            raise Exception(f"Unknown encoding: {encoding}. Use one of {IDS.ENCODINGS}")
+        self._encoding = encoding
+    @prefilter.setter
+    def prefilter(self, prefilter : KmerPrefilter):
+        """Prefilter of packets, it is calibrated by train()."""
+        self._prefilter = prefilter
+    @score_cache.setter
+    def score_cache(self, score_cache : ScoreCache):
+        """Cache of alignment scores of packets, it is shared by workers of test()."""
+        self._score_cache = score_cache
+    @scheduler.setter
+    def scheduler(self, scheduler : Scheduler):
+        """Splits records of train() & test() into tasks of workers."""
+        self._scheduler = scheduler
+    @ideal_sequence.setter
+    def ideal_sequence(self, ideal_seq : IdealSequence):
+        self._ideal_seq = ideal_seq
     
     @codetable.getter
     def codetable(self):
@@ -194,91 +433,508 @@ class IDS:
     @ideal_sequence.getter
     def ideal_sequence(self):
         return self._ideal_seq
+    @scoring.getter
+    def scoring(self):
+        return self._scoring
+    @band.getter
+    def band(self):
+        return self._band
+    @dna_cache.getter
+    def dna_cache(self):
+        return self._dna_cache
+    @encoding.getter
+    def encoding(self):
+        return self._encoding
+    @prefilter.getter
+    def prefilter(self):
+        return self._prefilter
+    @score_cache.getter
+    def score_cache(self):
+        return self._score_cache
+    @scheduler.getter
+    def scheduler(self):
+        return self._scheduler
+    @utilization.getter
+    def utilization(self):
+        """Utilization of each worker (see ExecutionEngine.utilization) in the last run of each stage: 'align', 'classify'."""
+        return self._utilization
+    @train_scores.getter
+    def train_scores(self):
+        """Score vector of train records of the last train() (see src.scores), None if they were not kept."""
+        return self._train_scores
+    @quantiles.getter
+    def quantiles(self):
+        """Column quantiles of all train records (see src.datasets.quantiles), None if the model can not be updated."""
+        return self._quantiles
+    @calibration.getter
+    def calibration(self):
+        """Calibration the threshold was chosen by (see write_threshold()), None - the mean score of train records."""
+        return self._calibration
+    @scorer.getter
+    def scorer(self):
+        """BatchScorer of the ideal sequence. It is built once per trained ideal sequence."""
+        if self._scorer is None or self._scorer.query != str(self.ideal_sequence.seq):
+            self._scorer = BatchScorer(self.aligner, self.ideal_sequence.seq)
+        return self._scorer
 
-    def get_multiple_align_score(self, seq : Seq, dna_sequences : numpy_array, tasks : list, pool : ThreadPool) -> float:
+    def encode(self, dataset : Dataset, cache = True) -> DNABatch:
+        """
+            Encodes dataset into a DNABatch with the encoding of this IDS.
+                @cache - use the DNA cache of this IDS (if it is set)
+        """
+        dna_cache = self.dna_cache if cache else None
+        if self.encoding == 'codes':
+            return dataset.as_DNA_codes(self.codetable, cache=dna_cache)
+        return dataset.as_DNA_batch(self.codetable, cache=dna_cache)
+
+    def get_multiple_align_score(self, seq : Seq, dna_sequences : numpy_array, proc_num = mp.cpu_count(), backend = 'thread') -> float:
         """
             Align seq with each record in dna_sequences list and return sum of alignment scores.
-                @dna_sequences - list of encoded DNA sequences
-                @tasks - list of (start_index, finish_index) tuples for each thread in @pool
-        """                
-        def _calc_multiple_alignment_score(wrapped_data : tuple) -> int:
-            """return value is a sum of all alignment scores in input rangerange."""   
-            (start, finish) = wrapped_data       
-            score_sum = 0.
-            for dna_record in tqdm(dna_sequences[start : finish + 1], total=(finish + 1 - start), desc="Training process"):
-                score_sum += self.aligner.score(seq, dna_record.seq)
-            return score_sum
-        return sum(s for s in pool.map(_calc_multiple_alignment_score, tasks))
+                @dna_sequences - DNABatch or list of encoded DNA records
+                @backend - execution backend: 'thread', 'process', 'shared' or 'serial'
+        """
+        state = { "aligner"       : self.aligner,
+                  "scoring"       : self.scoring,
+                  "seq"           : str(seq),
+                  "dna_sequences" : _shareable(dna_sequences if isinstance(dna_sequences, DNABatch) else \
+                                        [ str(dna_record.seq) for dna_record in dna_sequences ], backend) }
+        tasks = self.scheduler.plan(proc_num, Scheduler.costs(state["dna_sequences"]))
+
+        INSTRUMENTS.count("align.calls", len(state["dna_sequences"]))
+        with INSTRUMENTS.stage("align"):
+            return sum(self._map("align", _align_score_worker, tasks, state, proc_num, backend))
+
+    def get_align_scores(self, seq : Seq, dna_sequences : list, proc_num = mp.cpu_count(), backend = 'thread') -> numpy_array:
+        """
+            Align seq with each sequence in dna_sequences list and return array of alignment scores.
+                @dna_sequences - DNABatch or list of encoded DNA sequences (str)
+                @backend - execution backend: 'thread', 'process', 'shared' or 'serial'
+        """
+        if not dna_sequences:
+            return np.empty(0)
+
+        state = { "aligner"       : self.aligner,
+                  "scoring"       : self.scoring,
+                  "seq"           : str(seq),
+                  "dna_sequences" : _shareable(dna_sequences, backend) }
+        tasks = self.scheduler.plan(proc_num, Scheduler.costs(dna_sequences))
+
+        INSTRUMENTS.count("align.calls", len(dna_sequences))
+        with INSTRUMENTS.stage("align"):
+            return np.concatenate(Scheduler.ordered(tasks, self._map("align", _align_scores_worker, tasks, state, proc_num, backend)))
+
+    def _map(self, stage : str, func, tasks : list, state : dict, proc_num : int, backend : str) -> list:
+        """Runs func(state, task) for tasks on @proc_num workers, keeps utilization of workers of the stage."""
+        with ExecutionEngine(backend, min(proc_num, len(tasks)), state) as engine:
+            results = engine.map(func, tasks)
+        self._utilization[stage] = engine.utilization
+        return results
 
     # This function search ideal sequence in train dataset
-    def train(self, train_dataset : Dataset, proc_num = mp.cpu_count()) -> IdealSequence:
+    def train(self, train_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread', train_dna : DNABatch = None) -> IdealSequence:
+        """
+            @train_dna - train dataset already encoded with the codetable (it is not encoded again)
+        """
+        with INSTRUMENTS.stage("train.median"):
+            mean_row     = train_dataset.get_median()
+            mean_row_dna = mean_row.encode_into_DNA(self.codetable, id='')
+            # Counts of values are kept, so the model can be updated with new records (see update())
+            self._quantiles = ExactQuantiles().update(train_dataset)
+        train_ds_dna = train_dna if train_dna is not None else self.encode(train_dataset)
         
-        mean_row = train_dataset.get_median()
-                
+        THREADS = proc_num
+
+        # Scores of train records are kept, so the threshold can be calibrated later without aligning them again
+        scores = self.get_align_scores(mean_row_dna.seq, train_ds_dna, THREADS, backend)
+        self._train_scores = score_vector(scores, train_ds_dna.labels == "attack")
+        self._score_sum    = float(scores.sum())
+        self._calibration  = None
+        self._medians      = None
+        self._ideal_seq    = IdealSequence(mean_row_dna, float(scores.mean()))
+        if self.prefilter is not None:
+            # The prefilter is calibrated on exact verdicts of train records
+            with INSTRUMENTS.stage("train.prefilter"):
+                self.prefilter.calibrate(mean_row_dna.seq, train_ds_dna, scores < self._ideal_seq.threshold)
+            print(f"Prefilter band: ({self.prefilter.low}, {self.prefilter.high})")
+        return self._ideal_seq
+
+    def train_chunks(self, read_chunks, quantiles = None, proc_num = mp.cpu_count(), backend = 'thread') -> IdealSequence:
+        """
+            Trains on a dataset read by chunks, so the whole dataset is never in memory:
+            the first pass over chunks builds the ideal sequence from column medians,
+            the second one aligns the chunks with it and averages their scores into the threshold.
+                @read_chunks - function which returns a new iterator of chunks (Datasets) on each call,
+                               e.g. lambda: CSV_Dataset.read_chunks(path, chunk_size)
+                @quantiles   - ExactQuantiles (by default) or TDigestQuantiles (see CSV_Dataset.median_of_chunks())
+        """
+        if self.prefilter is not None:
+            raise Exception("Prefilter is calibrated on scores of all train records, it is not supported with chunked training")
+
+        # Quantiles are kept, so the model can be updated with new records (see update())
+        quantiles = quantiles if quantiles is not None else ExactQuantiles()
+        chunks = iter(read_chunks())
+        first  = next(chunks, None)
+        if first is None:
+            raise Exception("Train dataset is empty")
+        mean_row     = type(first).median_of_chunks(chain([ first ], chunks), quantiles)
         mean_row_dna = mean_row.encode_into_DNA(self.codetable, id='')
-        train_ds_dna = train_dataset.as_DNA_records(self.codetable)
-        
-        # Prepare environment for parallel execution
-        SIZE, THREADS = len(train_ds_dna), proc_num
-        TASKS = [ (start, finish) for start, finish in self._intervals(THREADS, SIZE) ]
 
-        with ThreadPool(THREADS) as pool:
-            score_sum = self.get_multiple_align_score(mean_row_dna.seq, train_ds_dna, TASKS, pool) 
+        score_sum, size = 0., 0
+        for chunk in read_chunks():
+            chunk_dna  = self.encode(chunk)
+            score_sum += self.get_multiple_align_score(mean_row_dna.seq, chunk_dna, proc_num, backend)
+            size      += len(chunk_dna)
 
-        self._ideal_seq = IdealSequence(mean_row_dna, score_sum / SIZE)
+        self._ideal_seq    = IdealSequence(mean_row_dna, score_sum / size)
+        self._train_scores, self._calibration, self._medians = None, None, None
+        self._quantiles, self._score_sum = quantiles, score_sum
         return self._ideal_seq
 
+    def update(self, new_dataset : Dataset, read_chunks = None, proc_num = mp.cpu_count(), backend = 'thread',
+               tolerance = 0.) -> IdealSequence:
+        """
+            Continues training with new records of normal activity instead of training again on all records:
+            they are added to quantiles of the train records and the ideal sequence is made of the new medians.
+            While the ideal sequence stays the same, only the new records are aligned and their scores are added
+            to the running sum of the threshold (the mean score). Otherwise all records are aligned with the new one.
+                @read_chunks - function which returns a new iterator of chunks of all train records, the new ones included,
+                               on each call (see train_chunks()). It is only read if the ideal sequence changes.
+                @tolerance   - the ideal sequence is kept while each new median differs from the median it was made of
+                               by at most this share of it. Then the model is not the one training again would give,
+                               but nothing is aligned again. (0 - the ideal sequence is always made of the new medians,
+                               inf - the ideal sequence is always kept)
+        """
+        if self.ideal_sequence is None or self._quantiles is None:
+            raise Exception("Model keeps no state of training (see train()), it can not be updated")
+        if self.prefilter is not None:
+            raise Exception("Prefilter is calibrated on scores of all train records, it is not supported with updates")
+        if not len(new_dataset):
+            return self._ideal_seq
+
+        # The model is not changed until all records are aligned
+        quantiles = deepcopy(self._quantiles).update(new_dataset)
+        # Medians the ideal sequence is made of, they are not the ones of quantiles if it was kept by a tolerance before
+        medians   = self._medians if self._medians is not None else self._quantiles.median()
+        kept      = self._within(quantiles.median(), medians, tolerance)
+        with INSTRUMENTS.stage("train.median"):
+            if kept:
+                print(f"New medians are within tolerance {tolerance} of the ideal sequence, it is kept")
+                mean_row_dna = self.ideal_sequence
+            else:
+                mean_row_dna, medians = type(new_dataset).median_record(quantiles.median()).encode_into_DNA(self.codetable, id=''), None
+
+        if str(mean_row_dna.seq) == str(self.ideal_sequence.seq):
+            new_dna   = self.encode(new_dataset)
+            scores    = self.get_align_scores(mean_row_dna.seq, new_dna, proc_num, backend)
+            score_sum = self._score_sum + float(scores.sum())
+            train_scores = None if self._train_scores is None else \
+                               np.concatenate([ self._train_scores, score_vector(scores, new_dna.labels == "attack") ])
+        else:
+            if read_chunks is None:
+                raise Exception("Ideal sequence is changed by new records, all train records must be aligned again: read_chunks is None")
+            print("Ideal sequence is changed by new records, aligning all train records again")
+            score_sum, size, vectors = 0., 0, []
+            for chunk in read_chunks():
+                chunk_dna  = self.encode(chunk)
+                scores     = self.get_align_scores(mean_row_dna.seq, chunk_dna, proc_num, backend)
+                score_sum += float(scores.sum())
+                size      += len(chunk_dna)
+                # Scores are kept if the model keeps them
+                if self._train_scores is not None:
+                    vectors.append(score_vector(scores, chunk_dna.labels == "attack"))
+            if size != quantiles.count:
+                raise Exception(f"Train records must be the ones of the model & the new ones: {size} read, {quantiles.count} expected")
+            train_scores = np.concatenate(vectors) if vectors else None
+
+        # A calibrated threshold is chosen again by the same calibration from scores of all train records
+        threshold = score_sum / quantiles.count
+        if self._calibration is not None and train_scores is not None:
+            threshold = calibrate_scores(train_scores, **self._calibration)
+        elif self._calibration is not None:
+            print(f"Warning: scores of train records are not kept, calibration {self._calibration} is replaced by the mean score")
+            self._calibration = None
+        elif not np.isclose(self._ideal_seq.threshold, self._score_sum / self._quantiles.count):
+            print(f"Warning: threshold {self._ideal_seq.threshold} of the model is not the mean score of train records, " +
+                  "it is replaced by the mean score")
+
+        self._quantiles, self._score_sum, self._train_scores, self._medians = quantiles, score_sum, train_scores, medians
+        self._ideal_seq = IdealSequence(mean_row_dna, threshold)
+        return self._ideal_seq
+
+    @staticmethod
+    def _within(new_medians : dict, medians : dict, tolerance : float) -> bool:
+        """Whether each new median differs from the median of the same column by at most @tolerance share of it."""
+        if tolerance <= 0:
+            return False
+        if np.isinf(tolerance):
+            return True
+        return all(abs(float(value) - float(medians[column])) <= tolerance * abs(float(medians[column]))
+                   for column, value in new_medians.items() if column in medians)
+
+    def dump(self, dest_dir : Path, scores = False):
+        """
+            Saves trained model into specified directory
+
+            dest_dir/sequence.faa - Ideal sequence
+            dest_dir/info.json    - Threshold
+            dest_dir/model.json   - Aligner parameters, scoring & hash of the codetable
+            dest_dir/scores.npy   - Score vector of train records (with @scores, see src.scores)
+            dest_dir/state.npz    - Quantiles & the sum of scores of train records (if the model can be updated)
+
+            Files of the list which are not written & signatures of MultiSignatureIDS are removed from the directory.
+        """
+        if self.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+        if scores and self.train_scores is None:
+            raise Exception("Scores of train records were not kept by the last training")
+
+        self.ideal_sequence.dump(dest_dir)
+        # Files of a model saved into the directory before must never be loaded with this one
+        if not scores:
+            (dest_dir / IDS.SCORES_FILE).unlink(missing_ok=True)
+        if self._quantiles is None:
+            (dest_dir / IDS.STATE_FILE).unlink(missing_ok=True)
+        (dest_dir / MultiSignatureIDS.CENTROIDS_FILE).unlink(missing_ok=True)
+        shutil.rmtree(dest_dir / MultiSignatureIDS.SIGNATURES_DIR, ignore_errors=True)
+
+        if scores:
+            save_scores(dest_dir / IDS.SCORES_FILE, self.train_scores)
+        if self._quantiles is not None:
+            np.savez(dest_dir / IDS.STATE_FILE, score_sum=np.array(self._score_sum), **self._quantiles.as_arrays())
+
+        with (dest_dir / IDS.MODEL_FILE).open("w") as model_file:
+            json.dump(self._model(), model_file, indent=4)
+
+    def _model(self) -> dict:
+        """Contents of the model file."""
+        model = { "aligner"   : IDS.Aligner.params(self.aligner),
+                  "scoring"   : self.scoring,
+                  "band"      : self.band,
+                  "encoding"  : self.encoding,
+                  "codetable" : self.codetable.digest() }
+        if self.prefilter is not None:
+            model["prefilter"] = self.prefilter.as_dict()
+        if self._calibration is not None:
+            model["calibration"] = self._calibration
+        if self._medians is not None:
+            # Values of the ideal sequence kept by update(), medians of quantiles differ from them
+            model["medians"] = { column : (value.item() if hasattr(value, "item") else value) for column, value in self._medians.items() }
+        return model
+
+    @staticmethod
+    def write_threshold(src_dir : Path, threshold : float, calibration : dict) -> None:
+        """
+            Replaces the threshold of a saved model with a calibrated one without loading the model.
+            The calibration (method & value, see src.scores.calibrate()) is kept in the model file,
+            so update() chooses the threshold the same way.
+        """
+        IdealSequence(IdealSequence.load(Path(src_dir)), threshold).dump(Path(src_dir))
+        model_path = Path(src_dir) / IDS.MODEL_FILE
+        with model_path.open("r") as model_file:
+            model = json.load(model_file)
+        model["calibration"] = calibration
+        with model_path.open("w") as model_file:
+            json.dump(model, model_file, indent=4)
+
+    def _blank(self):
+        """Returns untrained IDS with the same settings."""
+        ids = IDS(self.codetable, self.aligner, self.scoring, self.band, self.encoding)
+        ids.dna_cache = self.dna_cache
+        ids.prefilter = self.prefilter
+        ids.score_cache = self.score_cache
+        ids.scheduler = self.scheduler
+        return ids
+
+    @staticmethod
+    def load(src_dir : Path, codetable : Codetable):
+        """
+            Reads model saved by dump(). The codetable must be the one the model was trained with,
+            otherwise packets would be encoded differently from the ideal sequence.
+        """
+        model_path = Path(src_dir) / IDS.MODEL_FILE
+        if not model_path.is_file():
+            raise Exception(f"Model was not found: {model_path}")
+
+        with model_path.open("r") as model_file:
+            model = json.load(model_file)
+
+        if model["codetable"] != codetable.digest():
+            raise Exception(f"Codetable does not match the model: {model['codetable']} expected, got {codetable.digest()}")
+
+        if "signatures" in model:
+            ids = MultiSignatureIDS(codetable, IDS.Aligner(params=model["aligner"]), model["scoring"], model["band"],
+                                    **model["signatures"])
+            ids.load_signatures(Path(src_dir))
+        elif "fields" in model:
+            ids = FieldwiseIDS(codetable, IDS.Aligner(params=model["aligner"]), model["scoring"], model["band"],
+                               weights=model["fields"]["weights"], cache_capacity=model["fields"]["capacity"],
+                               votes=model["fields"].get("votes", 0))
+            ids._set_ideals(model["fields"]["ideals"])
+            ids._thresholds = model["fields"]["thresholds"]
+        else:
+            ids = IDS(codetable, IDS.Aligner(params=model["aligner"]), model["scoring"], model["band"])
+        # Models saved before the encoding was kept use letters
+        ids.encoding = model.get("encoding", 'letters')
+        ids._calibration = model.get("calibration")
+        ids._medians     = model.get("medians")
+        if "prefilter" in model:
+            ids.prefilter = KmerPrefilter(**model["prefilter"])
+        ids.ideal_sequence = IdealSequence.load(Path(src_dir))
+        if (Path(src_dir) / IDS.STATE_FILE).is_file():
+            with np.load(Path(src_dir) / IDS.STATE_FILE, allow_pickle=False) as state:
+                ids._quantiles, ids._score_sum = quantiles_from_arrays(state), float(state["score_sum"])
+        if (Path(src_dir) / IDS.SCORES_FILE).is_file():
+            ids._train_scores = load_scores(Path(src_dir) / IDS.SCORES_FILE)
+        return ids
+
     def classify(self, test_dna_seq : SeqRecord) -> bool:
         """Align DNA sequence with ideal and do prediction"""
+        if self.scoring == 'bounded' or self.prefilter is not None or self.score_cache is not None:
+            return bool(self.classify_batch([ test_dna_seq ])[0])
         return self.ideal_sequence.test(self.aligner, test_dna_seq)
+
+    def classify_batch(self, test_dna_seqs : list, metrics : Metrics = None) -> numpy_array:
+        """
+            Align many DNA sequences with ideal at once and do predictions
+                @metrics - Metrics which get statistics of the score cache
+        """
+        if self.prefilter is not None:
+            return self.classify_prefiltered(test_dna_seqs, metrics)[0]
+        if self.score_cache is not None:
+            return self._cached_verdicts(self._as_batch(test_dna_seqs), metrics)
+        if not isinstance(test_dna_seqs, DNABatch):
+            test_dna_seqs = [ str(dna_seq.seq) for dna_seq in test_dna_seqs ]
+        return self.ideal_sequence.test_batch(self.scorer, test_dna_seqs,
+                                              bounded=(self.scoring == 'bounded'), band=self.band)
     
+    def classify_prefiltered(self, test_dna_seqs, metrics : Metrics = None) -> tuple:
+        """
+            Decides packets with the prefilter and aligns only the ones it can not decide.
+            Returns (attacks, decided, exact): verdicts, packets decided without alignment and exact verdicts
+            of all packets (None unless the prefilter is audited).
+        """
+        test_dna_seqs    = self._as_batch(test_dna_seqs)
+        decided, attacks = self.prefilter.decide(self.ideal_sequence.seq, test_dna_seqs)
+
+        rows  = np.arange(len(test_dna_seqs)) if self.prefilter.audit else np.flatnonzero(~decided)
+        exact = np.zeros(len(test_dna_seqs), dtype=bool)
+        if len(rows):
+            aligned = test_dna_seqs.take(rows)
+            if self.score_cache is not None:
+                exact[rows] = self._cached_verdicts(aligned, metrics)
+            elif self.scoring == 'pairwise':
+                exact[rows] = [ self.ideal_sequence.test(self.aligner, dna_seq) for dna_seq in aligned.records() ]
+            else:
+                exact[rows] = self.ideal_sequence.test_batch(self.scorer, aligned, bounded=(self.scoring == 'bounded'), band=self.band)
+
+        INSTRUMENTS.count("classify.short_circuited", int(decided.sum()))
+        return np.where(decided, attacks, exact), decided, (exact if self.prefilter.audit else None)
+
     @staticmethod
-    def _intervals(parts, duration) -> list:
-        """ Private function. Split duration into ranges."""
-        part_duration = duration / parts
-        return [(floor(i * part_duration), floor((i + 1) * part_duration)) for i in range(parts)]
-    
-    def test(self, test_dataset : Dataset, proc_num = mp.cpu_count()) -> Metrics:
-        
+    def _as_batch(test_dna_seqs) -> DNABatch:
+        if isinstance(test_dna_seqs, DNABatch):
+            return test_dna_seqs
+        return DNABatch.from_strings([ str(dna_seq.seq) for dna_seq in test_dna_seqs ],
+                                     [ dna_seq.name for dna_seq in test_dna_seqs ])
+
+    def _cached_verdicts(self, test_dna : DNABatch, metrics : Metrics = None, ideal : IdealSequence = None,
+                         scorer : BatchScorer = None) -> numpy_array:
+        """
+            Verdicts of packets, only packets which are not in the score cache are aligned.
+            Keys are encoded sequences. Bounded scoring does not give exact scores, so its verdicts are
+            cached instead, under the threshold & band they were taken with.
+                @ideal, @scorer - signature to align with (the ideal sequence of this IDS by default)
+        """
+        ideal   = ideal  if ideal  is not None else self.ideal_sequence
+        scorer  = scorer if scorer is not None else self.scorer
+        bounded = self.scoring == 'bounded'
+        prefix  = (str(ideal.seq), test_dna.alphabet) + ((ideal.threshold, self.band) if bounded else ())
+        data    = test_dna.buffer.tobytes()
+        offsets = (test_dna.offsets - test_dna.offsets[0]).tolist()
+        keys    = [ (prefix, data[start : end]) for start, end in zip(offsets[:-1], offsets[1:]) ]
+
+        def align(positions : list) -> list:
+            missed = test_dna.take(positions)
+            INSTRUMENTS.count("classify.alignments", len(missed))
+            if bounded:
+                return ideal.test_batch(scorer, missed, bounded=True, band=self.band).tolist()
+            if self.scoring == 'pairwise':
+                return [ self.aligner.score(ideal.seq, dna_seq) for dna_seq in missed ]
+            return scorer.score(missed).tolist()
+
+        values, hits = self.score_cache.lookup(keys, align)
+        if metrics is not None:
+            metrics.cache_lookups += len(keys)
+            metrics.cache_hits    += hits
+        values = np.asarray(values, dtype=bool if bounded else np.float64)
+        return values if bounded else values < ideal.threshold
+
+    def test(self, test_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread') -> Metrics:
+        """
+            @test_dataset - Dataset or DNABatch of already encoded records
+        """
         if self.ideal_sequence is None:
             raise Exception("Ideal sequence is None")
-        
-        def test_worker(wrapped_data : tuple) -> Metrics:
-            (start, finish), metrics = wrapped_data, Metrics()
-            for i in tqdm(range(start, finish), desc="Testing process"):  
-                # Obtain DatasetRecord instance
-                ds_rec = test_dataset.raw_index(i)
-                # Encode it in DNA
-                test_dna_seq = ds_rec.encode_into_DNA(self.codetable, id=str(i))            
-                # Test it with IdealSequence
-                metrics.update(self.classify(test_dna_seq), test_dna_seq.name == "attack")
-                
-            return metrics
                         
         SIZE, PROCS = len(test_dataset), proc_num 
-        TASKS   = [ (start, finish) for start, finish in self._intervals(PROCS, SIZE)]
         METRICS = Metrics()
+
+        if isinstance(test_dataset, DNABatch):
+            STATE = { "ids" : self, "test_dna" : test_dataset }
+        elif self.dna_cache is not None or backend == 'shared':
+            # With the cache the whole dataset is looked up at once instead of encoding it by shards,
+            # with shared memory sequences are encoded once and shared with workers
+            STATE = { "ids" : self, "test_dna" : self.encode(test_dataset) }
+        else:
+            STATE = { "ids" : self, "test_dataset" : test_dataset }
+        # Records which are not encoded yet are taken as equally costly
+        TASKS = self.scheduler.plan(PROCS, Scheduler.costs(STATE["test_dna"]) if "test_dna" in STATE else SIZE)
         
-        # Make the Pool of workers
-        with ThreadPool(PROCS) as pool:
-            for met in pool.map(test_worker, TASKS):   
+        # Make the Pool of workers. Without the cache workers encode their shards, it is a part of 'classify' stage
+        INSTRUMENTS.count("classify.packets", SIZE)
+        with INSTRUMENTS.stage("classify"):
+            for met in self._map("classify", _test_worker, TASKS, STATE, PROCS, backend):
                 METRICS = METRICS + met
 
         return METRICS
 
-    def analyze(self, train_ds : Dataset, test_ds : Dataset, sizes=[10, 8, 6, 4, 2, 1]) -> pd.DataFrame:
+    def scores(self, test_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread') -> numpy_array:
+        """
+            Returns exact alignment scores of test records with the ideal sequence.
+                @test_dataset - Dataset or DNABatch of already encoded records
+        """
+        if self.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+        test_dna = test_dataset if isinstance(test_dataset, DNABatch) else self.encode(test_dataset)
+        return self.get_align_scores(self.ideal_sequence.seq, test_dna, proc_num, backend)
+
+    def sweep(self, test_dataset : Dataset, thresholds = None, proc_num = mp.cpu_count(), backend = 'thread') -> pd.DataFrame:
+        """
+            Metrics of trained IDS with each of @thresholds instead of the trained one (see Metrics.sweep()).
+            Test records are aligned once for all thresholds.
+                @test_dataset - Dataset or DNABatch of already encoded records
+        """
+        test_dna = test_dataset if isinstance(test_dataset, DNABatch) else self.encode(test_dataset)
+        return Metrics.sweep(self.scores(test_dna, proc_num, backend), test_dna.labels == "attack", thresholds)
+
+    def analyze(self, train_ds : Dataset, test_ds : Dataset, sizes=[10, 8, 6, 4, 2, 1], backend = 'thread', nested = False) -> pd.DataFrame:
         """
             Test IDS metrics on different sample size of train dataset.
             @sizes - the size of parts of test dataset is using.
+            @backend - execution backend of training and testing: 'thread', 'process', 'shared' or 'serial'
+            @nested - take samples as prefixes of one shuffled train dataset and reuse alignment scores (see analyze_nested())
 
             For example:
                 sizes=[10, 5] means that (test_ds_size/10) and (test_ds_size/5) will be taken. 
         """
+        if nested:
+            return self.analyze_nested(train_ds, test_ds, sizes, backend)
+
         TRAIN_DS_SIZE = len(train_ds)
         METRICS       = pd.DataFrame(None)    
 
         # Test IDS instance
-        ids = IDS(self.codetable, self.aligner)
+        ids = self._blank()
 
         for s in sizes:
             SAMPLE_SIZE = int(TRAIN_DS_SIZE / s)
@@ -286,10 +942,568 @@ class IDS:
             # Get sample of train dataset
             current_train_ds = train_ds.random_sample(SAMPLE_SIZE)            
             # Obtain ideal sequence
-            ids.train(current_train_ds)
+            ids.train(current_train_ds, backend=backend)
             # Get metrics
-            metrics = ids.test(test_ds).as_dataframe(SAMPLE_SIZE, len(test_ds))
+            metrics = ids.test(test_ds, backend=backend).as_dataframe(SAMPLE_SIZE, len(test_ds))
             
-            METRICS = METRICS.append(metrics)
+            METRICS = pd.concat([ METRICS, metrics ])
                     
-        return METRICS
\ No newline at end of file
+        return METRICS
+
+    def analyze_nested(self, train_ds : Dataset, test_ds : Dataset, sizes=[10, 8, 6, 4, 2, 1], backend = 'thread') -> pd.DataFrame:
+        """
+            Same as analyze(), but samples of train dataset are nested prefixes of one permutation of it.
+            Samples are processed from the smallest one. Alignment scores of train & test records are kept
+            for each ideal sequence: while the median of a larger prefix encodes into the same ideal sequence,
+            only the new train records are aligned, the threshold is taken from prefix sums of scores and the
+            test records are not aligned again. So a sweep costs about as much as its largest size.
+            Verdicts are taken from exact scores, so 'bounded' scoring gives the same metrics as 'batch' and the prefilter is not used.
+            Kept test scores also give the areas under ROC & PR curves of each sample ("ROC AUC", "PR AUC", see Metrics.sweep()).
+        """
+        TRAIN_DS_SIZE = len(train_ds)
+        SAMPLE_SIZES  = [ int(TRAIN_DS_SIZE / s) for s in sizes ]
+
+        # One permutation, each sample is a prefix of it
+        shuffled_ds   = train_ds.random_sample(TRAIN_DS_SIZE)
+        train_dna     = self.encode(shuffled_ds)
+        test_dna      = self.encode(test_ds)
+        test_attacks  = test_dna.labels == "attack"
+
+        # Ideal sequence -> prefix sums of train scores & test scores
+        train_sums, test_scores, results = {}, {}, {}
+
+        for SAMPLE_SIZE in sorted(set(SAMPLE_SIZES)):
+            print(f"Train Dataset size : {SAMPLE_SIZE}")
+            ideal_dna = type(shuffled_ds)(shuffled_ds.iloc[:SAMPLE_SIZE]).get_median().encode_into_DNA(self.codetable, id='')
+            ideal     = str(ideal_dna.seq)
+
+            sums = train_sums.get(ideal, np.zeros(1))
+            if len(sums) <= SAMPLE_SIZE:
+                print(f"Aligning train records {len(sums) - 1}..{SAMPLE_SIZE}")
+                new_scores = self.get_align_scores(ideal, train_dna[len(sums) - 1 : SAMPLE_SIZE], backend=backend)
+                sums = np.concatenate([ sums, sums[-1] + np.cumsum(new_scores) ])
+                train_sums[ideal] = sums
+            
+            if ideal not in test_scores:
+                print("Aligning test records with new ideal sequence")
+                test_scores[ideal] = self.get_align_scores(ideal, test_dna, backend=backend)
+
+            self._ideal_seq = IdealSequence(ideal_dna, sums[SAMPLE_SIZE] / SAMPLE_SIZE)
+
+            metrics = Metrics.from_arrays(test_scores[ideal] < self._ideal_seq.threshold, test_attacks)
+            results[SAMPLE_SIZE] = metrics.as_dataframe(SAMPLE_SIZE, len(test_ds))
+            # Every threshold is evaluated on the kept scores, nothing is aligned again
+            for name, area in Metrics.areas(Metrics.sweep(test_scores[ideal], test_attacks)).items():
+                results[SAMPLE_SIZE][name] = area
+
+        return pd.concat([ results[SAMPLE_SIZE] for SAMPLE_SIZE in SAMPLE_SIZES ])
+
+class MultiSignatureIDS(IDS):
+    """
+        IDS with several signatures. Train records are clustered by their k-mer sketches (see KmerSketch), each
+        cluster gets its own ideal sequence (median of the cluster) and threshold (mean alignment score of the
+        cluster with it). A packet is aligned only with signatures of the @candidates clusters whose centroids
+        are the closest to its sketch, from the closest one, and it is normal if it passes any of them.
+        So classification costs at most @candidates alignments per packet whatever the number of clusters is.
+        ideal_sequence is the signature of the largest cluster.
+    """
+    # Model bundle: IDS files, centroids of clusters & signatures/<cluster>/ (see IdealSequence.dump())
+    SIGNATURES_DIR = "signatures"
+    CENTROIDS_FILE = "centroids.npy"
+
+    # Iterations of k-means
+    ITERATIONS = 20
+
+    _clusters   = None
+    _candidates = None
+    _sketch     = None
+    _seed       = None
+    _signatures = None
+    _centroids  = None
+    _scorers    = None
+
+    clusters    = property()
+    candidates  = property()
+    sketch      = property()
+    signatures  = property()
+    centroids   = property()
+
+    def __init__(self, codetable : Codetable, aligner : Align.PairwiseAlignment, scoring = 'pairwise', band = None,
+                 encoding = 'letters', clusters = 4, candidates = 2, k = 3, buckets = 256, seed = 0):
+        """
+            @clusters   - number of signatures (clusters may be fewer if train records are alike)
+            @candidates - number of the closest signatures a packet is aligned with
+            @k, buckets - k-mer sketch of records (see KmerSketch)
+            @seed       - seed of k-means
+        """
+        super().__init__(codetable, aligner, scoring, band, encoding)
+        if clusters < 1 or candidates < 1:
+            raise Exception(f"Numbers of clusters & candidates must be positive: {clusters}, {candidates}")
+        self._clusters, self._candidates, self._seed = clusters, candidates, seed
+        self._sketch = KmerSketch(k, buckets)
+
+    @clusters.getter
+    def clusters(self):
+        return self._clusters
+    @candidates.getter
+    def candidates(self):
+        return self._candidates
+    @sketch.getter
+    def sketch(self):
+        return self._sketch
+    @signatures.getter
+    def signatures(self):
+        return self._signatures
+    @centroids.getter
+    def centroids(self):
+        return self._centroids
+
+    def train_chunks(self, read_chunks, quantiles = None, proc_num = mp.cpu_count(), backend = 'thread') -> IdealSequence:
+        raise Exception("Records are clustered by their sketches all at once, chunked training is not supported with several signatures")
+
+    def scores(self, test_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread') -> numpy_array:
+        raise Exception("Each signature has its own threshold, scores of several signatures can not be swept with one threshold")
+
+    def update(self, new_dataset : Dataset, read_chunks = None, proc_num = mp.cpu_count(), backend = 'thread') -> IdealSequence:
+        raise Exception("New records may change clusters of signatures, updates are not supported with several signatures")
+
+    def train(self, train_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread', train_dna : DNABatch = None) -> IdealSequence:
+        """
+            @train_dna - train dataset already encoded with the codetable (it is not encoded again)
+        """
+        if not len(train_dataset):
+            raise Exception("Train dataset is empty")
+        if self.prefilter is not None:
+            raise Exception("Prefilter is calibrated for one ideal sequence, it is not supported with several signatures")
+        train_ds_dna = train_dna if train_dna is not None else self.encode(train_dataset)
+
+        with INSTRUMENTS.stage("train.cluster"):
+            labels, centroids = self._kmeans(self.sketch.sketch(train_ds_dna), self.clusters, self._seed, self.ITERATIONS)
+
+        signatures = []
+        for cluster in range(len(centroids)):
+            members = np.flatnonzero(labels == cluster)
+            with INSTRUMENTS.stage("train.median"):
+                cluster_ds = type(train_dataset)(train_dataset.iloc[members])
+                ideal_dna  = cluster_ds.get_median().encode_into_DNA(self.codetable, id=str(cluster))
+            scores = self.get_align_scores(ideal_dna.seq, train_ds_dna.take(members), proc_num, backend)
+            signatures.append(IdealSequence(ideal_dna, float(scores.mean())))
+            print(f"Signature {cluster}: {len(members)} records, threshold {signatures[-1].threshold}")
+
+        self._signatures, self._centroids, self._scorers = signatures, centroids, {}
+        # Each signature has its own threshold, one vector of scores can not calibrate them
+        self._train_scores = None
+        self._ideal_seq = signatures[int(np.argmax(np.bincount(labels)))]
+        return self._ideal_seq
+
+    @staticmethod
+    def _kmeans(points : np.ndarray, clusters : int, seed, iterations : int) -> tuple:
+        """
+            Spherical k-means (cosine similarity of normalized points) with k-means++ seeding.
+            Returns (labels, centroids), clusters which are left empty are dropped.
+        """
+        rng       = np.random.default_rng(seed)
+        centroids = [ points[rng.integers(len(points))] ]
+        distance  = 1. - points @ centroids[0]
+        while len(centroids) < clusters:
+            weights = np.maximum(distance, 0.).astype(np.float64) ** 2
+            # There are fewer distinct points than clusters
+            if weights.sum() <= 0:
+                break
+            centroids.append(points[rng.choice(len(points), p=weights / weights.sum())])
+            distance = np.minimum(distance, 1. - points @ centroids[-1])
+        centroids = np.array(centroids)
+
+        labels = np.argmax(points @ centroids.T, axis=1)
+        for _ in range(iterations):
+            sums      = np.eye(len(centroids), dtype=points.dtype)[labels].T @ points
+            norms     = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1.), centroids)
+            new_labels = np.argmax(points @ centroids.T, axis=1)
+            if (new_labels == labels).all():
+                break
+            labels = new_labels
+
+        used = np.unique(labels)
+        return np.searchsorted(used, labels), centroids[used]
+
+    def closest_signatures(self, test_dna_seqs) -> numpy_array:
+        """Returns (len(test_dna_seqs), candidates) indices of signatures, from the closest one to each packet."""
+        similarity = KmerSketch.similarity(self.sketch.sketch(test_dna_seqs), self._centroids)
+        return np.argsort(-similarity, axis=1, kind='stable')[:, : min(self.candidates, len(self._signatures))]
+
+    def _scorer_of(self, signature : int) -> BatchScorer:
+        if signature not in self._scorers:
+            self._scorers[signature] = BatchScorer(self.aligner, self._signatures[signature].seq)
+        return self._scorers[signature]
+
+    def classify(self, test_dna_seq : SeqRecord) -> bool:
+        """Align DNA sequence with the closest signatures and do prediction"""
+        if self.scoring == 'bounded' or self.score_cache is not None:
+            return bool(self.classify_batch([ test_dna_seq ])[0])
+        closest = self.closest_signatures([ str(test_dna_seq.seq) ])[0]
+        INSTRUMENTS.count("classify.alignments", len(closest))
+        return all(self._signatures[signature].test(self.aligner, test_dna_seq) for signature in closest)
+
+    def classify_batch(self, test_dna_seqs : list, metrics : Metrics = None) -> numpy_array:
+        """
+            Align many DNA sequences with their closest signatures at once and do predictions.
+            Packets of each signature are aligned in one batch, a packet is aligned with the next
+            closest signature only if the previous one found it anomalous.
+                @metrics - Metrics which get statistics of the score cache
+        """
+        if not isinstance(test_dna_seqs, DNABatch):
+            test_dna_seqs = DNABatch.from_strings([ str(dna_seq.seq) for dna_seq in test_dna_seqs ], np.zeros(len(test_dna_seqs)))
+        closest = self.closest_signatures(test_dna_seqs)
+        normal  = np.zeros(len(test_dna_seqs), dtype=bool)
+
+        for rank in range(closest.shape[1]):
+            for signature in np.unique(closest[:, rank]):
+                rows = np.flatnonzero((closest[:, rank] == signature) & ~normal)
+                if not len(rows):
+                    continue
+                if self.score_cache is not None:
+                    normal[rows] = ~self._cached_verdicts(test_dna_seqs.take(rows), metrics, self._signatures[signature],
+                                                          self._scorer_of(signature))
+                    continue
+                INSTRUMENTS.count("classify.alignments", len(rows))
+                normal[rows] = ~self._signatures[signature].test_batch(self._scorer_of(signature), test_dna_seqs.take(rows),
+                                                                       bounded=(self.scoring == 'bounded'), band=self.band)
+        return ~normal
+
+    def analyze_nested(self, train_ds : Dataset, test_ds : Dataset, sizes=[10, 8, 6, 4, 2, 1], backend = 'thread') -> pd.DataFrame:
+        raise Exception("Nested analysis reuses scores of one ideal sequence, it is not supported with several signatures")
+
+    def dump(self, dest_dir : Path, scores = False):
+        """
+            Saves trained model into specified directory: files of IDS.dump() and
+
+            dest_dir/centroids.npy             - Centroids of clusters in k-mer sketch space
+            dest_dir/signatures/<cluster>/     - Ideal sequence & threshold of each cluster
+        """
+        super().dump(dest_dir, scores)
+        np.save(dest_dir / self.CENTROIDS_FILE, self._centroids)
+        for cluster, signature in enumerate(self._signatures):
+            signature.dump(dest_dir / self.SIGNATURES_DIR / str(cluster))
+
+    def load_signatures(self, src_dir : Path):
+        """Reads signatures & centroids saved by dump()."""
+        self._centroids  = np.load(src_dir / self.CENTROIDS_FILE)
+        self._signatures = [ IdealSequence.load(src_dir / self.SIGNATURES_DIR / str(cluster)) for cluster in range(len(self._centroids)) ]
+        self._scorers    = {}
+
+    def _model(self) -> dict:
+        model = super()._model()
+        model["signatures"] = { "clusters"   : self.clusters,
+                                "candidates" : self.candidates,
+                                "k"          : self.sketch.k,
+                                "buckets"    : self.sketch.buckets,
+                                "seed"       : self._seed }
+        return model
+
+    def _blank(self):
+        ids = MultiSignatureIDS(self.codetable, self.aligner, self.scoring, self.band, self.encoding,
+                                self.clusters, self.candidates, self.sketch.k, self.sketch.buckets, self._seed)
+        ids.dna_cache = self.dna_cache
+        ids.score_cache = self.score_cache
+        ids.scheduler = self.scheduler
+        return ids
+
+class FieldwiseIDS(IDS):
+    """
+        IDS which aligns each field of a packet separately with the same field of the ideal record instead of
+        aligning one sequence of all fields. Each field has a threshold: the mean score of the field over train records.
+        Decision rules of packets:
+            sum   (@votes = 0) - the combined score (weighted sum of field scores) is less than the weighted sum
+                                 of per-field thresholds. The threshold can be calibrated from scores of train records.
+            votes (@votes = K) - at least K fields of non-zero weight score less than their thresholds.
+        Alignments are short and fields repeat a few distinct values, so scores of each field are kept in the field cache
+        and only new values are aligned. Fields are encoded into letters whatever the encoding is, 'bounded' scoring
+        aligns fields as 'batch' does.
+    """
+    _weights     = None
+    _votes       = None
+    _field_cache = None
+    _ideals      = None
+    _thresholds  = None
+    _scorers     = None
+
+    weights     = property()
+    votes       = property()
+    field_cache = property()
+    ideals      = property()
+    thresholds  = property()
+
+    def __init__(self, codetable : Codetable, aligner : Align.PairwiseAlignment, scoring = 'pairwise', band = None,
+                 encoding = 'letters', weights : dict = None, cache_capacity = 100000, votes = 0):
+        """
+            @weights        - field -> weight of its score (1 for fields which are not listed, 0 - the field is not aligned)
+            @cache_capacity - number of field scores the field cache holds
+            @votes          - number of anomalous fields which make a packet an attack (0 - compare the combined score)
+        """
+        super().__init__(codetable, aligner, scoring, band, encoding)
+        weights = dict(weights or {})
+        if any(weight < 0 for weight in weights.values()):
+            raise Exception(f"Field weights must be non-negative: {weights}")
+        if votes < 0:
+            raise Exception(f"Number of field votes must be non-negative: {votes}")
+        self._weights     = weights
+        self._votes       = int(votes)
+        self._field_cache = ScoreCache(cache_capacity)
+
+    @weights.getter
+    def weights(self):
+        return self._weights
+    @votes.getter
+    def votes(self):
+        return self._votes
+    @field_cache.getter
+    def field_cache(self):
+        return self._field_cache
+    @ideals.getter
+    def ideals(self):
+        """Field -> DNA of the field of the ideal record."""
+        return self._ideals
+    @thresholds.getter
+    def thresholds(self):
+        """Field -> mean score of the field over train records."""
+        return self._thresholds
+
+    def weight(self, field : str) -> float:
+        return float(self._weights.get(field, 1.))
+
+    def encode_fields(self, dataset : Dataset) -> dict:
+        """Returns field -> DNABatch of the field (see CSV_Dataset.as_DNA_fields())."""
+        return dataset.as_DNA_fields(self.codetable)
+
+    def train(self, train_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread', train_dna : DNABatch = None) -> IdealSequence:
+        """
+            Train records are aligned field by field in the calling process: fields have a few distinct values
+            and each one is aligned once. @train_dna is not used, fields are encoded separately.
+        """
+        if not len(train_dataset):
+            raise Exception("Train dataset is empty")
+        if self.prefilter is not None:
+            raise Exception("Prefilter compares whole sequences, it is not supported with field-wise alignment")
+
+        with INSTRUMENTS.stage("train.median"):
+            median_row   = train_dataset.get_median()
+            mean_row_dna = median_row.encode_into_DNA(self.codetable, id='')
+            table        = self.codetable.translation_table()
+            self._set_ideals({ field : str(value).translate(table) for field, value in zip(train_dataset.columns[:-1], median_row.record) })
+
+        if self._votes > sum(1 for field in self._ideals if self.weight(field)):
+            raise Exception(f"Number of field votes is more than the number of weighted fields: {self._votes}")
+
+        fields = self.encode_fields(train_dataset)
+        scores = self.field_scores(fields)
+        self._thresholds = { field : float(mean) for field, mean in zip(self._ideals, scores.mean(axis=0)) }
+        # Combination is linear, so the mean of combined scores is the combined threshold.
+        # Votes do not compare combined scores, there is nothing to calibrate
+        self._train_scores = None if self._votes else \
+                             score_vector(self._combine(scores), next(iter(fields.values())).labels == "attack")
+
+        for field, threshold in self._thresholds.items():
+            print(f"Field {field}: weight {self.weight(field)}, threshold {threshold}")
+        self._ideal_seq = IdealSequence(mean_row_dna, self._combine(np.array([ list(self._thresholds.values()) ]))[0])
+        return self._ideal_seq
+
+    def train_chunks(self, read_chunks, quantiles = None, proc_num = mp.cpu_count(), backend = 'thread') -> IdealSequence:
+        raise Exception("Chunked training is not supported with field-wise alignment")
+
+    def update(self, new_dataset : Dataset, read_chunks = None, proc_num = mp.cpu_count(), backend = 'thread') -> IdealSequence:
+        raise Exception("Updates are not supported with field-wise alignment")
+
+    def scores(self, test_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread') -> numpy_array:
+        """Returns combined field scores of test records (see classify_fields()), they are compared with the threshold."""
+        if self.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+        if self._votes:
+            raise Exception("Packets are decided by field votes, their combined scores are not compared with a threshold")
+        fields = test_dataset if isinstance(test_dataset, dict) else self.encode_fields(test_dataset)
+        return self._combine(self.field_scores(fields))
+
+    def sweep(self, test_dataset : Dataset, thresholds = None, proc_num = mp.cpu_count(), backend = 'thread') -> pd.DataFrame:
+        """
+            @test_dataset - Dataset or dict of already encoded fields (see encode_fields())
+        """
+        fields = test_dataset if isinstance(test_dataset, dict) else self.encode_fields(test_dataset)
+        labels = next(iter(fields.values())).labels
+        return Metrics.sweep(self.scores(fields, proc_num, backend), labels == "attack", thresholds)
+
+    def _set_ideals(self, ideals : dict) -> None:
+        self._ideals  = ideals
+        self._scorers = {}
+
+    def _scorer_of(self, field : str) -> BatchScorer:
+        if field not in self._scorers:
+            self._scorers[field] = BatchScorer(self.aligner, self._ideals[field])
+        return self._scorers[field]
+
+    def _combine(self, scores : numpy_array) -> numpy_array:
+        """Weighted sum of (packets, fields) matrix of field scores."""
+        return scores @ np.array([ self.weight(field) for field in self._ideals ])
+
+    def field_scores(self, fields : dict, metrics : Metrics = None) -> numpy_array:
+        """
+            Returns (packets, fields) matrix of alignment scores of each field with the field of the ideal record,
+            in order of ideals. Fields with zero weight are not aligned (their scores are 0).
+                @metrics - Metrics which get statistics of the field cache
+        """
+        size   = len(next(iter(fields.values()))) if fields else 0
+        scores = np.zeros((size, len(self._ideals)))
+        for column, (field, ideal) in enumerate(self._ideals.items()):
+            if not self.weight(field):
+                continue
+            batch   = fields[field]
+            data    = batch.buffer.tobytes()
+            offsets = (batch.offsets - batch.offsets[0]).tolist()
+            keys    = [ ((field, ideal), data[start : end]) for start, end in zip(offsets[:-1], offsets[1:]) ]
+
+            def align(positions : list, batch = batch, field = field, ideal = ideal) -> list:
+                missed = batch.take(positions)
+                INSTRUMENTS.count("classify.alignments", len(missed))
+                INSTRUMENTS.count("align.cells", len(ideal) * int(missed.lengths.sum()))
+                if self.scoring == 'pairwise':
+                    return [ self.aligner.score(ideal, value) for value in missed ]
+                return self._scorer_of(field).score(missed).tolist()
+
+            values, hits = self.field_cache.lookup(keys, align)
+            scores[:, column] = values
+            if metrics is not None:
+                metrics.cache_lookups += len(keys)
+                metrics.cache_hits    += hits
+        return scores
+
+    def classify_fields(self, fields : dict, metrics : Metrics = None) -> numpy_array:
+        """Returns verdicts of packets encoded field by field (True - attack)."""
+        scores = self.field_scores(fields, metrics)
+        if self._votes:
+            return self._anomalies(scores).sum(axis=1) >= self._votes
+        return self._combine(scores) < self.ideal_sequence.threshold
+
+    def _anomalies(self, scores : numpy_array) -> numpy_array:
+        """(packets, fields) matrix: True where a field of non-zero weight scores less than its threshold."""
+        weighted = np.array([ self.weight(field) > 0 for field in self._ideals ])
+        return (scores < np.array([ self._thresholds[field] for field in self._ideals ])) & weighted
+
+    def anomalous_fields(self, fields : dict) -> pd.DataFrame:
+        """Returns (packets, fields) frame: True where the field scores less than its threshold."""
+        return pd.DataFrame(self._anomalies(self.field_scores(fields)), columns=list(self._ideals))
+
+    def classify(self, test_dna_seq : SeqRecord) -> bool:
+        raise Exception("Field-wise IDS classifies packets encoded field by field, use classify_fields()")
+
+    def classify_batch(self, test_dna_seqs : list, metrics : Metrics = None) -> numpy_array:
+        raise Exception("Field-wise IDS classifies packets encoded field by field, use classify_fields()")
+
+    def test(self, test_dataset : Dataset, proc_num = mp.cpu_count(), backend = 'thread') -> Metrics:
+        """
+            @test_dataset - Dataset or dict of already encoded fields (see encode_fields())
+        """
+        if self.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+
+        fields = test_dataset if isinstance(test_dataset, dict) else self.encode_fields(test_dataset)
+        SIZE   = len(next(iter(fields.values())))
+        # Repeated field values are cached, so packets are taken as equally costly
+        TASKS  = self.scheduler.plan(proc_num, SIZE)
+        METRICS = Metrics()
+
+        INSTRUMENTS.count("classify.packets", SIZE)
+        with INSTRUMENTS.stage("classify"):
+            for met in self._map("classify", _fields_test_worker, TASKS, { "ids" : self, "fields" : fields }, proc_num, backend):
+                METRICS = METRICS + met
+        return METRICS
+
+    def analyze_nested(self, train_ds : Dataset, test_ds : Dataset, sizes=[10, 8, 6, 4, 2, 1], backend = 'thread') -> pd.DataFrame:
+        raise Exception("Nested analysis reuses scores of one ideal sequence, it is not supported with field-wise alignment")
+
+    def _model(self) -> dict:
+        model = super()._model()
+        model["fields"] = { "weights"    : self._weights,
+                            "votes"      : self._votes,
+                            "capacity"   : self.field_cache.capacity,
+                            "ideals"     : self._ideals,
+                            "thresholds" : self._thresholds }
+        return model
+
+    def _blank(self):
+        ids = FieldwiseIDS(self.codetable, self.aligner, self.scoring, self.band, self.encoding,
+                           self._weights, self.field_cache.capacity, self._votes)
+        # Field scores do not depend on the train sample, so they are shared
+        ids._field_cache = self.field_cache
+        ids.scheduler = self.scheduler
+        return ids
+
+def _shareable(dna_sequences, backend : str):
+    """Sequences of the state of workers: a list of str is packed into a DNABatch to be put in shared memory."""
+    if backend == 'shared' and not isinstance(dna_sequences, DNABatch):
+        return DNABatch.from_strings(list(dna_sequences), [ '' ] * len(dna_sequences))
+    return dna_sequences
+
+def _state_scorer(state : dict) -> BatchScorer:
+    """BatchScorer of the aligned sequence, built once per worker process for all its tasks."""
+    if "scorer" not in state:
+        state["scorer"] = BatchScorer(state["aligner"], state["seq"])
+    return state["scorer"]
+
+def _align_score_worker(state : dict, interval : tuple) -> float:
+    """Task of IDS.get_multiple_align_score: sum of alignment scores in input range."""
+    (start, finish), aligner, seq = interval, state["aligner"], state["seq"]
+    if state["scoring"] != 'pairwise':
+        return float(_state_scorer(state).score(state["dna_sequences"][start : finish]).sum())
+    score_sum = 0.
+    for dna_seq in progress(state["dna_sequences"][start : finish], total=(finish - start), desc="Training process"):
+        score_sum += aligner.score(seq, dna_seq)
+    return score_sum
+
+def _align_scores_worker(state : dict, interval : tuple) -> numpy_array:
+    """Task of IDS.get_align_scores: alignment scores of records in input range."""
+    (start, finish), aligner, seq = interval, state["aligner"], state["seq"]
+    if state["scoring"] != 'pairwise':
+        return _state_scorer(state).score(state["dna_sequences"][start : finish])
+    return np.array([ aligner.score(seq, dna_seq) for dna_seq in state["dna_sequences"][start : finish] ], dtype=float)
+
+def _fields_test_worker(state : dict, interval : tuple) -> Metrics:
+    """Task of FieldwiseIDS.test: classify packets in input range field by field."""
+    (start, finish), metrics = interval, Metrics()
+    ids    = state["ids"]
+    fields = { field : batch[start : finish] for field, batch in state["fields"].items() }
+    if not fields or finish <= start:
+        return metrics
+    labels = next(iter(fields.values())).labels
+    metrics.update_batch(ids.classify_fields(fields, metrics), labels == "attack")
+    return metrics
+
+def _test_worker(state : dict, interval : tuple) -> Metrics:
+    """Task of IDS.test: classify each record of test dataset in input range."""
+    (start, finish), metrics = interval, Metrics()
+    ids, test_dataset = state["ids"], state.get("test_dataset")
+    if "test_dna" in state or ids.scoring != 'pairwise' or ids.prefilter is not None or ids.score_cache is not None:
+        if "test_dna" in state:
+            # A view of the shard, nothing is copied
+            test_dna = state["test_dna"][start : finish]
+        else:
+            # Encode the whole shard at once and score it with one call
+            test_dna = ids.encode(type(test_dataset)(test_dataset.iloc[start : finish]), cache=False)
+        if ids.prefilter is not None:
+            test_results, decided, exact = ids.classify_prefiltered(test_dna, metrics)
+            metrics.prefiltered, metrics.short_circuited = len(test_dna), int(decided.sum())
+            if exact is not None:
+                metrics.exact = Metrics.from_arrays(exact, test_dna.labels == "attack")
+        elif ids.scoring != 'pairwise' or ids.score_cache is not None:
+            test_results = ids.classify_batch(test_dna, metrics)
+        else:
+            test_results = [ ids.classify(test_dna_seq) for test_dna_seq in test_dna.records() ]
+        metrics.update_batch(test_results, test_dna.labels == "attack")
+        return metrics
+    for i in progress(range(start, finish), desc="Testing process"):  
+        # Obtain DatasetRecord instance
+        ds_rec = test_dataset.raw_index(i)
+        # Encode it in DNA
+        test_dna_seq = ds_rec.encode_into_DNA(ids.codetable, id=str(i))            
+        # Test it with IdealSequence
+        metrics.update(ids.classify(test_dna_seq), test_dna_seq.name == "attack")
+        
+    return metrics
@@ -0,0 +1,170 @@
+"""
+    Instrumentation of IDS stages: named stage timers, counters and optional cProfile & tracemalloc capture.
+    Everything is off by default, so instrumented code costs a flag check per stage.
+
+        INSTRUMENTS.enable(cprofile=True)
+        with INSTRUMENTS.session():
+            ids.analyze(...)
+        INSTRUMENTS.dump(Path("instrumentation.json"))
+
+    Stages are timed in the calling process. Work of process backend workers is included in the time of
+    the stage which waits for them, but cProfile & tracemalloc see the calling process only
+    (use the 'serial' backend to profile alignment itself). Counters of tasks run in worker processes are
+    collected by the worker and merged into the calling process with results of the tasks (see collect()).
+
+    Progress bars are optional too, see progress().
+"""
+
+import io
+import json
+import pstats
+import cProfile
+import tracemalloc
+
+from time          import perf_counter
+from threading     import Lock
+from contextlib    import contextmanager
+from pathlib       import Path
+from tqdm          import tqdm
+
+# Number of functions / allocation sites in the report
+TOP_ENTRIES = 25
+
+_show_progress = True
+
+def set_progress(enabled : bool) -> None:
+    """Turns tqdm progress bars on or off."""
+    global _show_progress
+    _show_progress = enabled
+
+def progress(iterable, **kwargs):
+    """tqdm(iterable, **kwargs) if progress bars are on, otherwise the iterable itself."""
+    return tqdm(iterable, **kwargs) if _show_progress else iterable
+
+class Instruments:
+    _enabled     = False
+    _cprofile    = False
+    _tracemalloc = False
+
+    enabled = property()
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    @enabled.getter
+    def enabled(self):
+        return self._enabled
+
+    def enable(self, cprofile = False, tracemalloc = False) -> None:
+        self._enabled, self._cprofile, self._tracemalloc = True, cprofile, tracemalloc
+
+    def disable(self) -> None:
+        self._enabled, self._cprofile, self._tracemalloc = False, False, False
+
+    def reset(self) -> None:
+        self._timers, self._counters = {}, {}
+        self._wall, self._profile, self._memory = None, None, None
+
+    @contextmanager
+    def stage(self, name : str):
+        """Adds wall time of the block to the timer of the stage."""
+        if not self._enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            spent = perf_counter() - start
+            with self._lock:
+                seconds, calls = self._timers.get(name, (0., 0))
+                self._timers[name] = (seconds + spent, calls + 1)
+
+    def count(self, name : str, value = 1) -> None:
+        if self._enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def collect(self, enabled : bool):
+        """
+            Counts of the block apart from other counters, the yielded dict gets them when the block ends.
+            A worker process runs a task in it with the flag of the calling process and sends the counts back
+            to merge() them there. Worker processes run one task at a time.
+        """
+        saved, self._counters = self._counters, {}
+        was_enabled, self._enabled = self._enabled, enabled
+        counts = {}
+        try:
+            yield counts
+        finally:
+            counts.update(self._counters)
+            self._counters, self._enabled = saved, was_enabled
+
+    def merge(self, counts : dict) -> None:
+        """Adds counts collected in a worker process."""
+        with self._lock:
+            for name, value in counts.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def session(self):
+        """Measures the whole run and captures cProfile & tracemalloc data if they are enabled."""
+        if not self._enabled:
+            yield
+            return
+        profile = cProfile.Profile() if self._cprofile else None
+        if self._tracemalloc:
+            tracemalloc.start()
+        if profile is not None:
+            profile.enable()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._wall = perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._profile = self._profile_stats(profile)
+            if self._tracemalloc:
+                self._memory = self._memory_stats()
+                tracemalloc.stop()
+
+    @staticmethod
+    def _profile_stats(profile : cProfile.Profile) -> list:
+        stats = pstats.Stats(profile, stream=io.StringIO()).sort_stats("cumulative")
+        top   = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            top.append({ "function"   : f"{filename}:{line}({function})",
+                         "calls"      : calls,
+                         "own, s"     : own,
+                         "cumulative, s" : cumulative })
+        return sorted(top, key=lambda entry: entry["cumulative, s"], reverse=True)[:TOP_ENTRIES]
+
+    @staticmethod
+    def _memory_stats() -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        return { "current, bytes" : current,
+                 "peak, bytes"    : peak,
+                 "top" : [ { "location" : str(stat.traceback), "size, bytes" : stat.size, "count" : stat.count }
+                             for stat in snapshot.statistics("lineno")[:TOP_ENTRIES] ] }
+
+    def as_dict(self) -> dict:
+        report = { "wall, s"  : self._wall,
+                   "stages"   : { name : { "seconds" : seconds, "calls" : calls }
+                                    for name, (seconds, calls) in self._timers.items() },
+                   "counters" : dict(self._counters) }
+        if self._profile is not None:
+            report["cprofile"] = self._profile
+        if self._memory is not None:
+            report["tracemalloc"] = self._memory
+        return report
+
+    def dump(self, path : Path) -> None:
+        with Path(path).open("w") as report_file:
+            json.dump(self.as_dict(), report_file, indent=4)
+
+# Instruments of the current process
+INSTRUMENTS = Instruments()
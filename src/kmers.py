@@ -0,0 +1,182 @@
+"""
+    k-mer sketches of DNA sequences.
+
+    A sketch is the vector of counts of k-mers of a sequence. k-mers are hashed into a fixed number of buckets,
+    so sketches of all sequences have the same size whatever the alphabet is, and similarity of two sequences
+    is the cosine of their sketches: one matrix product for a whole batch. It is much cheaper than alignment
+    and close sequences have close sketches, so sketches are used to pick what is worth aligning.
+"""
+
+import numpy as np
+
+from .datasets.dna_batch     import DNABatch
+
+class KmerSketch:
+    # Sequences sketched in one NumPy pass. Bounds memory usage of k-mer hashes.
+    CHUNK_SIZE = 4096
+
+    # Fibonacci hashing of packed k-mers
+    MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+    _k       = None
+    _buckets = None
+
+    k       = property()
+    buckets = property()
+
+    def __init__(self, k : int = 3, buckets : int = 256):
+        if not 1 <= k <= 8:
+            raise Exception(f"k must be from 1 to 8: {k}")
+        if buckets < 2 or buckets & (buckets - 1):
+            raise Exception(f"Number of buckets must be a power of two: {buckets}")
+        self._k, self._buckets = k, buckets
+
+    @k.getter
+    def k(self):
+        return self._k
+    @buckets.getter
+    def buckets(self):
+        return self._buckets
+
+    def sketch(self, sequences) -> np.ndarray:
+        """
+            Returns (len(sequences), buckets) float32 matrix of L2-normalized k-mer counts.
+            Sequences are a list of str or a DNABatch. Sequences shorter than k have a zero sketch.
+        """
+        if not isinstance(sequences, DNABatch):
+            sequences = DNABatch.from_strings([ str(seq) for seq in sequences ], np.zeros(len(sequences)))
+        result = np.empty((len(sequences), self._buckets), dtype=np.float32)
+        for start in range(0, len(sequences), self.CHUNK_SIZE):
+            result[start : start + self.CHUNK_SIZE] = self._sketch_chunk(sequences[start : start + self.CHUNK_SIZE])
+        return result
+
+    def _sketch_chunk(self, batch : DNABatch) -> np.ndarray:
+        codes, lengths = batch.codes()
+        if batch.alphabet is not None:
+            # Sketches are compared with sketches of str sequences, so they are made of letters
+            codes = np.frombuffer(b'\0' + batch.alphabet.encode('ascii'), dtype=np.uint8)[codes]
+
+        rows, positions = len(batch), max(codes.shape[1] - self._k + 1, 0)
+        counts = np.zeros((rows, self._buckets), dtype=np.float32)
+        if not positions:
+            return counts
+
+        # k-mer starting at j is packed into 8 bits per letter
+        packed = np.zeros((rows, positions), dtype=np.uint64)
+        for t in range(self._k):
+            packed |= codes[:, t : t + positions].astype(np.uint64) << np.uint64(8 * t)
+        shift  = np.uint64(64 - int(np.log2(self._buckets)))
+        bucket = ((packed * self.MULTIPLIER) >> shift).astype(np.int64)
+
+        valid  = np.arange(positions)[None, :] < (lengths - self._k + 1)[:, None]
+        cells  = (np.arange(rows)[:, None] * self._buckets + bucket)[valid]
+        counts = np.bincount(cells, minlength=rows * self._buckets).reshape(rows, self._buckets).astype(np.float32)
+
+        norms  = np.linalg.norm(counts, axis=1, keepdims=True)
+        return np.divide(counts, norms, out=counts, where=norms > 0)
+
+    @staticmethod
+    def similarity(sketches : np.ndarray, others : np.ndarray) -> np.ndarray:
+        """Returns (len(sketches), len(others)) matrix of cosine similarities."""
+        return sketches @ others.T
+
+class KmerPrefilter:
+    """
+        Decides clear cases without alignment. A packet whose k-mer sketch is very similar to the sketch of the
+        ideal sequence is normal, a very dissimilar one is an attack, and only packets in the band between
+        are aligned. Bounds of the band are calibrated on train records (see calibrate()): beyond each bound
+        at most @tolerance of train records have the other exact verdict. Then each bound is moved @margin of similarity
+        further from the other one, as packets which were not trained on (attacks above all) need not follow train records.
+        So @tolerance limits disagreement with exact verdicts on train records only, not the accuracy loss on test packets.
+            @audit - also align decided packets, so Metrics can compare verdicts with the exact ones
+    """
+    _sketch    = None
+    _tolerance = None
+    _margin    = None
+    _audit     = None
+    _ideal     = None
+    _low       = None
+    _high      = None
+
+    sketch    = property()
+    tolerance = property()
+    margin    = property()
+    audit     = property()
+    low       = property()
+    high      = property()
+
+    def __init__(self, k : int = 3, buckets : int = 256, tolerance : float = 0.01, audit = False, low = None, high = None,
+                 margin : float = 0.05):
+        if not 0 <= tolerance < 1:
+            raise Exception(f"Tolerance must be in [0, 1): {tolerance}")
+        if margin < 0:
+            raise Exception(f"Margin must be non-negative: {margin}")
+        self._sketch    = KmerSketch(k, buckets)
+        self._tolerance = tolerance
+        self._margin    = margin
+        self._audit     = audit
+        self._low, self._high = low, high
+
+    @sketch.getter
+    def sketch(self):
+        return self._sketch
+    @tolerance.getter
+    def tolerance(self):
+        return self._tolerance
+    @margin.getter
+    def margin(self):
+        return self._margin
+    @audit.getter
+    def audit(self):
+        return self._audit
+    @low.getter
+    def low(self):
+        """Packets with similarity to the ideal sequence up to this one are attacks."""
+        return self._low
+    @high.getter
+    def high(self):
+        """Packets with similarity to the ideal sequence from this one are normal."""
+        return self._high
+
+    def similarity(self, ideal : str, sequences) -> np.ndarray:
+        """Returns cosine similarity of k-mer sketches of sequences with the sketch of the ideal sequence."""
+        if self._ideal is None or self._ideal[0] != str(ideal):
+            self._ideal = (str(ideal), self._sketch.sketch([ str(ideal) ])[0])
+        return self._sketch.sketch(sequences) @ self._ideal[1]
+
+    def calibrate(self, ideal : str, sequences, attacks : np.ndarray) -> None:
+        """
+            Sets bounds of the band from exact verdicts of train sequences (True - attack) and widens it by the margin.
+            The band is cut only between distinct similarities, a bound which can not be met is infinite.
+        """
+        similarity = self.similarity(ideal, sequences).astype(np.float64)
+        attacks    = np.asarray(attacks, dtype=bool)
+        self._high = self._bound(-similarity, attacks,  self._tolerance)
+        self._low  = self._bound( similarity, ~attacks, self._tolerance)
+        self._high = -self._high
+        if self._low >= self._high:
+            self._low, self._high = -np.inf, np.inf
+        self._low, self._high = self._low - self._margin, self._high + self._margin
+
+    @staticmethod
+    def _bound(values : np.ndarray, wrong : np.ndarray, tolerance : float) -> float:
+        """The largest v such that records with values <= v have at most tolerance of wrong ones (-inf if none)."""
+        order   = np.argsort(values, kind='stable')
+        values, wrong = values[order], wrong[order]
+        # Only the last record of a run of equal values is a valid cut
+        last    = np.append(values[1:] != values[:-1], True)
+        share   = np.cumsum(wrong) / np.arange(1, len(values) + 1)
+        valid   = np.flatnonzero(last & (share <= tolerance))
+        return float(values[valid[-1]]) if len(valid) else -np.inf
+
+    def decide(self, ideal : str, sequences) -> tuple:
+        """Returns (decided, attacks): boolean arrays of packets decided without alignment and their verdicts."""
+        if self._low is None or self._high is None:
+            raise Exception("Prefilter is not calibrated")
+        similarity = self.similarity(ideal, sequences)
+        attacks    = similarity <= self._low
+        return attacks | (similarity >= self._high), attacks
+
+    def as_dict(self) -> dict:
+        return { "k" : self._sketch.k, "buckets" : self._sketch.buckets, "tolerance" : self._tolerance,
+                 "margin" : self._margin, "low" : self._low, "high" : self._high }
@@ -1,21 +1,214 @@
 from .datasets.csv_ds      import CSV_Dataset
 from .datasets.interfaces  import JSON_Codetable
+from .datasets.dna_cache   import DNACache
+from .datasets.csv_cache   import CSVCache
+from .datasets.quantiles   import ExactQuantiles, TDigestQuantiles
 from .utils                import create_shuffled_test_df
-from .ids                  import IDS, Align
+from .ids                  import IDS, MultiSignatureIDS, FieldwiseIDS, IdealSequence, Metrics, Align
+from .kmers                import KmerPrefilter
+from .score_cache          import ScoreCache
+from .stream               import StreamDetector, read_csv_chunks
+from .service              import DetectionService
+from .scores               import score_vector, save_scores, load_scores, calibrate as calibrate_scores
 from pathlib               import Path
+from contextlib            import redirect_stdout
+from time                  import perf_counter
 
-def run( train_ds_path: Path, test_ds_path: Path, codetable_path : Path):
+import sys
+import asyncio
 
-    CODETABLE = JSON_Codetable(codetable_path)          if codetable_path   else None
-    TRAIN_DS  = CSV_Dataset.from_file(train_ds_path)    if train_ds_path    else None
-    TEST_DS   = CSV_Dataset.from_file(test_ds_path)     if test_ds_path     else None
+def run( train_ds_path: Path, test_ds_path: Path, codetable_path : Path, backend = 'thread', scoring = 'pairwise', band = None,
+         dna_cache_path = None, encoding = 'letters', csv_cache_path = None, signatures = 1, candidates = 2,
+         prefilter = None, prefilter_audit = False, score_cache = None, field_weights = None, curves_path = None, field_votes = 0,
+         prefilter_margin = 0.05):
+
+    CSV_CACHE = CSVCache(csv_cache_path) if csv_cache_path else None
+    CODETABLE = JSON_Codetable(codetable_path)                          if codetable_path   else None
+    TRAIN_DS  = CSV_Dataset.from_file(train_ds_path, cache=CSV_CACHE)   if train_ds_path    else None
+    TEST_DS   = CSV_Dataset.from_file(test_ds_path, cache=CSV_CACHE)    if test_ds_path     else None
 
     # By default, a Smith-Waterman alignment if performed
     ALIGNER = IDS.Aligner()
 
     # Create IDS instance with Codetable & Aligner
-    ids = IDS(CODETABLE, ALIGNER)
+    ids = _make_ids(CODETABLE, ALIGNER, scoring, band, encoding, signatures, candidates, field_weights, field_votes)
+    ids.dna_cache = DNACache(dna_cache_path) if dna_cache_path else None
+    ids.prefilter = KmerPrefilter(tolerance=prefilter, audit=prefilter_audit, margin=prefilter_margin) if prefilter is not None else None
+    ids.score_cache = ScoreCache(score_cache) if score_cache else None
     
     mixed_test_ds = CSV_Dataset(create_shuffled_test_df(TEST_DS, TRAIN_DS))
     
-    ids.analyze(TRAIN_DS, mixed_test_ds, sizes=[1]).to_excel("Metrics.xlsx")
\ No newline at end of file
+    ids.analyze(TRAIN_DS, mixed_test_ds, sizes=[1], backend=backend).to_excel("Metrics.xlsx")
+
+    if curves_path is not None:
+        # Test records are aligned once, metrics of every threshold are taken from their scores
+        ids.train(TRAIN_DS, backend=backend)
+        curves = ids.sweep(mixed_test_ds, backend=backend)
+        curves.to_csv(curves_path, index=False)
+        print(f"ROC & PR curves saved to: {curves_path} ({', '.join(f'{name} {area:.4f}' for name, area in Metrics.areas(curves).items())})")
+
+def train( train_ds_path: Path, codetable_path : Path, model_path : Path, algo = 'Smith-Waterman',
+           backend = 'thread', scoring = 'pairwise', band = None, dna_cache_path = None, encoding = 'letters',
+           csv_cache_path = None, signatures = 1, candidates = 2, prefilter = None, field_weights = None,
+           chunk_size = None, median = 'exact', compression = 100, save_scores = False, field_votes = 0, prefilter_margin = 0.05):
+
+    CODETABLE = JSON_Codetable(codetable_path)
+
+    ids = _make_ids(CODETABLE, IDS.Aligner(algo), scoring, band, encoding, signatures, candidates, field_weights, field_votes)
+    ids.dna_cache = DNACache(dna_cache_path) if dna_cache_path else None
+    ids.prefilter = KmerPrefilter(tolerance=prefilter, margin=prefilter_margin) if prefilter is not None else None
+
+    if chunk_size is not None:
+        # The dataset is read twice by chunks: for medians and for the threshold
+        quantiles = TDigestQuantiles(compression) if median == 'tdigest' else ExactQuantiles()
+        ids.train_chunks(lambda: ( chunk.labeled('normal') for chunk in CSV_Dataset.read_chunks(train_ds_path, chunk_size) ),
+                         quantiles, backend=backend)
+    else:
+        # Train records are normal activity, a capture without labels must not lose its last field
+        TRAIN_DS = CSV_Dataset.from_file(train_ds_path, cache=CSVCache(csv_cache_path) if csv_cache_path else None).labeled('normal')
+        ids.train(TRAIN_DS, backend=backend)
+    ids.dump(model_path, scores=save_scores)
+
+    print(f"Model saved to: {model_path} (threshold: {ids.ideal_sequence.threshold})")
+
+def update( model_path : Path, codetable_path : Path, dataset_path : Path, history_path = None, chunk_size = 10000,
+            backend = 'thread', csv_cache_path = None, median_tolerance = 0.):
+
+    CODETABLE = JSON_Codetable(codetable_path)
+    ids = IDS.load(model_path, CODETABLE)
+    # New records are normal activity, as train records are
+    NEW_DS = CSV_Dataset.from_file(dataset_path, cache=CSVCache(csv_cache_path) if csv_cache_path else None).labeled('normal')
+
+    # All train records are read by chunks only if the ideal sequence is changed
+    read_chunks = (lambda: ( chunk.labeled('normal') for chunk in CSV_Dataset.read_chunks(history_path, chunk_size) )) \
+                      if history_path else None
+    previous = ids.ideal_sequence
+    ids.update(NEW_DS, read_chunks, backend=backend, tolerance=median_tolerance)
+    ids.dump(model_path, scores=ids.train_scores is not None)
+
+    print(f"Model updated with {len(NEW_DS)} records: {model_path} ({ids.quantiles.count} train records, " +
+          f"{'the same' if ids.ideal_sequence.seq == previous.seq else 'new'} ideal sequence, threshold: {ids.ideal_sequence.threshold})")
+
+def score( model_path : Path, codetable_path : Path, dataset_path : Path, out_path : Path, label = None,
+           backend = 'thread', csv_cache_path = None):
+
+    CODETABLE = JSON_Codetable(codetable_path)
+    ids = IDS.load(model_path, CODETABLE)
+    DATASET = CSV_Dataset.from_file(dataset_path, cache=CSVCache(csv_cache_path) if csv_cache_path else None)
+
+    # Records without labels are labeled all at once, as create_shuffled_test_df() does it
+    if label is not None:
+        DATASET['label'] = label
+    elif 'label' not in DATASET.columns:
+        raise Exception(f"Dataset has no label column, set the label of all its records: {dataset_path}")
+
+    vector = score_vector(ids.scores(DATASET, backend=backend), DATASET['label'].to_numpy() == 'attack')
+    save_scores(out_path, vector)
+
+    print(f"Scores of {len(vector)} records saved to: {out_path} ({int(vector['attack'].sum())} attacks)")
+
+def calibrate( model_path : Path, method = 'mean', value = None, test_scores_path = None, write = False):
+
+    # Scores of train records are the ones of normal activity
+    if not (model_path / IDS.SCORES_FILE).is_file():
+        raise Exception(f"Model has no scores of train records, train it with --save_scores: {model_path}")
+    TRAIN_SCORES = load_scores(model_path / IDS.SCORES_FILE)
+    TEST_SCORES  = load_scores(test_scores_path) if test_scores_path else None
+
+    start     = perf_counter()
+    threshold = calibrate_scores(TRAIN_SCORES, method, value)
+    spent     = perf_counter() - start
+    print(f"Threshold ({method}{'' if value is None else f' {value}'}): {threshold} " +
+          f"({int((~TRAIN_SCORES['attack']).sum())} normal train records, {spent * 1000:.3f} ms)")
+
+    if TEST_SCORES is not None:
+        Metrics.from_arrays(TEST_SCORES['score'] < threshold, TEST_SCORES['attack']).show()
+
+    if write:
+        # Other files of the model do not depend on the threshold, the calibration is kept for updates
+        IDS.write_threshold(model_path, threshold, { "method" : method, "value" : value })
+        print(f"Threshold saved to: {model_path}")
+
+def detect( model_path: Path, codetable_path : Path, source = '-', output_path = None, chunk_size = 1000, follow = False,
+            scoring = None, band = None, report_every = 10000, score_cache = None):
+
+    # Verdicts may be written to stdout, keep the log apart
+    with redirect_stdout(sys.stderr):
+        CODETABLE = JSON_Codetable(codetable_path)
+        ids = IDS.load(model_path, CODETABLE)
+
+    # Scoring of the model can be overridden, the threshold stays the same
+    if scoring is not None:
+        ids.scoring = scoring
+    if band is not None:
+        ids.band = band
+    ids.score_cache = ScoreCache(score_cache) if score_cache else None
+
+    _detect(ids, source, output_path, chunk_size, follow, report_every)
+
+def stream( ideal_seq_path: Path, codetable_path : Path, source = '-', output_path = None, chunk_size = 1000, follow = False,
+            algo = 'Smith-Waterman', scoring = 'pairwise', band = None, report_every = 10000, score_cache = None):
+
+    # The ideal sequence must be trained with the same aligner
+    with redirect_stdout(sys.stderr):
+        CODETABLE = JSON_Codetable(codetable_path)
+        ids = IDS(CODETABLE, IDS.Aligner(algo), scoring, band)
+
+    ids.ideal_sequence = IdealSequence.load(ideal_seq_path)
+    ids.score_cache = ScoreCache(score_cache) if score_cache else None
+
+    _detect(ids, source, output_path, chunk_size, follow, report_every)
+
+def serve( model_path : Path, codetable_path : Path, host = '127.0.0.1', port = 9999, unix_path = None, batch_size = 256,
+           max_delay = 0.005, queue_size = 4096, workers = 2, report_every = 10., score_cache = None,
+           ideal_seq_path = None, algo = 'Smith-Waterman', scoring = None, band = None):
+
+    # A model or, as 'stream' takes it, an ideal sequence trained with @algo
+    CODETABLE = JSON_Codetable(codetable_path)
+    if model_path is not None:
+        ids = IDS.load(model_path, CODETABLE)
+    else:
+        ids = IDS(CODETABLE, IDS.Aligner(algo))
+        ids.ideal_sequence = IdealSequence.load(ideal_seq_path)
+
+    if scoring is not None:
+        ids.scoring = scoring
+    if band is not None:
+        ids.band = band
+    ids.score_cache = ScoreCache(score_cache) if score_cache else None
+
+    service = DetectionService(ids, batch_size, max_delay, queue_size, workers, report_every)
+    try:
+        asyncio.run(service.serve(host, port, unix_path))
+    except KeyboardInterrupt:
+        pass
+
+def _make_ids(codetable, aligner, scoring, band, encoding, signatures, candidates, field_weights = None, field_votes = 0) -> IDS:
+    """
+        IDS with one ideal sequence, MultiSignatureIDS if more signatures are requested
+        or FieldwiseIDS if field weights are given (an empty dict - all weights are 1).
+    """
+    if field_weights is not None:
+        if signatures > 1:
+            raise Exception("Field-wise alignment is not supported with several signatures")
+        return FieldwiseIDS(codetable, aligner, scoring, band, encoding, weights=field_weights, votes=field_votes)
+    if signatures > 1:
+        return MultiSignatureIDS(codetable, aligner, scoring, band, encoding, clusters=signatures, candidates=candidates)
+    return IDS(codetable, aligner, scoring, band, encoding)
+
+def _detect(ids : IDS, source, output_path, chunk_size, follow, report_every):
+
+    output   = open(output_path, 'w') if output_path else sys.stdout
+    detector = StreamDetector(ids, output, report_every)
+    try:
+        detector.run(read_csv_chunks(source, chunk_size, follow))
+    except KeyboardInterrupt:
+        print(f"Interrupted after {detector.packets} packets", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # Verdicts may be written to stdout, keep the summary apart
+    if detector.metrics.accuracy is not None:
+        with redirect_stdout(sys.stderr):
+            detector.metrics.show()
@@ -0,0 +1,88 @@
+"""
+    Scheduling of alignment work over workers of ExecutionEngine.
+
+    Alignment of a packet costs len(ideal sequence) * len(packet sequence) DP cells and sequences of packets
+    have different lengths (digits of tcp.seq_raw, tcp.options), so ranges of equal numbers of packets take
+    different time and the slowest worker decides the wall time. Schedules:
+        dynamic - packets are cut into contiguous chunks of about equal estimated cost, several chunks per worker,
+                  the most expensive chunks go first and each worker takes the next chunk when it is free
+        static  - one range of equal number of packets per worker
+    The ideal sequence is the same for all packets of a call, so the cost of a packet is estimated by its length.
+"""
+
+import numpy as np
+
+from .datasets.dna_batch     import DNABatch
+
+SCHEDULES = [ 'dynamic', 'static' ]
+
+class Scheduler:
+    _schedule          = None
+    _chunks_per_worker = None
+    _min_chunk         = None
+
+    schedule          = property()
+    chunks_per_worker = property()
+    min_chunk         = property()
+
+    def __init__(self, schedule = 'dynamic', chunks_per_worker = 4, min_chunk = 64):
+        """
+            @chunks_per_worker - chunks of the dynamic schedule per worker (more chunks - finer balance, more overhead)
+            @min_chunk         - the smallest number of packets in a chunk of the dynamic schedule
+        """
+        if schedule not in SCHEDULES:
+            raise Exception(f"Unknown schedule: {schedule}. Use one of {SCHEDULES}")
+        if chunks_per_worker < 1 or min_chunk < 1:
+            raise Exception(f"Chunks per worker & the smallest chunk must be positive: {chunks_per_worker}, {min_chunk}")
+        self._schedule, self._chunks_per_worker, self._min_chunk = schedule, chunks_per_worker, min_chunk
+
+    @schedule.getter
+    def schedule(self):
+        return self._schedule
+    @chunks_per_worker.getter
+    def chunks_per_worker(self):
+        return self._chunks_per_worker
+    @min_chunk.getter
+    def min_chunk(self):
+        return self._min_chunk
+
+    @staticmethod
+    def costs(sequences) -> np.ndarray:
+        """Estimated cost of each sequence: its length for a DNABatch or a list of str, 1 for anything else."""
+        if isinstance(sequences, DNABatch):
+            return np.diff(sequences.offsets).astype(np.float64)
+        if len(sequences) and isinstance(sequences[0], str):
+            return np.array([ len(seq) for seq in sequences ], dtype=np.float64)
+        return np.ones(len(sequences))
+
+    def plan(self, workers : int, costs) -> list:
+        """
+            Returns tasks: (start, finish) ranges of packets (finish is excluded) in the order they are handed out.
+            Ranges cover all packets once.
+                @costs - estimated cost of each packet (see costs()) or the number of packets of equal cost
+        """
+        costs   = np.ones(costs) if isinstance(costs, int) else np.asarray(costs, dtype=np.float64)
+        size    = len(costs)
+        workers = max(1, workers)
+
+        if self._schedule == 'static':
+            bounds = [ (i * size) // workers for i in range(workers + 1) ]
+            return [ (start, finish) for start, finish in zip(bounds[:-1], bounds[1:]) ]
+
+        chunks = max(1, min(workers * self._chunks_per_worker, size // self._min_chunk))
+        # +1 keeps chunks of zero-length sequences from collapsing into one
+        cumulative = np.cumsum(costs + 1)
+        bounds = np.searchsorted(cumulative, cumulative[-1] * np.arange(1, chunks) / chunks, side='right') if size else []
+        bounds = np.unique(np.concatenate([ [ 0 ], bounds, [ size ] ])).astype(int).tolist()
+        tasks  = [ (start, finish) for start, finish in zip(bounds[:-1], bounds[1:]) ]
+        if not tasks:
+            return [ (0, 0) ]
+
+        # Largest first: a big chunk taken last would leave the other workers idle
+        task_costs = [ cumulative[finish - 1] - (cumulative[start - 1] if start else 0.) for start, finish in tasks ]
+        return [ task for _, task in sorted(zip(task_costs, tasks), key=lambda item: -item[0]) ]
+
+    @staticmethod
+    def ordered(tasks : list, results : list) -> list:
+        """Results of tasks in order of packets."""
+        return [ result for _, result in sorted(zip(tasks, results), key=lambda item: item[0][0]) ]
@@ -0,0 +1,104 @@
+"""
+    In-memory LRU cache of alignment scores of packets.
+
+    Flood traffic repeats the same packets (retransmissions, the same flags, window & options) and equal
+    packets are encoded into equal DNA sequences. The cache maps an encoded sequence to its alignment score
+    with the ideal sequence, so each distinct packet is aligned once while it stays in the cache. When the
+    cache holds @capacity entries, the least recently used one is evicted.
+
+    Threads of the worker pool share one cache under a lock. A process pool gets a copy of the cache in each
+    worker process: entries cached before the pool started are shared, new ones stay in the process.
+"""
+
+import threading
+
+from collections     import OrderedDict
+
+class ScoreCache:
+    _capacity = None
+    _entries  = None
+    _lock     = None
+
+    capacity = property()
+    hits     = property()
+    misses   = property()
+    hit_rate = property()
+
+    def __init__(self, capacity : int = 100000):
+        if capacity < 1:
+            raise Exception(f"Capacity of the score cache must be positive: {capacity}")
+        self._capacity = capacity
+        self._entries  = OrderedDict()
+        self._lock     = threading.Lock()
+        self._hits, self._misses = 0, 0
+
+    @capacity.getter
+    def capacity(self):
+        return self._capacity
+    @hits.getter
+    def hits(self):
+        """Packets which were not aligned: cached or repeated in the same lookup."""
+        return self._hits
+    @misses.getter
+    def misses(self):
+        """Packets which were aligned."""
+        return self._misses
+    @hit_rate.getter
+    def hit_rate(self):
+        try:
+            value = self._hits / (self._hits + self._misses)
+        except ZeroDivisionError:
+            value = None
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, keys : list, compute) -> tuple:
+        """
+            Returns (values, hits): values of keys and the number of keys which were not computed.
+            Values of keys which are not cached are computed by compute(positions) once per distinct key
+            (positions are indices of the first occurrence of each such key) and put into the cache.
+            The lock is not held while computing, so workers align their packets in parallel.
+        """
+        values, missing = [ None ] * len(keys), {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values[i] = self._entries[key]
+                else:
+                    missing.setdefault(key, []).append(i)
+            hits = len(keys) - len(missing)
+            self._hits, self._misses = self._hits + hits, self._misses + len(missing)
+
+        if not missing:
+            return values, hits
+
+        computed = compute([ positions[0] for positions in missing.values() ])
+        with self._lock:
+            for (key, positions), value in zip(missing.items(), computed):
+                for i in positions:
+                    values[i] = value
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+        return values, hits
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits, self._misses = 0, 0
+
+    def __getstate__(self):
+        # Locks can not be pickled, a copy in a worker process gets its own lock
+        with self._lock:
+            state = self.__dict__.copy()
+            state["_entries"] = OrderedDict(self._entries)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
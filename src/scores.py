@@ -0,0 +1,57 @@
+"""
+    Per-record alignment scores, so thresholds are chosen & evaluated without aligning records again.
+
+    A score vector is a structured NumPy array with a row per record: its alignment score with the ideal sequence
+    and whether the record is labeled as attack. Vectors are saved as *.npy files: scores of train records next to
+    the model (IDS.dump(scores=True)), scores of test records by 'run.py score'.
+
+    Calibrations of the threshold from scores of normal records (records labeled as attack are left out),
+    a packet is an attack if its score is less:
+        mean       - mean score, as IDS.train() does it for normal train records
+        percentile - @value-th percentile of scores (0 - 100)
+        fpr        - the largest threshold which flags at most @value share (0 - 1) of the records (false positive rate)
+"""
+
+import numpy as np
+
+from pathlib         import Path
+
+SCORES_DTYPE = np.dtype([ ('score', np.float64), ('attack', bool) ])
+
+CALIBRATIONS = [ 'mean', 'percentile', 'fpr' ]
+
+def score_vector(scores, attacks) -> np.ndarray:
+    """Returns a score vector of scores & attack flags of records."""
+    vector = np.empty(len(scores), dtype=SCORES_DTYPE)
+    vector['score'], vector['attack'] = scores, attacks
+    return vector
+
+def save_scores(path : Path, vector : np.ndarray) -> None:
+    np.save(path, vector.astype(SCORES_DTYPE), allow_pickle=False)
+
+def load_scores(path : Path) -> np.ndarray:
+    vector = np.load(path, allow_pickle=False)
+    if vector.dtype != SCORES_DTYPE:
+        raise Exception(f"Not a score vector: {path} ({vector.dtype})")
+    return vector
+
+def calibrate(vector : np.ndarray, method = 'mean', value = None) -> float:
+    """Returns the threshold of @method (see CALIBRATIONS) for scores of normal records of the vector."""
+    scores = np.sort(vector['score'][~vector['attack']])
+    if not len(scores):
+        raise Exception("Score vector has no normal records")
+    if method == 'mean':
+        return float(scores.mean())
+    if value is None:
+        raise Exception(f"Calibration '{method}' needs a value")
+    if method == 'percentile':
+        if not 0 <= value <= 100:
+            raise Exception(f"Percentile must be from 0 to 100: {value}")
+        return float(np.percentile(scores, value))
+    if method == 'fpr':
+        if not 0 <= value <= 1:
+            raise Exception(f"False positive rate must be from 0 to 1: {value}")
+        # Records with scores less than the threshold are flagged, so at most floor(value * n) of them
+        flagged = int(np.floor(value * len(scores)))
+        return float(scores[flagged]) if flagged < len(scores) else float(np.nextafter(scores[-1], np.inf))
+    raise Exception(f"Unknown calibration: {method}. Use one of {CALIBRATIONS}")
@@ -0,0 +1,309 @@
+"""
+    Detection service: packets are received over a local TCP or Unix socket, classified in micro-batches
+    with a trained IDS and verdicts are sent back on the same connection.
+
+    Protocol: one record per line, in either format (a connection may mix them)
+        CSV  - the first CSV line of a connection is a header, each next line is a record.
+               Verdict line: <packet>,<attack|normal>
+        JSON - an object of fields per line, e.g. {"tcp.len": 0, "tcp.flags": "0x0002", ...}.
+               Verdict line: {"packet": <packet>, "verdict": "attack"|"normal"}
+    <packet> is the number of the record in its connection, verdicts are sent in order of records.
+    A record which can not be parsed or classified gets "error" instead of a verdict.
+    Records have the fields of CSV_Dataset.FIELD_TYPES (missed fields are 0, other fields are ignored)
+    and an optional "label", labeled records update metrics of the service.
+
+    Records of all connections go through one bounded queue to the batcher. A micro-batch is closed when it
+    has @batch_size records or when its first record has waited @max_delay seconds, then it is classified
+    on the executor pool. At most @workers batches are classified at once, the next batch is collected
+    when a worker is free, so batches grow with the load. Backpressure: when the queue
+    or the verdicts of a connection are full, the service stops reading from the connection, so a client
+    which sends faster than packets are classified (or does not read its verdicts) is held back by the socket.
+"""
+
+import csv
+import sys
+import json
+import asyncio
+import numpy  as np
+import pandas as pd
+
+from time                    import perf_counter
+from concurrent.futures      import ThreadPoolExecutor
+from .datasets.csv_ds        import CSV_Dataset
+from .ids                    import IDS, Metrics
+from .stream                 import classify_chunk
+from .instrument             import INSTRUMENTS
+
+class LatencyHistogram:
+    """
+        Histogram of latencies with logarithmic buckets: each bucket is GROWTH times wider than the previous one,
+        so percentiles are exact up to (GROWTH - 1) relative error and memory does not grow with the number of samples.
+    """
+    LOWEST = 1e-6
+    GROWTH = 1.02
+    # Buckets from LOWEST to about 1000 seconds
+    BUCKETS = int(np.ceil(np.log(1e9) / np.log(GROWTH))) + 1
+
+    count = property()
+
+    def __init__(self):
+        self._counts = np.zeros(self.BUCKETS, dtype=np.int64)
+
+    @count.getter
+    def count(self):
+        return int(self._counts.sum())
+
+    def add(self, seconds : float) -> None:
+        bucket = int(np.log(max(seconds, self.LOWEST) / self.LOWEST) / np.log(self.GROWTH))
+        self._counts[min(bucket, self.BUCKETS - 1)] += 1
+
+    def percentile(self, p : float) -> float:
+        """Returns upper bound of the bucket with the p-th percentile (p in [0, 100]), None if there are no samples."""
+        total = self._counts.sum()
+        if not total:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self._counts), np.ceil(total * p / 100.)))
+        return self.LOWEST * self.GROWTH ** (min(bucket, self.BUCKETS - 1) + 1)
+
+class _Item:
+    """A record on its way from a connection to the batcher."""
+    __slots__ = ("record", "future", "arrival")
+
+    def __init__(self, record : dict, future : asyncio.Future, arrival : float):
+        self.record, self.future, self.arrival = record, future, arrival
+
+class DetectionService:
+    _ids        = None
+    _batch_size = None
+    _max_delay  = None
+    _workers    = None
+    _queue_size = None
+    _report     = None
+
+    latency    = property()
+    metrics    = property()
+    packets    = property()
+    batches    = property()
+
+    def __init__(self, ids : IDS, batch_size = 256, max_delay = 0.005, queue_size = 4096, workers = 2, report_every = 10.):
+        """
+            @batch_size   - the largest micro-batch
+            @max_delay    - the longest time the first record of a micro-batch waits for other ones (seconds)
+            @queue_size   - capacity of the queue of records & of the verdicts of each connection
+            @workers      - threads which classify micro-batches
+            @report_every - print status to stderr every N seconds (None - do not print)
+        """
+        if ids.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+        if batch_size < 1 or queue_size < 1 or workers < 1:
+            raise Exception(f"Batch size, queue size and workers must be positive: {batch_size}, {queue_size}, {workers}")
+
+        self._ids        = ids
+        self._batch_size = batch_size
+        self._max_delay  = max_delay
+        self._workers    = workers
+        self._queue_size = queue_size
+        self._report     = report_every
+
+        self._latency, self._metrics = LatencyHistogram(), Metrics()
+        self._packets, self._batches, self._started = 0, 0, None
+
+    @latency.getter
+    def latency(self):
+        """Histogram of time from receiving a record to its verdict."""
+        return self._latency
+    @metrics.getter
+    def metrics(self):
+        return self._metrics
+    @packets.getter
+    def packets(self):
+        return self._packets
+    @batches.getter
+    def batches(self):
+        return self._batches
+
+    async def serve(self, host = None, port = None, unix_path = None, ready = None) -> None:
+        """
+            Serves connections on a TCP (@host, @port) or Unix (@unix_path) socket until it is cancelled.
+                @ready - asyncio.Event which is set when the socket accepts connections
+        """
+        self._queue    = asyncio.Queue(self._queue_size)
+        self._slots    = asyncio.Semaphore(self._workers)
+        self._executor = ThreadPoolExecutor(self._workers)
+        self._started  = perf_counter()
+
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=str(unix_path))
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        print(f"Serving on {unix_path or server.sockets[0].getsockname()}", file=sys.stderr)
+
+        tasks = [ asyncio.ensure_future(self._batcher()) ]
+        if self._report:
+            tasks.append(asyncio.ensure_future(self._reporter()))
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._executor.shutdown(wait=True)
+            self._status(final=True)
+
+    async def _handle(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+        loop    = asyncio.get_running_loop()
+        pending = asyncio.Queue(self._queue_size)
+        respond = asyncio.ensure_future(self._respond(pending, writer))
+        header, packet = None, 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8', errors='replace').strip()
+                if not line:
+                    continue
+                json_format = line.startswith('{')
+                if not json_format and header is None:
+                    header = next(csv.reader([ line ]))
+                    continue
+
+                future = loop.create_future()
+                try:
+                    record = self._parse_json(line) if json_format else self._parse_csv(header, line)
+                except (ValueError, TypeError) as error:
+                    future.set_exception(error)
+                    record = None
+
+                # Both queues are bounded: if verdicts are not read or batches are not classified in time,
+                # reading stops here and the client is held back by the socket
+                await pending.put((packet, json_format, future))
+                if record is not None:
+                    await self._queue.put(_Item(record, future, loop.time()))
+                packet += 1
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await respond
+            writer.close()
+
+    async def _respond(self, pending : asyncio.Queue, writer : asyncio.StreamWriter) -> None:
+        while True:
+            entry = await pending.get()
+            if entry is None:
+                break
+            packet, json_format, future = entry
+            try:
+                verdict = 'attack' if await future else 'normal'
+            except Exception:
+                verdict = 'error'
+            line = json.dumps({ "packet" : packet, "verdict" : verdict }) if json_format else f"{packet},{verdict}"
+            try:
+                writer.write((line + '\n').encode())
+                # Waits only while the socket buffer is full: a client which does not read blocks its connection only
+                await writer.drain()
+            except ConnectionError:
+                # Verdicts of a closed connection are dropped, the records are still classified
+                continue
+
+    @staticmethod
+    def _parse_csv(header : list, line : str) -> dict:
+        values = next(csv.reader([ line ]))
+        if len(values) != len(header):
+            raise ValueError(f"Record has {len(values)} values, header has {len(header)}")
+        return DetectionService._checked({ field : (value if value != '' else None) for field, value in zip(header, values) })
+
+    @staticmethod
+    def _parse_json(line : str) -> dict:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("JSON record must be an object")
+        return DetectionService._checked(record)
+
+    @staticmethod
+    def _checked(record : dict) -> dict:
+        """Checks values of numeric fields, so a bad record does not fail the whole micro-batch."""
+        for field in CSV_Dataset.FIELD_TYPES:
+            value = record.get(field)
+            if value is not None and field not in CSV_Dataset.HEX_FIELDS:
+                float(value)
+            elif value is not None and not isinstance(value, str):
+                raise ValueError(f"Hex field must be a string: {field}")
+        return record
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # A batch is collected only when a worker is free: meanwhile records wait in the queue,
+            # so under load batches grow and the fixed cost of a batch is paid less often
+            await self._slots.acquire()
+            items    = [ await self._queue.get() ]
+            deadline = items[0].arrival + self._max_delay
+            while len(items) < self._batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.ensure_future(self._classify(items))
+
+    async def _classify(self, items : list) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            verdicts, labels = await loop.run_in_executor(self._executor, self._classify_records,
+                                                          [ item.record for item in items ])
+        except Exception as error:
+            for item in items:
+                item.future.set_exception(error)
+            return
+        finally:
+            self._slots.release()
+
+        now = loop.time()
+        for item, verdict in zip(items, verdicts):
+            if not item.future.done():
+                item.future.set_result(verdict)
+            self._latency.add(now - item.arrival)
+        labels  = np.asarray(labels, dtype=str)
+        labeled = (labels == 'attack') | (labels == 'normal')
+        self._metrics.update_batch(np.asarray(verdicts, dtype=bool)[labeled], labels[labeled] == 'attack')
+        self._packets += len(items)
+        self._batches += 1
+
+    def _classify_records(self, records : list) -> tuple:
+        """Executor task: builds a dataset of records with the fields of CSV_Dataset and classifies it."""
+        fields = list(CSV_Dataset.FIELD_TYPES)
+        df     = pd.DataFrame.from_records([ { field : record.get(field) for field in fields + [ 'label' ] } for record in records ],
+                                           columns=fields + [ 'label' ])
+        df['label'] = df['label'].fillna('unknown').astype(str)
+        # Values of CSV records are strings, as read_csv() without types would give them
+        numeric = [ field for field in fields if field not in CSV_Dataset.HEX_FIELDS ]
+        for field in numeric:
+            df[field] = pd.to_numeric(df[field])
+        INSTRUMENTS.count("service.records", len(records))
+        return classify_chunk(self._ids, CSV_Dataset.from_frame(df))
+
+    async def _reporter(self) -> None:
+        while True:
+            await asyncio.sleep(self._report)
+            self._status()
+
+    def _status(self, final = False) -> None:
+        spent  = perf_counter() - self._started if self._started else 0.
+        status = f"{'Total' if final else 'Processed'}: {self._packets} packets in {self._batches} batches, " + \
+                 f"{self._packets / spent if spent else 0.:.0f} packets/s"
+        if self._latency.count:
+            status += f", latency p50 {self._latency.percentile(50) * 1e3:.2f} ms, p99 {self._latency.percentile(99) * 1e3:.2f} ms"
+        if self._metrics.accuracy is not None:
+            status += f", accuracy {self._metrics.accuracy:.4f}"
+        print(status, file=sys.stderr)
@@ -0,0 +1,86 @@
+"""
+    State of ExecutionEngine workers in shared memory (the 'shared' backend).
+
+    Arrays of the state (DNABatch buffers, offsets, labels & ids, other NumPy arrays, also inside dicts of the state)
+    are copied into multiprocessing.shared_memory blocks once by share(), the state keeps only their descriptors
+    (SharedArray: name, dtype & shape of a block). Worker processes get the small state of descriptors and attach()
+    maps the blocks back into arrays, so sequences are never pickled for workers, whatever the start method is.
+    Workers only read the arrays. Blocks are released by release() of the process which created them.
+"""
+
+import numpy as np
+
+from multiprocessing         import shared_memory
+from .datasets.dna_batch     import DNABatch
+
+class SharedArray:
+    """Picklable descriptor of a NumPy array in a shared memory block."""
+    def __init__(self, name : str, dtype, shape : tuple):
+        self.name, self.dtype, self.shape = name, np.dtype(dtype), shape
+
+    def attach(self, blocks : list) -> np.ndarray:
+        block = shared_memory.SharedMemory(name=self.name)
+        # The block must live as long as arrays on it
+        blocks.append(block)
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+
+class SharedBatch:
+    """Picklable descriptor of a DNABatch with arrays in shared memory."""
+    def __init__(self, buffer : SharedArray, offsets : SharedArray, labels : SharedArray, ids, alphabet : str):
+        self.buffer, self.offsets, self.labels, self.ids, self.alphabet = buffer, offsets, labels, ids, alphabet
+
+    def attach(self, blocks : list) -> DNABatch:
+        ids = self.ids.attach(blocks) if isinstance(self.ids, SharedArray) else self.ids
+        return DNABatch(self.buffer.attach(blocks), self.offsets.attach(blocks), self.labels.attach(blocks), ids, self.alphabet)
+
+def share_array(array : np.ndarray, blocks : list):
+    """Copies the array into a new block, returns its SharedArray. Arrays of Python objects can not be shared, they are kept."""
+    if array.dtype.hasobject:
+        return array
+    # A block can not be empty
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    blocks.append(block)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return SharedArray(block.name, array.dtype, array.shape)
+
+def share(state : dict) -> tuple:
+    """Returns (state with arrays replaced by descriptors, created blocks)."""
+    blocks = []
+
+    def shared(value):
+        if isinstance(value, DNABatch):
+            # A view of a batch may start in the middle of the buffer, only its own bytes are shared
+            return SharedBatch(share_array(value.buffer, blocks), share_array(value.offsets - value.offsets[0], blocks),
+                               share_array(value.labels, blocks), share_array(value.ids, blocks), value.alphabet)
+        if isinstance(value, np.ndarray):
+            return share_array(value, blocks)
+        if isinstance(value, dict):
+            return { key : shared(item) for key, item in value.items() }
+        return value
+
+    try:
+        return { key : shared(value) for key, value in state.items() }, blocks
+    except BaseException:
+        release(blocks, unlink=True)
+        raise
+
+def attach(state : dict) -> tuple:
+    """Returns (state with descriptors mapped back into arrays, attached blocks)."""
+    blocks = []
+
+    def attached(value):
+        if isinstance(value, (SharedArray, SharedBatch)):
+            return value.attach(blocks)
+        if isinstance(value, dict):
+            return { key : attached(item) for key, item in value.items() }
+        return value
+
+    return { key : attached(value) for key, value in state.items() }, blocks
+
+def release(blocks : list, unlink = False) -> None:
+    """Closes blocks, the process which created them also unlinks them."""
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+    blocks.clear()
@@ -0,0 +1,177 @@
+"""
+    Streaming detection: packets are read from a CSV stream (file, stdin or a file which is
+    still being written) in chunks, encoded into DNA and classified with a trained ideal sequence.
+    Only one chunk is kept in memory at a time.
+"""
+
+import io
+import sys
+import numpy  as np
+import pandas as pd
+
+from time                    import perf_counter, sleep
+from .datasets.csv_ds        import CSV_Dataset
+from .ids                    import IDS, FieldwiseIDS, Metrics
+from .instrument             import INSTRUMENTS
+
+# Columns which are read as strings, they are parsed from hex later
+HEX_COLUMNS = { 'tcp.flags' : str, 'tcp.options' : str }
+
+def read_csv_chunks(source, chunk_size : int, follow = False, poll_interval = 0.5):
+    """
+        Yields CSV_Dataset chunks of at most @chunk_size records.
+            @source - path to *.csv file or '-' for stdin. The first line is a header.
+            @follow - keep waiting for new records at the end of file (like 'tail -f').
+                      Records read so far are flushed as a chunk each time the end is reached.
+    """
+    handle = sys.stdin if str(source) == '-' else open(source, 'r')
+    try:
+        header, lines, partial = handle.readline(), [], ''
+        if not header:
+            return
+        while True:
+            line = handle.readline()
+            if line:
+                # Writer of a followed file may not have finished the line yet
+                if not line.endswith('\n') and follow:
+                    partial += line
+                    continue
+                line, partial = partial + line, ''
+                if line.strip():
+                    lines.append(line)
+                if len(lines) < chunk_size:
+                    continue
+            if lines:
+                yield _parse_lines(header, lines)
+                lines = []
+            elif not line:
+                if not follow:
+                    break
+                sleep(poll_interval)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def _parse_lines(header : str, lines : list) -> CSV_Dataset:
+    with INSTRUMENTS.stage("load.read_csv"):
+        df = pd.read_csv(io.StringIO(header + ''.join(lines)), dtype=HEX_COLUMNS)
+    # The last column of a dataset is the label, it is not encoded
+    if 'label' not in df.columns:
+        df['label'] = 'unknown'
+    return CSV_Dataset.from_frame(df)
+
+def classify_chunk(ids : IDS, chunk : CSV_Dataset) -> tuple:
+    """Encodes & classifies a chunk of packets. Returns (verdicts, labels): lists of bool (True - attack) and str."""
+    if isinstance(ids, FieldwiseIDS):
+        fields = ids.encode_fields(chunk)
+        with INSTRUMENTS.stage("classify"):
+            verdicts = [ bool(verdict) for verdict in ids.classify_fields(fields) ]
+        return verdicts, (next(iter(fields.values())).labels.tolist() if fields else [])
+
+    # Encoded as IDS.test() does it: with the encoding of the model and its DNA cache
+    dna_seqs = ids.encode(chunk)
+    with INSTRUMENTS.stage("classify"):
+        if ids.scoring == 'pairwise' and ids.score_cache is None and ids.prefilter is None:
+            verdicts = [ ids.classify(dna_seq) for dna_seq in dna_seqs.records() ]
+        else:
+            verdicts = [ bool(verdict) for verdict in ids.classify_batch(dna_seqs) ]
+    return verdicts, dna_seqs.labels.tolist()
+
+class StreamDetector:
+    """
+        Classifies chunks of packets with trained IDS and writes per-packet verdicts.
+        Metrics are updated for records which are labeled as 'attack' or 'normal'.
+    """
+    _ids      = None
+    _output   = None
+    _report   = None
+
+    metrics             = property()
+    packets             = property()
+    packets_per_sec     = property()
+    classified_per_sec  = property()
+
+    def __init__(self, ids : IDS, output = None, report_every = 10000):
+        """
+            @output       - text stream for verdicts in CSV format (None - do not write verdicts)
+            @report_every - print status (throughput & rolling metrics) each time this many packets are processed
+        """
+        if ids.ideal_sequence is None:
+            raise Exception("Ideal sequence is None")
+
+        self._ids     = ids
+        self._output  = output
+        self._report  = report_every
+
+        self._metrics, self._window = Metrics(), Metrics()
+        self._packets, self._spent  = 0, 0.
+        # Start of the stream, wall time from it includes reading & parsing of chunks and writing of verdicts
+        self._start = None
+
+    @metrics.getter
+    def metrics(self):
+        return self._metrics
+    @packets.getter
+    def packets(self):
+        return self._packets
+    @packets_per_sec.getter
+    def packets_per_sec(self):
+        """Sustained throughput: packets per second of wall time since the stream was started."""
+        wall = perf_counter() - self._start if self._start is not None else 0.
+        return self._packets / wall if wall else 0.
+    @classified_per_sec.getter
+    def classified_per_sec(self):
+        """Packets per second of encoding & classification only."""
+        return self._packets / self._spent if self._spent else 0.
+
+    def run(self, chunks) -> Metrics:
+        """Processes all chunks of the stream and returns metrics of labeled records."""
+        self._start = perf_counter()
+        for chunk in chunks:
+            self.process(chunk)
+        self._status(final=True)
+        return self._metrics
+
+    def process(self, chunk : CSV_Dataset) -> list:
+        """Classifies one chunk, returns list of verdicts (True - attack)."""
+        start = perf_counter()
+        if self._start is None:
+            self._start = start
+        verdicts, labels = classify_chunk(self._ids, chunk)
+        self._spent += perf_counter() - start
+        INSTRUMENTS.count("classify.packets", len(verdicts))
+
+        labels  = np.asarray(labels, dtype=str)
+        labeled = (labels == 'attack') | (labels == 'normal')
+        if labeled.any():
+            for metrics in (self._metrics, self._window):
+                metrics.update_batch(np.asarray(verdicts, dtype=bool)[labeled], labels[labeled] == 'attack')
+
+        if self._output is not None:
+            pd.DataFrame({ "packet"  : range(self._packets, self._packets + len(verdicts)),
+                           "verdict" : [ 'attack' if verdict else 'normal' for verdict in verdicts ],
+                           "label"   : labels }) \
+              .to_csv(self._output, header=(self._packets == 0), index=False)
+            self._output.flush()
+
+        reported_before = self._packets // self._report
+        self._packets  += len(verdicts)
+        if self._packets // self._report > reported_before:
+            self._status()
+            self._window = Metrics()
+
+        return verdicts
+
+    def _status(self, final = False):
+        """Prints throughput and metrics to stderr, verdicts may be written to stdout."""
+        metrics = self._metrics if final else self._window
+        status  = f"{'Total' if final else 'Processed'}: {self._packets} packets, {self.packets_per_sec:.0f} packets/s " + \
+                  f"({self.classified_per_sec:.0f} packets/s of classification)"
+        if metrics.accuracy is not None:
+            status += f", accuracy {metrics.accuracy:.4f}"
+            if not final:
+                status += " (last window)"
+        cache = self._ids.field_cache if isinstance(self._ids, FieldwiseIDS) else self._ids.score_cache
+        if cache is not None and cache.hit_rate is not None:
+            status += f", score cache hit rate {cache.hit_rate:.4f}"
+        print(status, file=sys.stderr)
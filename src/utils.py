@@ -8,7 +8,7 @@ def shuffle_df(df : pd.DataFrame) -> pd.DataFrame:
 def create_shuffled_test_df(only_attack_df : pd.DataFrame, only_norm_df : pd.DataFrame) -> pd.DataFrame:
     only_attack_df['label'] = 'attack'
     only_norm_df['label']   = 'normal'
-    test_ds = only_attack_df.append(only_norm_df)
+    test_ds = pd.concat([only_attack_df, only_norm_df])
     return shuffle_df(test_ds)
 
 def normalize_df(df, columns, scalar = StandardScaler()):